@@ -1,58 +1,185 @@
+import inspect
+import json
 import sys
+import threading
 from canvas import utils
-from canvas.utils.rest import CANVAS_REST
+from canvas.utils.models import Entity
+from canvas.utils.rest import CANVAS_REST, IllegalArgumentError
+from canvas.utils.setup import check_setup, run_setup
+
+
+CRUD_COMMANDS = ["get", "create", "update", "delete"]
+SETUP_PROMPT = "You are not setup would you like to setup now?"
 
 
 def get_argparser():
     import argparse
-    
-    parser = argparse.ArgumentParser()
+
+    parser = argparse.ArgumentParser(
+        prog="canvas",
+        description="Results are written to stdout as NDJSON, one object per line.")
     parser.add_argument("--access-token",
-                        help="Access Token from Canvas Settings (default %(default)s)")
+                        help="Access Token from Canvas Settings (default: ~/.canvas credentials)")
+    parser.add_argument("--base-url",
+                        help="https://<prefix>.instructure.com/api/ (default: ~/.canvas config)")
+    parser.add_argument("--id", action="append", default=[],
+                        help="id for the resource (course id for assignments, folder id for files...), can be repeated")
+    parser.add_argument("--stdin", action="store_true",
+                        help="read ids from stdin, one per line, for batch runs")
+    parser.add_argument("--data",
+                        help="json object with the body for create/update")
+    parser.add_argument("--concurrency", type=int, default=4,
+                        help="ids run at the same time in batch runs (default %(default)s)")
     parser.add_argument("command",
-                        help="Main command to be run")
+                        help="Main command to be run", choices=sorted(get_commands()))
+    parser.add_argument("action", nargs="?", default="get", choices=CRUD_COMMANDS,
+                        help="(default %(default)s)")
     return parser.parse_args()
 
 def get_commands():
-    CRUD_COMMANDS = ["get", "create", "update", "delete"]
+    """
+    resource -> { action: (CANVAS_REST method, name of the id parameter or None, passes --data as `data`) }
+    when the data flag is False, --data is passed as keyword arguments instead.
+    """
     return {
-        "self": ["get"],
-        "settings": ["get", "update"],
-        "profile": ["get"], 
-        "courses": ["get"], 
-        "planner": [""], 
-        "notes": [], 
-        "calendar": [],
-        "todos": [],
-        "notifications": [],
-        "inbox": [],
-        "assignments": [],
-        "colors": [],
-        "nickname": [],
-        "files": [],
-        "folders": []
-
+        "self": {
+            "get": ("get_self", None, False),
+            "update": ("update_self", None, True)},
+        "settings": {
+            "get": ("get_settings", "course_id", False),
+            "update": ("update_settings", None, True)},
+        "profile": {
+            "get": ("get_profile", None, False),
+            "update": ("update_profile", None, True)},
+        "courses": {
+            "get": ("get_courses", None, False)},
+        "planner": {
+            "get": ("get_planner_items", None, False)},
+        "notes": {
+            "get": ("get_planner_notes", None, False),
+            "update": ("update_planner_notes", "note_id", True),
+            "delete": ("delete_planner_notes", "note_id", False)},
+        "overrides": {
+            "get": ("get_planner_overrides", None, False),
+            "create": ("create_planner_overrides", None, True),
+            "update": ("update_planner_overrides", "override_id", True),
+            "delete": ("delete_planner_overrides", "override_id", False)},
+        "calendar": {
+            "get": ("get_calendar_events", None, False),
+            "delete": ("delete_calendar_events", "calendar_event_id", False)},
+        "upcoming": {
+            "get": ("get_upcoming_events", "course_id", False)},
+        "todos": {
+            "get": ("get_todos", "course_id", False)},
+        "notifications": {
+            "get": ("get_notifications", "course_id", False),
+            "delete": ("delete_notifications", "notification_id", False)},
+        "inbox": {
+            "get": ("get_inbox", "conversation_id", False),
+            "create": ("create_conversation", None, False)},
+        "assignments": {
+            "get": ("get_assignments", "course_id", False),
+            # --data '{"course_id": 1, "assignment_id": 2, "data": {"due_at": "..."}}'
+            "update": ("update_assignment", None, False)},
+        "colors": {
+            "get": ("get_colors", None, False),
+            "update": ("update_colors", "course_id", False)},
+        "nickname": {
+            "get": ("get_course_nicknames", "course_id", False)},
+        "files": {
+            "get": ("get_files", "folder_id", False)},
+        "folders": {
+            "get": ("get_folders", "folder_id", False)},
+        "course_folders": {
+            "get": ("get_course_folders", "course_id", False)},
     }
 
-if __name__ == "__main__":
-    CRUD_COMMANDS = ["get", "create", "update", "delete"]
 
-    client = CANVAS_REST()
+def to_json_lines(result):
+    """ Yields one json-able object per result element, generators are consumed as pages arrive """
+    if result is None:
+        return
+    if isinstance(result, (Entity, dict, str, int, float, bool)):
+        result = [result]
+    for el in result:
+        yield el._raw if isinstance(el, Entity) else el
+
+
+class NDJSONWriter:
+    """ Writes whole lines under a lock so concurrent workers never interleave """
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._lock = threading.Lock()
+
+    def write(self, obj):
+        line = json.dumps(obj, default=str)
+        with self._lock:
+            self._stream.write(line + "\n")
+            self._stream.flush()
+
 
-    method_prefix = "get"
-    if len(sys.argv) > 2 and sys.argv[2] in CRUD_COMMANDS:
-        method_prefix = sys.argv[2]
+def run_command(client: CANVAS_REST, command: str, action: str, ids: list, data: dict=None, concurrency: int=4,
+                out=None, err=None) -> int:
+    """ Runs the command once per id (or once without an id), returns the number of failures """
+    out, err = out or sys.stdout, err or sys.stderr
+    commands = get_commands()
+    if action not in commands[command]:
+        raise IllegalArgumentError(f"'{command}' supports: {', '.join(commands[command])}")
 
-    # resp = None
-    # exec(f"resp = client.{method_prefix}_{sys.argv[1]}()")
-    
-    # print(resp)
+    method_name, id_param, takes_data = commands[command][action]
+    method = getattr(client, method_name)
+    kwargs = {}
+    if data is not None:
+        kwargs = {"data": data} if takes_data else dict(data)
+    if "stream" in inspect.signature(method).parameters:
+        kwargs["stream"] = True
 
-    course_id = "457389"
-    folder_id = "LectureSlides"
-    folders = client.get_course_folders(course_id=course_id, folder_id=folder_id)
-    print(folders)
+    if ids and id_param is None:
+        raise IllegalArgumentError(f"'{command} {action}' doesn't take an id")
 
-    for folder in folders:
+    writer, errors = NDJSONWriter(out), NDJSONWriter(err)
 
-        folder.download()
\ No newline at end of file
+    def run_one(item_id):
+        call_kwargs = dict(kwargs)
+        if item_id is not None:
+            call_kwargs[id_param] = item_id
+        for obj in to_json_lines(method(**call_kwargs)):
+            writer.write(obj)
+
+    failures = 0
+    for item_id, _, error in utils.map_concurrently(run_one, ids or [None], max_workers=concurrency):
+        if error is not None:
+            failures += 1
+            errors.write({"id": item_id, "error": str(error)})
+    return failures
+
+
+def main() -> int:
+    args = get_argparser()
+
+    ids = list(args.id)
+    if args.stdin:
+        ids += [line.strip() for line in sys.stdin if line.strip()]
+
+    # first run: offer the setup, unless everything comes from the flags or nobody is there to answer
+    interactive = sys.stdin.isatty() and not args.stdin
+    if interactive and not (args.access_token and args.base_url) and not check_setup() \
+            and utils.prompt(SETUP_PROMPT):
+        run_setup()
+
+    client = CANVAS_REST(access_token=args.access_token, base_url=args.base_url)
+    with client:
+        try:
+            failures = run_command(
+                client, args.command, args.action, ids,
+                data=json.loads(args.data) if args.data else None,
+                concurrency=args.concurrency)
+        except IllegalArgumentError as e:
+            print(e, file=sys.stderr)
+            return 2
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,213 @@
+""" Local stub server for the tests """
+# A threaded http server on 127.0.0.1 that hands every request to a
+# function, and a client pointed at it. The client only accepts https urls,
+# stub_client lifts that for the plain http stub while it's in use.
+# serve_h2c is the same over cleartext HTTP/2, for HTTP2Transport(http1=False).
+# It needs the optional h2 package (requirements-http2.txt).
+#
+#   with serve(lambda request: (200, {}, {'id': 1})) as base_url, stub_client(base_url) as api:
+#       api.get_self()
+import contextlib
+import http.server
+import json
+import socket
+import sys
+import threading
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, NamedTuple, Tuple
+from unittest import mock
+
+from requests.structures import CaseInsensitiveDict
+
+
+class StubRequest(NamedTuple):
+    method: str
+    path: str
+    query: Dict[str, list]
+    headers: Dict[str, str]
+    body: bytes
+
+
+# request -> (status, headers, body), body is json encoded unless it's bytes
+Handler = Callable[[StubRequest], Tuple[int, Dict[str, str], object]]
+
+
+def _handler_class(handle: Handler):
+
+    class StubHandler(http.server.BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def _respond(self):
+            parsed = urllib.parse.urlparse(self.path)
+            length = int(self.headers.get('Content-Length') or 0)
+            request = StubRequest(
+                self.command, parsed.path, urllib.parse.parse_qs(parsed.query),
+                CaseInsensitiveDict(self.headers.items()), self.rfile.read(length) if length else b'')
+            status, headers, body = _encode(*handle(request))
+
+            self.send_response(status)
+            for key, val in headers.items():
+                self.send_header(key, val)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        do_GET = do_POST = do_PUT = do_DELETE = _respond
+
+        def log_message(self, *args):
+            pass
+
+    return StubHandler
+
+
+class _Server(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # clients that gave up (timeouts, deadlines) are expected, anything else is printed
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+@contextlib.contextmanager
+def serve(handle: Handler) -> Iterator[str]:
+    """ Runs the stub for the block, yields its base url ('http://127.0.0.1:port/api/') """
+    server = _Server(('127.0.0.1', 0), _handler_class(handle))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}/api/"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def _encode(status: int, headers: Dict[str, str], body) -> Tuple[int, Dict[str, str], bytes]:
+    if not isinstance(body, bytes):
+        body = json.dumps(body).encode()
+        headers = {'Content-Type': 'application/json', **headers}
+    return status, headers, body
+
+
+class _H2Connection:
+    """ One HTTP/2 connection, requests are handled on the pool and their responses multiplexed back """
+
+    def __init__(self, sock: socket.socket, handle: Handler, pool: ThreadPoolExecutor):
+        import h2.config
+        import h2.connection
+
+        self.sock = sock
+        self.handle = handle
+        self.pool = pool
+        self.conn = h2.connection.H2Connection(h2.config.H2Configuration(client_side=False, header_encoding='utf-8'))
+        self.lock = threading.Lock()
+        self.requests: Dict[int, list] = {}
+        self.pending: Dict[int, bytes] = {}
+
+    def run(self):
+        import h2.events
+
+        with self.lock:
+            self.conn.initiate_connection()
+            self.sock.sendall(self.conn.data_to_send())
+        while True:
+            try:
+                data = self.sock.recv(65535)
+            except OSError:
+                return
+            if not data:
+                return
+            with self.lock:
+                for event in self.conn.receive_data(data):
+                    if isinstance(event, h2.events.RequestReceived):
+                        self.requests[event.stream_id] = [dict(event.headers), bytearray()]
+                    elif isinstance(event, h2.events.DataReceived):
+                        self.requests[event.stream_id][1] += event.data
+                        self.conn.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+                    elif isinstance(event, h2.events.StreamEnded):
+                        headers, body = self.requests.pop(event.stream_id)
+                        self.pool.submit(self.respond, event.stream_id, headers, bytes(body))
+                    elif isinstance(event, h2.events.StreamReset):
+                        self.pending.pop(event.stream_id, None)
+                    elif isinstance(event, h2.events.ConnectionTerminated):
+                        return
+                self.flush()
+
+    def respond(self, stream_id: int, headers: Dict[str, str], body: bytes):
+        parsed = urllib.parse.urlparse(headers[':path'])
+        request = StubRequest(
+            headers[':method'], parsed.path, urllib.parse.parse_qs(parsed.query),
+            CaseInsensitiveDict({key: val for key, val in headers.items() if not key.startswith(':')}), body)
+        status, response_headers, response_body = _encode(*self.handle(request))
+        with self.lock:
+            self.conn.send_headers(stream_id, [
+                (':status', str(status)),
+                ('content-length', str(len(response_body))),
+                *((key.lower(), val) for key, val in response_headers.items())])
+            self.pending[stream_id] = response_body
+            self.flush()
+
+    def flush(self):
+        """ Sends what the flow control windows allow, the rest waits for WINDOW_UPDATE """
+        import h2.exceptions
+
+        for stream_id, body in list(self.pending.items()):
+            try:
+                while body:
+                    size = min(self.conn.local_flow_control_window(stream_id), self.conn.max_outbound_frame_size, len(body))
+                    if size <= 0:
+                        break
+                    self.conn.send_data(stream_id, body[:size])
+                    body = body[size:]
+                if body:
+                    self.pending[stream_id] = body
+                    continue
+                self.conn.end_stream(stream_id)
+            except h2.exceptions.StreamClosedError:
+                pass
+            del self.pending[stream_id]
+        try:
+            self.sock.sendall(self.conn.data_to_send())
+        except OSError:
+            pass
+
+
+@contextlib.contextmanager
+def serve_h2c(handle: Handler, max_workers: int=32) -> Iterator[str]:
+    """ Like serve, over HTTP/2 without TLS (prior knowledge), yields its base url """
+    listener = socket.create_server(('127.0.0.1', 0))
+    pool = ThreadPoolExecutor(max_workers=max_workers)
+    connections = []
+
+    def accept():
+        while True:
+            try:
+                sock, _ = listener.accept()
+            except OSError:
+                return
+            connections.append(sock)
+            threading.Thread(target=_H2Connection(sock, handle, pool).run, daemon=True).start()
+
+    threading.Thread(target=accept, daemon=True).start()
+    try:
+        yield f"http://127.0.0.1:{listener.getsockname()[1]}/api/"
+    finally:
+        listener.close()
+        for sock in connections:
+            sock.close()
+        pool.shutdown(wait=False)
+
+
+@contextlib.contextmanager
+def stub_client(base_url: str, **kwargs):
+    """ A CANVAS_REST for the stub at base_url, closed after the block """
+    from canvas.utils import rest
+
+    with mock.patch.object(rest, 'URL', str):
+        api = rest.CANVAS_REST(access_token=kwargs.pop('access_token', 'token'),
+                               base_url=base_url, api_version='v1', **kwargs)
+        try:
+            yield api
+        finally:
+            api.close()
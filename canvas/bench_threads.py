@@ -0,0 +1,51 @@
+""" Thread scaling benchmark against the local stub server """
+# python -m canvas.bench_threads [--calls 400] [--latency 0.005] [--threads 1 2 4 8 16]
+#
+# One CANVAS_REST shared by a growing number of threads, each get_self call
+# checked for the right path and token. The stub waits a fixed latency per
+# request, so with per-thread sessions the throughput should grow about
+# linearly with the threads until the machine (not the client) is the limit.
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from canvas.__stub__ import serve, stub_client
+
+
+def user(latency: float):
+    def handle(request):
+        time.sleep(latency)
+        return 200, {}, {'id': 1, 'name': "Stub User", 'path': request.path,
+                         'auth': request.headers.get('Authorization')}
+    return handle
+
+
+def throughput(base_url: str, threads: int, calls: int) -> float:
+    """ get_self calls per second with threads sharing one client """
+    with stub_client(base_url, access_token="bench", coalesce_gets=False) as api:
+        api.get_self()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(threads) as pool:
+            users = list(pool.map(lambda _: api.get_self(), range(calls)))
+        elapsed = time.perf_counter() - started
+    assert all(u._raw['path'] == "/api/v1/users/self" and u._raw['auth'] == "Bearer bench" for u in users)
+    return calls / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=400)
+    parser.add_argument("--latency", type=float, default=0.005, help="seconds the stub waits per request")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    args = parser.parse_args()
+
+    with serve(user(args.latency)) as base_url:
+        baseline = None
+        for threads in args.threads:
+            rate = throughput(base_url, threads, args.calls)
+            baseline = baseline or rate
+            print(f"{threads:3d} threads {rate:8.0f} req/s   x{rate / baseline:.1f}")
+
+
+if __name__ == '__main__':
+    main()
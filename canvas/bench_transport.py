@@ -0,0 +1,71 @@
+""" Transport benchmark against the local stub servers """
+# python -m canvas.bench_transport [--calls 400] [--threads 16] [--latency 0.02]
+#
+# Runs the same get_assignments workload (100 assignment pages) through the
+# default per-thread Session and each transport, and prints throughput and
+# bytes on the wire. The stub adds a fixed latency per request, so the
+# numbers show what connection reuse, multiplexing and compression change,
+# not how fast Canvas is.
+import argparse
+import importlib.util
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from canvas.__stub__ import serve, serve_h2c, stub_client
+from canvas.test_transport import canvas
+from canvas.utils.transport import HTTP2Transport, SessionTransport
+
+
+def run(name: str, base_url: str, transport, calls: int, threads: int) -> dict:
+    with stub_client(base_url, transport=transport, coalesce_gets=False) as api:
+        # warm up the connections
+        api.get_assignments(1)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(threads) as pool:
+            sizes = set(pool.map(lambda _: len(api.get_assignments(1)), range(calls)))
+        elapsed = time.perf_counter() - started
+        assert sizes == {100}
+        stats = api.transport_stats or {}
+    if hasattr(transport, 'close'):
+        transport.close()
+    return {
+        "transport": name,
+        "req/s": round(calls / elapsed),
+        "wire KB": round(stats['wire_bytes'] / 1024) if stats else None,
+        "decoded KB": round(stats['decoded_bytes'] / 1024) if stats else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=400)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds the stub waits per request")
+    args = parser.parse_args()
+
+    def slow(request):
+        time.sleep(args.latency)
+        return canvas(request)
+
+    http2 = all(importlib.util.find_spec(name) is not None for name in ("httpx", "h2"))
+    results = []
+    with serve(slow) as base_url:
+        results.append(run("Session (default)", base_url, None, args.calls, args.threads))
+        results.append(run("SessionTransport identity", base_url, SessionTransport(compress=False), args.calls, args.threads))
+        results.append(run("SessionTransport gzip", base_url, SessionTransport(), args.calls, args.threads))
+        if http2:
+            results.append(run("HTTP2Transport HTTP/1.1", base_url, HTTP2Transport(http2=False), args.calls, args.threads))
+    if http2:
+        with serve_h2c(slow) as base_url:
+            results.append(run("HTTP2Transport HTTP/2", base_url, HTTP2Transport(http1=False), args.calls, args.threads))
+    else:
+        print("httpx / h2 aren't installed, HTTP2Transport is left out (pip install -r requirements-http2.txt)")
+
+    for result in results:
+        print(f"{result['transport']:28s} {result['req/s']:6d} req/s   "
+              f"wire {result['wire KB'] if result['wire KB'] is not None else '-':>6} KB   "
+              f"decoded {result['decoded KB'] if result['decoded KB'] is not None else '-':>6} KB")
+
+
+if __name__ == '__main__':
+    main()
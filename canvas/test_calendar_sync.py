@@ -0,0 +1,100 @@
+""" sync_calendar_events against a local stub calendar """
+# python -m pytest canvas/test_calendar_sync.py, or python -m canvas.test_calendar_sync
+import datetime
+import itertools
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+
+from canvas.__stub__ import serve, stub_client
+
+
+START = datetime.datetime(2026, 10, 1)
+END = START + datetime.timedelta(days=30)
+
+
+class Calendar:
+    """ The calendar_events endpoints over a dict, strip_comments behaves like a sanitizer dropping html comments """
+
+    def __init__(self, strip_comments: bool=False):
+        self.strip_comments = strip_comments
+        self.events = {1: {'id': 1, 'title': "made by hand", 'description': "mine", 'start_at': '2026-10-02T00:00:00Z'}}
+        self.ids = itertools.count(100)
+        self.clock = itertools.count()
+        self.writes = []
+        self.lock = threading.Lock()
+
+    def written(self, event: dict) -> dict:
+        if self.strip_comments and event.get('description'):
+            event['description'] = "<p>" + re.sub(r'<!--.*?-->', '', event['description']) + "</p>"
+        event['updated_at'] = f"2026-01-01T00:00:{next(self.clock):02d}Z"
+        return event
+
+    def __call__(self, request):
+        with self.lock:
+            if request.method == 'GET':
+                return 200, {}, list(self.events.values())
+            self.writes.append(request.method)
+            event_id = int(request.path.rsplit('/', 1)[-1]) if request.path[-1].isdigit() else None
+            if request.method == 'POST':
+                event = self.written({**json.loads(request.body)['calendar_event'], 'id': next(self.ids)})
+                self.events[event['id']] = event
+                return 200, {}, event
+            if request.method == 'PUT':
+                self.events[event_id].update(json.loads(request.body)['calendar_event'])
+                return 200, {}, self.written(self.events[event_id])
+            return 200, {}, self.events.pop(event_id)
+
+
+def desired(count: int) -> list:
+    return [{'sync_key': f"lecture-{idx}", 'title': f"Lecture {idx}", 'description': "<b>Room 4</b>",
+             'start_at': (START + datetime.timedelta(days=idx)).strftime('%Y-%m-%dT%H:%M:%S.000Z')}
+            for idx in range(count)]
+
+
+def actions(report) -> dict:
+    assert all(item.ok for item in report)
+    return {action: sum(item.action == action for item in report) for action in ("create", "update", "delete", "skip")}
+
+
+def run_sync(strip_comments: bool, state):
+    calendar = Calendar(strip_comments)
+    with serve(calendar) as base_url, stub_client(base_url) as api:
+        def sync(events):
+            calendar.writes.clear()
+            return actions(api.sync_calendar_events("course_1", events, START, END, state=state))
+
+        events = desired(5)
+        assert sync(events) == {"create": 5, "update": 0, "delete": 0, "skip": 0}
+        # nothing changed, nothing is written
+        assert sync(events) == {"create": 0, "update": 0, "delete": 0, "skip": 5}
+        assert calendar.writes == []
+
+        events[3]['title'] = "Lecture 3 (moved)"
+        del events[4]
+        assert sync(events) == {"create": 0, "update": 1, "delete": 1, "skip": 3}
+        assert sorted(calendar.writes) == ['DELETE', 'PUT']
+        assert sync(events) == {"create": 0, "update": 0, "delete": 0, "skip": 4}
+
+    assert calendar.events[1]['title'] == "made by hand"
+    assert sorted(event['title'] for event in calendar.events.values() if event['id'] != 1) == \
+        ["Lecture 0", "Lecture 1", "Lecture 2", "Lecture 3 (moved)"]
+
+
+def test_sync_create_skip_delete():
+    run_sync(strip_comments=False, state=None)
+
+
+def test_sync_state_survives_sanitized_descriptions():
+    with tempfile.TemporaryDirectory() as tmp:
+        run_sync(strip_comments=True, state=os.path.join(tmp, "calendar_sync.json"))
+
+
+if __name__ == '__main__':
+    for test in (test_sync_create_skip_delete, test_sync_state_survives_sanitized_descriptions):
+        started = time.perf_counter()
+        test()
+        print(f"{test.__name__}: ok ({time.perf_counter() - started:.2f}s)")
@@ -0,0 +1,93 @@
+""" Record a workload against the local stub server, replay it offline """
+# python -m pytest canvas/test_cassette.py, or python -m canvas.test_cassette
+import json
+import os
+import tempfile
+import time
+
+from canvas.__stub__ import serve, stub_client
+from canvas.utils.cassette import Cassette, ReplayTransport
+from canvas.utils.models import File
+from canvas.utils.store import BlobStore
+
+
+FEED = (
+    "BEGIN:VCALENDAR\r\n"
+    "BEGIN:VEVENT\r\n"
+    "UID:event-calendar-event-7\r\n"
+    "SUMMARY:Midterm\r\n"
+    "DTSTART:20211020T140000Z\r\n"
+    "DESCRIPTION:" + "A" * 62 + "\r\n " + "B" * 40 + "\r\n"
+    "END:VEVENT\r\n"
+    "END:VCALENDAR\r\n"
+).encode()
+
+VIEW = {
+    "participants": [{"id": 1, "display_name": "Ann"}],
+    "unread_entries": [11],
+    "view": [{"id": 10, "user_id": 1, "message": "first", "updated_at": "2021-10-01T00:00:00Z",
+              "replies": [{"id": 11, "user_id": 1, "message": "reply", "updated_at": "2021-10-02T00:00:00Z"}]}],
+    "new_entries": [],
+}
+
+BLOB = bytes(range(256)) * 64
+
+
+def canvas(request):
+    if request.path == "/api/v1/courses":
+        page = int(request.query.get('page', ['1'])[0])
+        headers = {}
+        if page < 3:
+            headers['Link'] = f'<http://{request.headers["Host"]}/api/v1/courses?page={page + 1}>; rel="next"'
+        return 200, headers, [{'id': page, 'name': f"course {page}"}]
+    if request.path == "/feeds/course_1.ics":
+        return 200, {'Content-Type': 'text/calendar', 'ETag': '"v1"'}, FEED
+    if request.path.endswith("/view"):
+        return 200, {}, json.dumps(VIEW).encode()
+    if request.path == "/files/5/download":
+        return 200, {'Content-Type': 'application/octet-stream'}, BLOB
+    return 404, {}, {'errors': [{'message': 'not found'}]}
+
+
+def workload(api, base_url: str, out_dir: str) -> dict:
+    feed_url = base_url.replace("/api/", "/feeds/course_1.ics")
+    file = File(raw={'id': 5, 'uuid': 'u5', 'filename': 'blob.bin',
+                     'url': base_url.replace("/api/", "/files/5/download")}, client=api)
+    file.download(os.path.join(out_dir, "files"), store=BlobStore(os.path.join(out_dir, "store")))
+
+    view = api.get_discussion_view(1, 2)
+    with open(os.path.join(out_dir, "files", "blob.bin"), 'rb') as f:
+        blob = f.read()
+    return {
+        "courses": [course.id for course in api.get_courses(stream=True)],
+        "feed": [(event.title, event.description, event._raw['start_at']) for event in api.get_calendar_feed(feed_url)],
+        "view": [(entry.id, entry.depth, entry.message, entry.unread) for entry in view.walk()],
+        "blob": blob == BLOB,
+    }
+
+
+def test_record_replay_round_trip():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "run.jsonl.gz")
+        with serve(canvas) as base_url:
+            with Cassette(path) as cassette, stub_client(base_url, recorder=cassette) as api:
+                recorded = workload(api, base_url, os.path.join(tmp, "recorded"))
+
+        assert recorded["courses"] == [1, 2, 3]
+        assert recorded["feed"] == [("Midterm", "A" * 62 + "B" * 40, "2021-10-20T14:00:00Z")]
+        assert recorded["view"] == [(10, 0, "first", False), (11, 1, "reply", True)]
+        assert recorded["blob"]
+
+        # the stub is gone, everything comes from the cassette
+        transport = ReplayTransport(Cassette.load(path))
+        with stub_client(base_url, transport=transport) as api:
+            replayed = workload(api, base_url, os.path.join(tmp, "replayed"))
+        assert replayed == recorded
+        assert transport.missing == 0
+        assert transport.served == len(Cassette.load(path).entries)
+
+
+if __name__ == '__main__':
+    started = time.perf_counter()
+    test_record_replay_round_trip()
+    print(f"test_record_replay_round_trip: ok ({time.perf_counter() - started:.2f}s)")
@@ -0,0 +1,44 @@
+""" The command line (canvas.__main__) against the local stub server """
+# python -m pytest canvas/test_cli.py, or python -m canvas.test_cli
+import io
+import json
+import time
+
+from canvas.__main__ import run_command
+from canvas.__stub__ import serve, stub_client
+
+
+def canvas(request):
+    if request.path == "/api/v1/conversations/":
+        return 200, {}, [{'id': 1, 'subject': "first"}, {'id': 2, 'subject': "second"}]
+    if request.path.startswith("/api/v1/conversations/"):
+        conversation_id = int(request.path.rsplit("/", 1)[1])
+        if conversation_id == 404:
+            return 404, {}, {'errors': [{'message': 'The specified resource does not exist.'}]}
+        return 200, {}, {'id': conversation_id, 'subject': f"conversation {conversation_id}"}
+    return 404, {}, {'errors': [{'message': 'not found'}]}
+
+
+def run(api, *args, **kwargs):
+    out, err = io.StringIO(), io.StringIO()
+    failures = run_command(api, *args, out=out, err=err, **kwargs)
+    return failures, [json.loads(line) for line in out.getvalue().splitlines()], \
+        [json.loads(line) for line in err.getvalue().splitlines()]
+
+
+def test_inbox_by_id_is_one_line_per_conversation():
+    with serve(canvas) as base_url, stub_client(base_url) as api:
+        failures, lines, errors = run(api, "inbox", "get", [])
+        assert (failures, [line['id'] for line in lines], errors) == (0, [1, 2], [])
+
+        failures, lines, errors = run(api, "inbox", "get", ["7", "404", "8"], concurrency=1)
+    assert failures == 1
+    assert lines == [{'id': 7, 'subject': "conversation 7"}, {'id': 8, 'subject': "conversation 8"}]
+    assert [error['id'] for error in errors] == ["404"]
+
+
+if __name__ == '__main__':
+    for test in (test_inbox_by_id_is_one_line_per_conversation,):
+        started = time.perf_counter()
+        test()
+        print(f"{test.__name__}: ok ({time.perf_counter() - started:.2f}s)")
@@ -0,0 +1,94 @@
+""" DeadlineIndex: merging sources and querying by due date """
+# python -m pytest canvas/test_deadlines.py, or python -m canvas.test_deadlines
+import datetime
+import time
+
+from canvas.utils.deadlines import DeadlineIndex
+
+
+UTC = datetime.timezone.utc
+
+TODOS = [
+    {'type': 'submitting', 'html_url': "https://canvas.test/courses/1/assignments/10",
+     'assignment': {'id': 10, 'name': "Lab 1", 'due_at': "2021-09-10T03:59:59Z", 'course_id': 1}},
+]
+PLANNER_ITEMS = [
+    {'plannable_type': 'assignment', 'plannable_id': 10, 'course_id': 1, 'plannable_date': "2021-09-10T03:59:59Z",
+     'plannable': {'title': "Lab 1", 'due_at': "2021-09-10T03:59:59Z"}, 'submissions': {'submitted': False}},
+    {'plannable_type': 'quiz', 'plannable_id': 5, 'course_id': 2, 'plannable_date': "2021-09-12T12:00:00-04:00",
+     'plannable': {'title': "Quiz 1", 'assignment_id': 11, 'due_at': "2021-09-12T12:00:00-04:00"}},
+    {'plannable_type': 'assignment', 'plannable_id': 12, 'course_id': 1, 'plannable_date': "2021-09-11T00:00:00Z",
+     'plannable': {'title': "Done already", 'due_at': "2021-09-11T00:00:00Z"},
+     'planner_override': {'marked_complete': True}},
+]
+UPCOMING = [
+    {'type': 'event', 'id': 7, 'title': "Midterm", 'start_at': "2021-09-11T14:00:00", 'context_code': "course_2"},
+]
+
+
+def index() -> DeadlineIndex:
+    deadlines = DeadlineIndex()
+    deadlines.ingest(TODOS)
+    deadlines.ingest(PLANNER_ITEMS)
+    deadlines.ingest(UPCOMING)
+    return deadlines
+
+
+def test_sources_merge_in_due_order():
+    deadlines = index()
+    assert [d.key for d in deadlines.next(10, after=datetime.datetime(2021, 9, 1, tzinfo=UTC))] == \
+        [('assignment', 10), ('calendar_event', 7), ('assignment', 11)]
+    lab = deadlines.get(('assignment', 10))
+    assert lab.sources == {'todo', 'planner'} and lab.course_id == 1
+    # a naive timestamp from Canvas is UTC
+    assert deadlines.get(('calendar_event', 7)).due_at == datetime.datetime(2021, 9, 11, 14, tzinfo=UTC)
+    assert ('assignment', 12) not in deadlines
+
+
+def test_naive_datetimes_are_utc():
+    deadlines = index()
+    naive = datetime.datetime(2021, 9, 11, 13, 59)
+    aware = naive.replace(tzinfo=UTC)
+    assert deadlines.next(10, after=naive) == deadlines.next(10, after=aware)
+    assert [d.key for d in deadlines.next(10, after=naive)] == [('calendar_event', 7), ('assignment', 11)]
+    # another zone is compared as the same instant
+    eastern = datetime.timezone(datetime.timedelta(hours=-4))
+    assert deadlines.next(1, after=datetime.datetime(2021, 9, 11, 10, 1, tzinfo=eastern))[0].key == ('assignment', 11)
+
+    assert [d.key for d in deadlines.range(datetime.datetime(2021, 9, 10), datetime.datetime(2021, 9, 12))] == \
+        [('assignment', 10), ('calendar_event', 7)]
+    assert deadlines.range(datetime.datetime(2021, 9, 10), datetime.datetime(2021, 9, 12, tzinfo=UTC)) == \
+        deadlines.range(datetime.datetime(2021, 9, 10, tzinfo=UTC), datetime.datetime(2021, 9, 12, tzinfo=UTC))
+
+    deadlines.add(('planner_note', 1), datetime.datetime(2021, 9, 10, 12), 'planner', title="Note")
+    assert deadlines.next(1, after=datetime.datetime(2021, 9, 10, 11, tzinfo=UTC))[0].key == ('planner_note', 1)
+
+
+def test_not_a_datetime():
+    try:
+        index().next(after=datetime.date(2021, 9, 1))
+    except TypeError as e:
+        assert "datetime" in str(e)
+    else:
+        raise AssertionError("a date was compared with the due datetimes")
+
+
+def test_course_filter_and_updates():
+    deadlines = index()
+    after = datetime.datetime(2021, 9, 1)
+    assert [d.key for d in deadlines.next(10, after=after, course_id=2)] == [('calendar_event', 7), ('assignment', 11)]
+    # the due date moved, the deadline moves with it and keeps what the other sources said
+    deadlines.ingest([{**TODOS[0], 'assignment': {**TODOS[0]['assignment'], 'due_at': "2021-09-13T00:00:00Z"}}])
+    assert deadlines.next(10, after=after)[-1].key == ('assignment', 10)
+    assert deadlines.get(('assignment', 10)).sources == {'todo', 'planner'}
+    # marked complete in the planner drops it
+    deadlines.ingest([{**PLANNER_ITEMS[0], 'planner_override': {'marked_complete': True}}])
+    assert ('assignment', 10) not in deadlines and len(deadlines) == 2
+
+
+if __name__ == '__main__':
+    for test in (test_sources_merge_in_due_order, test_naive_datetimes_are_utc, test_not_a_datetime,
+                 test_course_filter_and_updates):
+        started = time.perf_counter()
+        test()
+        print(f"{test.__name__}: ok ({time.perf_counter() - started:.2f}s)")
@@ -0,0 +1,81 @@
+""" Incremental parsing of discussion views (canvas.utils.discussions.iter_members) """
+# python -m pytest canvas/test_discussions.py, or python -m canvas.test_discussions
+import json
+import time
+
+from canvas.utils.discussions import decode_chunks, iter_members
+
+
+PAYLOAD = (
+    '{"unread_entries": [5, 7], "forced_entries": [], "x": 1500.0, "score": -2.5E-3, "big": 1e+21,'
+    ' "participants": [{"id": 1, "display_name": "Zoë"}, {"id": 2, "display_name": "中文"}],'
+    ' "view": [{"id": 10, "user_id": 1, "message": "<p>a, b: {c}</p>", "rating_sum": null,'
+    ' "replies": [{"id": 11, "user_id": 2, "message": "\\"quoted\\"", "deleted": true}]},'
+    ' {"id": 12, "user_id": 2, "message": "", "rating_count": 0}],'
+    ' "new_entries": [], "n": 7 }'
+)
+
+
+def expected(split=()):
+    members = []
+    for key, value in json.loads(PAYLOAD).items():
+        if key in split:
+            members.extend((key, element) for element in value)
+        else:
+            members.append((key, value))
+    return members
+
+
+def test_every_chunk_boundary():
+    for split in ((), ("view", "participants")):
+        for offset in range(len(PAYLOAD) + 1):
+            chunks = [PAYLOAD[:offset], PAYLOAD[offset:]]
+            assert list(iter_members(chunks, split=split)) == expected(split), (split, offset, chunks)
+
+
+def test_split_number_members():
+    # the number is complete on its own ('1500'), the '.' and 'e' say it isn't
+    assert list(iter_members(['{"x": 1500.', '0}'])) == [("x", 1500.0)]
+    assert list(iter_members(['{"x": 15e', '+2, "y": -', '1}'])) == [("x", 1500.0), ("y", -1)]
+    assert list(iter_members(['{"x": [1.', '5, 2]}'], split=["x"])) == [("x", 1.5), ("x", 2)]
+    try:
+        list(iter_members(['{"x": 1500.', '}']))
+    except json.JSONDecodeError:
+        pass
+    else:
+        raise AssertionError("'1500.' isn't a number")
+
+
+def test_one_character_at_a_time():
+    assert list(iter_members(PAYLOAD)) == expected()
+    encoded = PAYLOAD.encode('utf-8')
+    byte_chunks = (encoded[idx:idx + 1] for idx in range(len(encoded)))
+    assert list(iter_members(decode_chunks(byte_chunks), split=["view"])) == expected(["view"])
+
+
+def test_large_value_in_many_chunks():
+    message = "x" * 2_000_000
+    payload = json.dumps({"view": [{"id": 1, "message": message}], "n": 1})
+    chunks = (payload[idx:idx + 16] for idx in range(0, len(payload), 16))
+    started = time.perf_counter()
+    members = list(iter_members(chunks, split=["view"]))
+    # copying the buffer per chunk takes ~10s here, joining the chunks once they're needed well under a second
+    assert time.perf_counter() - started < 3
+    assert members == [("view", {"id": 1, "message": message}), ("n", 1)]
+
+
+def test_truncated_payload_fails():
+    for payload in ('{"a": 1', '{"a": [1, 2', '{"a": "b'):
+        try:
+            list(iter_members([payload]))
+        except json.JSONDecodeError:
+            continue
+        raise AssertionError(f"{payload!r} was accepted")
+
+
+if __name__ == '__main__':
+    for test in (test_every_chunk_boundary, test_split_number_members, test_one_character_at_a_time,
+                 test_large_value_in_many_chunks, test_truncated_payload_fails):
+        started = time.perf_counter()
+        test()
+        print(f"{test.__name__}: ok ({time.perf_counter() - started:.2f}s)")
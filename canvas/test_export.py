@@ -0,0 +1,86 @@
+""" ExportRunner against the local stub server: checkpoints, resumes and configuration """
+# python -m pytest canvas/test_export.py, or python -m canvas.test_export
+import json
+import os
+import tempfile
+import time
+from unittest import mock
+
+from canvas.__stub__ import serve, stub_client
+from canvas.utils.export import ExportRunner
+
+
+def canvas(requests):
+    def handle(request):
+        requests.append(request.path)
+        parts = request.path.split("/")
+        if parts[-1] == "assignments":
+            course_id = int(parts[-2])
+            return 200, {}, [{'id': course_id * 10 + idx, 'name': f"Assignment {idx}", 'course_id': course_id}
+                             for idx in range(2)]
+        if parts[-1] == "calendar_events":
+            course_id = int(request.query['context_codes[]'][0][len("course_"):])
+            return 200, {}, [{'id': course_id * 100, 'title': "Midterm", 'context_code': f"course_{course_id}"}]
+        return 404, {}, {'errors': [{'message': 'not found'}]}
+    return handle
+
+
+def exported(path: str) -> list:
+    with open(path) as f:
+        return sorted((line['course_id'], line['section'], line['data']['id']) for line in map(json.loads, f))
+
+
+def test_resume_with_other_sections():
+    requests = []
+    with serve(canvas(requests)) as base_url, stub_client(base_url), tempfile.TemporaryDirectory() as tmp:
+        def runner(sections):
+            return ExportRunner(tmp, tokens=["token"], base_url=base_url, api_version="v1",
+                                course_ids=[1, 2], sections=sections, processes=2)
+
+        report = runner(["assignments"]).run()
+        assert sorted(report["completed"]) == ["t0-c1", "t0-c2"] and not report["failed"]
+        assert exported(report["export"]) == [(1, 'assignments', 10), (1, 'assignments', 11),
+                                              (2, 'assignments', 20), (2, 'assignments', 21)]
+
+        # the checkpoints are for assignments only: a run that also wants the calendar redoes both shards
+        report = runner(["assignments", "calendar"]).run()
+        assert sorted(report["completed"]) == ["t0-c1", "t0-c2"] and report["skipped"] == []
+        assert exported(report["export"]) == [(1, 'assignments', 10), (1, 'assignments', 11), (1, 'calendar', 100),
+                                              (2, 'assignments', 20), (2, 'assignments', 21), (2, 'calendar', 200)]
+        with open(os.path.join(tmp, "shards", "t0-c1.done")) as f:
+            assert json.load(f) == {"name": "t0-c1", "sections": ["assignments", "calendar"],
+                                    "counts": {"assignments": 2, "calendar": 1}}
+
+        # same sections again: nothing to do
+        del requests[:]
+        report = runner(["assignments", "calendar"]).run()
+        assert report["completed"] == [] and report["skipped"] == ["t0-c1", "t0-c2"] and requests == []
+
+        # fewer sections don't keep the ones that were dropped
+        os.remove(os.path.join(tmp, "shards", "t0-c2.done"))
+        report = runner(["calendar"]).run()
+        assert sorted(report["completed"]) == ["t0-c1", "t0-c2"]
+        assert exported(report["export"]) == [(1, 'calendar', 100), (2, 'calendar', 200)]
+        with open(os.path.join(tmp, "plan.json")) as f:
+            assert json.load(f)["sections"] == ["calendar"]
+
+
+def test_missing_configuration_fails_up_front():
+    with tempfile.TemporaryDirectory() as tmp, \
+            mock.patch('canvas.utils.get_base_url', return_value=None), \
+            mock.patch('canvas.utils.get_access_token', return_value=None):
+        for kwargs, message in (({'tokens': ["token"]}, "base_url"),
+                                ({'base_url': "https://school.instructure.com/api/"}, "access token")):
+            try:
+                ExportRunner(tmp, api_version="v1", course_ids=[1], **kwargs)
+            except ValueError as e:
+                assert message in str(e), e
+            else:
+                raise AssertionError(f"{kwargs} was accepted")
+
+
+if __name__ == '__main__':
+    for test in (test_resume_with_other_sections, test_missing_configuration_fails_up_front):
+        started = time.perf_counter()
+        test()
+        print(f"{test.__name__}: ok ({time.perf_counter() - started:.2f}s)")
@@ -0,0 +1,74 @@
+""" by_path lookups and the folder index against the local stub server """
+# python -m pytest canvas/test_folders.py, or python -m canvas.test_folders
+import time
+import urllib.parse
+
+from canvas.__stub__ import serve, stub_client
+
+
+FOLDERS = {
+    '': {'id': 1, 'full_name': "course files", 'parent_folder_id': None},
+    'Assignments': {'id': 2, 'full_name': "course files/Assignments", 'parent_folder_id': 1},
+    'Assignments/Week 1': {'id': 3, 'full_name': "course files/Assignments/Week 1", 'parent_folder_id': 2},
+    'Lectures': {'id': 4, 'full_name': "course files/Lectures", 'parent_folder_id': 1},
+}
+
+
+def canvas(requests):
+    def handle(request):
+        requests.append(request.path)
+        path = urllib.parse.unquote(request.path.partition("/folders/by_path")[2]).strip("/")
+        parts = path.split("/") if path else []
+        chain = [FOLDERS["/".join(parts[:idx])] for idx in range(len(parts) + 1)]
+        return 200, {}, [{**raw, 'updated_at': '2021-09-01T00:00:00Z'} for raw in chain]
+    return handle
+
+
+def test_by_path_is_cached():
+    requests = []
+    with serve(canvas(requests)) as base_url, stub_client(base_url) as api:
+        first = api.get_course_files_by_path(7, "/Assignments/Week 1")
+        assert [raw['id'] for raw in first] == [1, 2, 3]
+        # the same path and its parents come from the index
+        assert api.get_course_files_by_path(7, "/Assignments/Week 1") == first
+        assert [raw['id'] for raw in api.get_course_files_by_path(7, "/Assignments")] == [1, 2]
+        assert api.resolve_folder("Assignments/Week 1", course_id=7).id == 3
+        assert len(requests) == 1
+
+        # use_cache=False always asks
+        api.get_course_files_by_path(7, "/Assignments", use_cache=False)
+        assert len(requests) == 2
+        # other courses have their own index
+        api.get_course_files_by_path(8, "/Assignments")
+        assert len(requests) == 3
+
+
+def test_invalidate_and_expire():
+    requests = []
+    with serve(canvas(requests)) as base_url, stub_client(base_url, folder_max_age=0.2) as api:
+        api.get_course_files_by_path(7, "/Assignments/Week 1")
+        api.get_course_files_by_path(7, "/Lectures")
+        assert len(requests) == 2
+
+        # dropping Assignments drops Week 1 with it, Lectures stays
+        api.invalidate_folders(7, "Assignments")
+        api.get_course_files_by_path(7, "/Lectures")
+        assert len(requests) == 2
+        api.get_course_files_by_path(7, "/Assignments/Week 1")
+        assert len(requests) == 3
+
+        api.invalidate_folders(7)
+        api.get_course_files_by_path(7, "/Lectures")
+        assert len(requests) == 4
+
+        # nothing is trusted for longer than folder_max_age
+        time.sleep(0.3)
+        api.get_course_files_by_path(7, "/Lectures")
+        assert len(requests) == 5
+
+
+if __name__ == '__main__':
+    for test in (test_by_path_is_cached, test_invalidate_and_expire):
+        started = time.perf_counter()
+        test()
+        print(f"{test.__name__}: ok ({time.perf_counter() - started:.2f}s)")
@@ -0,0 +1,87 @@
+""" iCalendar feeds: unfolding, conditional GETs and the feed cache """
+# python -m pytest canvas/test_ics.py, or python -m canvas.test_ics
+import os
+import tempfile
+import time
+
+from canvas.__stub__ import serve, stub_client
+from canvas.utils.ics import unfold_lines
+from canvas.utils.models import Course
+from canvas.utils.ratelimit import SharedRateBudget
+
+
+FEED = (
+    b"BEGIN:VCALENDAR\r\n"
+    b"BEGIN:VEVENT\r\n"
+    b"UID:event-calendar-event-7\r\n"
+    b"SUMMARY:Midterm\r\n"
+    b"DTSTART:20211020T140000Z\r\n"
+    b"END:VEVENT\r\n"
+    b"END:VCALENDAR\r\n"
+)
+
+
+def test_unfold_split_crlf():
+    # iter_lines yields '' when a chunk ends between \r and \n
+    lines = ["DESCRIPTION:" + "A" * 62 + "\r", "", " " + "B" * 10, "SUMMARY:x"]
+    assert list(unfold_lines(lines)) == ["DESCRIPTION:" + "A" * 62 + "B" * 10, "SUMMARY:x"]
+
+
+class Feeds:
+    """ /feeds/<name>.ics with an ETag, 304 when it matches, 503 for the first `unavailable` requests """
+
+    def __init__(self, unavailable: int=0):
+        self.unavailable = unavailable
+        self.requests = []
+
+    def __call__(self, request):
+        self.requests.append((request.path, request.headers.get('If-None-Match')))
+        if request.path == "/feeds/broken.ics":
+            return 404, {}, b"not found"
+        if self.unavailable:
+            self.unavailable -= 1
+            return 503, {'Retry-After': '0'}, b""
+        if request.headers.get('If-None-Match') == '"v1"':
+            return 304, {'ETag': '"v1"'}, b""
+        return 200, {'Content-Type': 'text/calendar', 'ETag': '"v1"'}, FEED
+
+
+def test_conditional_get_and_lost_cache_entry():
+    feeds = Feeds(unavailable=1)
+    with tempfile.TemporaryDirectory() as tmp, serve(feeds) as base_url:
+        budget = SharedRateBudget(os.path.join(tmp, "budget.sqlite"), rate=0.001)
+        with stub_client(base_url, rate_budget=budget) as api:
+            feed_url = base_url.replace("/api/", "/feeds/course_1.ics")
+            # the 503 is retried
+            assert [event.title for event in api.get_calendar_feed(feed_url)] == ["Midterm"]
+            assert [event.title for event in api.get_calendar_feed(feed_url)] == ["Midterm"]
+            assert feeds.requests[-1] == ("/feeds/course_1.ics", '"v1"')
+            assert api._feed_cache.hits == 1
+
+            # the validators are still sent, but the parsed feed is gone
+            validators = api._feed_cache.validators(feed_url)
+            api._feed_cache.clear(feed_url)
+            api._feed_cache.validators = lambda url: validators
+            assert [event.title for event in api.get_calendar_feed(feed_url)] == ["Midterm"]
+            assert feeds.requests[-2:] == [("/feeds/course_1.ics", '"v1"'), ("/feeds/course_1.ics", None)]
+
+        # tokenized feeds aren't metered, nothing was taken from the REST budget
+        key = SharedRateBudget.key('token', feed_url)
+        assert budget.available(key) == budget.capacity
+        budget.close()
+
+
+def test_feeds_fail_one_by_one():
+    with serve(Feeds()) as base_url, stub_client(base_url) as api:
+        courses = [Course(raw={'id': 1, 'calendar': {'ics': base_url.replace("/api/", "/feeds/course_1.ics")}}, client=api),
+                   Course(raw={'id': 2, 'calendar': {'ics': base_url.replace("/api/", "/feeds/broken.ics")}}, client=api)]
+        feeds = api.get_calendar_feeds(courses)
+    assert [event.title for event in feeds[1]] == ["Midterm"]
+    assert isinstance(feeds[2], Exception)
+
+
+if __name__ == '__main__':
+    for test in (test_unfold_split_crlf, test_conditional_get_and_lost_cache_entry, test_feeds_fail_one_by_one):
+        started = time.perf_counter()
+        test()
+        print(f"{test.__name__}: ok ({time.perf_counter() - started:.2f}s)")
@@ -0,0 +1,168 @@
+""" LiveEventsReceiver: fixture events posted to it over HTTP """
+# python -m pytest canvas/test_live_events.py, or python -m canvas.test_live_events
+import json
+import time
+
+import requests
+
+from canvas.utils.live_events import LiveEventsReceiver
+from canvas.utils.models import (
+    Announcement,
+    Assignment,
+    CalendarEvent,
+    PlannerAnnouncement,
+    PlannerAssignment,
+    PlannerCalendarEvent,
+)
+
+
+ASSIGNMENT_UPDATED = {
+    "metadata": {
+        "event_name": "assignment_updated", "event_time": "2021-09-20T14:03:11.520Z",
+        "context_type": "Course", "context_id": "21070000000000565", "root_account_id": "21070000000000001",
+        "user_id": "21070000000000123", "producer": "canvas",
+    },
+    "body": {
+        "assignment_id": "21070000000012345", "context_id": "21070000000000565", "context_type": "Course",
+        "title": "Lab 3", "description": "<p>Parallel prefix sum</p>", "due_at": "2021-09-24T03:59:59Z",
+        "unlock_at": None, "lock_at": None, "points_possible": 10.0, "workflow_state": "published",
+        "created_at": "2021-09-01T12:00:00Z", "updated_at": "2021-09-20T14:03:11Z",
+    },
+}
+
+ANNOUNCEMENT_CREATED = {
+    "metadata": {"event_name": "discussion_topic_created", "context_type": "Course", "context_id": "466754"},
+    "body": {
+        "discussion_topic_id": "1452249", "is_announcement": True, "title": "Quicksort", "body": "<p>Slides</p>",
+        "context_id": "466754", "context_type": "Course", "workflow_state": "active",
+        "created_at": "2021-09-01T00:51:28Z", "updated_at": "2021-09-01T00:51:28Z",
+    },
+}
+
+CALENDAR_EVENT_CREATED = {
+    "metadata": {"event_name": "calendar_event_created"},
+    "body": {
+        "calendar_event_id": "77", "title": "Midterm", "start_at": "2021-10-20T14:00:00Z",
+        "end_at": "2021-10-20T16:00:00Z", "context_id": "466754", "context_type": "Course",
+        "workflow_state": "active",
+    },
+}
+
+CALIPER_ENVELOPE = {
+    "sensor": "http://oxana.instructure.com/",
+    "sendTime": "2021-09-20T14:03:12.000Z",
+    "dataVersion": "http://purl.imsglobal.org/ctx/caliper/v1p1",
+    "data": [{
+        "@context": "http://purl.imsglobal.org/ctx/caliper/v1p1",
+        "id": "urn:uuid:1f6f0c5a-2f1a-4d4a-9b7e-1a2b3c4d5e6f",
+        "type": "Event",
+        "actor": {"id": "urn:instructure:canvas:user:21070000000000123", "type": "Person"},
+        "action": "Modified",
+        "object": {
+            "id": "urn:instructure:canvas:assignment:21070000000012345",
+            "type": "AssignableDigitalResource",
+            "name": "Lab 3",
+            "dateToSubmit": "2021-09-24T03:59:59.000Z",
+            "maxScore": 10.0,
+            "dateModified": "2021-09-20T14:03:11.000Z",
+            "isPartOf": {"id": "urn:instructure:canvas:course:21070000000000565", "type": "CourseOffering"},
+            "extensions": {"com.instructure.canvas": {"entity_id": "21070000000012345"}},
+        },
+        "eventTime": "2021-09-20T14:03:11.000Z",
+        "extensions": {"com.instructure.canvas": {"hostname": "oxana.instructure.com", "request_id": "r1"}},
+    }],
+}
+
+
+def post(receiver: LiveEventsReceiver, payload, token: str='secret') -> int:
+    host, port = receiver.address
+    body = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+    return requests.post(f"http://{host}:{port}/", data=body,
+                         headers={'Authorization': f"Bearer {token}"}, timeout=5).status_code
+
+
+def receiving():
+    receiver = LiveEventsReceiver(token='secret')
+    events = []
+    receiver.subscribe("*", events.append)
+    receiver.start()
+    return receiver, events
+
+
+def test_canvas_events_map_onto_entities():
+    receiver, events = receiving()
+    try:
+        assignments = []
+        receiver.subscribe("assignment_*", assignments.append)
+        assert post(receiver, [ASSIGNMENT_UPDATED, ANNOUNCEMENT_CREATED, CALENDAR_EVENT_CREATED]) == 204
+    finally:
+        receiver.stop()
+
+    assert [event.name for event in events] == ["assignment_updated", "discussion_topic_created", "calendar_event_created"]
+    assert [event.name for event in assignments] == ["assignment_updated"]
+
+    assignment, announcement, calendar_event = events
+    assert isinstance(assignment.entity, Assignment)
+    assert assignment.entity._raw['id'] == 21070000000012345 and assignment.entity._raw['name'] == "Lab 3"
+    assert isinstance(assignment.planner_item, PlannerAssignment)
+    assert assignment.planner_item._raw['plannable_type'] == 'assignment'
+    assert assignment.planner_item._raw['plannable_date'] == "2021-09-24T03:59:59Z"
+    assert assignment.planner_item._raw['course_id'] == 21070000000000565
+
+    assert isinstance(announcement.entity, Announcement)
+    assert isinstance(announcement.planner_item, PlannerAnnouncement)
+    assert announcement.planner_item._raw['plannable_id'] == 1452249
+
+    assert isinstance(calendar_event.entity, CalendarEvent)
+    assert isinstance(calendar_event.planner_item, PlannerCalendarEvent)
+    assert calendar_event.planner_item._raw['plannable_date'] == "2021-10-20T14:00:00Z"
+
+
+def test_caliper_events_match_canvas_events():
+    receiver, events = receiving()
+    try:
+        assert post(receiver, CALIPER_ENVELOPE) == 204
+    finally:
+        receiver.stop()
+
+    (event,) = events
+    assert event.name == "assignment_updated"
+    assert isinstance(event.entity, Assignment)
+    raw = event.entity._raw
+    assert raw['id'] == 21070000000012345 and raw['course_id'] == 21070000000000565
+    assert raw['due_at'] == "2021-09-24T03:59:59Z" and raw['points_possible'] == 10.0
+    assert isinstance(event.planner_item, PlannerAssignment)
+
+
+def test_malformed_batches_deliver_nothing():
+    receiver, events = receiving()
+    try:
+        # the first event is fine, the batch isn't: nothing of it is delivered, the sender retries all of it
+        assert post(receiver, [ASSIGNMENT_UPDATED, 5]) == 400
+        assert post(receiver, [ASSIGNMENT_UPDATED, {"metadata": [], "body": {}}]) == 400
+        assert post(receiver, b"{not json") == 400
+        assert post(receiver, "a string") == 400
+        assert post(receiver, ASSIGNMENT_UPDATED, token='wrong') == 401
+        assert events == [] and receiver.received == 0
+
+        assert post(receiver, [ASSIGNMENT_UPDATED, ASSIGNMENT_UPDATED]) == 204
+    finally:
+        receiver.stop()
+    assert len(events) == 2 and receiver.received == 2
+
+
+def test_failing_subscriber_doesnt_stop_the_others():
+    receiver = LiveEventsReceiver()
+    delivered = []
+    receiver.subscribe("assignment_updated", lambda event: 1 / 0)
+    receiver.subscribe("assignment_updated", delivered.append)
+    assert receiver.ingest([ASSIGNMENT_UPDATED]) == 1
+    assert len(delivered) == 1 and receiver.errors == 1
+
+
+if __name__ == '__main__':
+    for test in (test_canvas_events_map_onto_entities, test_caliper_events_match_canvas_events,
+                 test_malformed_batches_deliver_nothing, test_failing_subscriber_doesnt_stop_the_others):
+        started = time.perf_counter()
+        test()
+        print(f"{test.__name__}: ok ({time.perf_counter() - started:.2f}s)")
@@ -0,0 +1,154 @@
+""" RelationLoader against the local stub server """
+# python -m pytest canvas/test_loader.py, or python -m canvas.test_loader
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from canvas.__stub__ import serve, stub_client
+from canvas.utils.models import Course, Folder
+
+
+COURSES = {1: 130, 2: 3, 3: 0}
+
+
+def rest_assignment(course_id: int, idx: int) -> dict:
+    """ An assignment as /courses/:id/assignments returns it """
+    assignment_id = course_id * 1000 + idx
+    return {
+        'id': assignment_id, 'name': f"Assignment {idx}", 'description': "<p>Read chapter 4</p>",
+        'created_at': '2021-08-01T12:00:00Z', 'updated_at': '2021-08-02T12:00:00Z',
+        'due_at': '2021-09-02T03:59:59Z', 'lock_at': None, 'unlock_at': '2021-08-30T04:00:00Z',
+        'has_overrides': False, 'all_dates': None, 'course_id': course_id,
+        'html_url': f"https://canvas.test/courses/{course_id}/assignments/{assignment_id}",
+        'submissions_download_url': f"https://canvas.test/courses/{course_id}/assignments/{assignment_id}/submissions?zip=1",
+        'assignment_group_id': 77, 'due_date_required': False, 'allowed_extensions': ['pdf'],
+        'max_name_length': 255, 'turnitin_enabled': False, 'vericite_enabled': False,
+        'grade_group_students_individually': False, 'external_tool_tag_attributes': None,
+        'peer_reviews': False, 'automatic_peer_reviews': False, 'group_category_id': None,
+        'position': idx + 1, 'post_to_sis': False, 'points_possible': 10.0,
+        'submission_types': ['online_upload'], 'has_submitted_submissions': idx % 2 == 0,
+        'grading_type': 'points', 'grading_standard_id': None, 'published': True,
+        'unpublishable': False, 'only_visible_to_overrides': False, 'locked_for_user': False,
+        'workflow_state': 'published', 'omit_from_final_grade': False, 'moderated_grading': False,
+        'anonymous_grading': False, 'allowed_attempts': -1, 'is_quiz_assignment': False,
+        'rubric_settings': {'points_possible': 10}, 'muted': False,
+    }
+
+
+def graphql_assignment(course_id: int, idx: int) -> dict:
+    """ The same assignment as a GraphQL node, for anything that would batch through GraphQL """
+    return {
+        '_id': str(course_id * 1000 + idx), 'id': "QXNzaWdubWVudC0x", 'name': f"Assignment {idx}",
+        'description': "<p>Read chapter 4</p>", 'dueAt': '2021-09-01T23:59:59-04:00', 'lockAt': None,
+        'unlockAt': '2021-08-30T00:00:00-04:00', 'pointsPossible': 10.0, 'state': 'published',
+        'createdAt': '2021-08-01T08:00:00-04:00', 'updatedAt': '2021-08-02T08:00:00-04:00',
+        'htmlUrl': f"https://canvas.test/courses/{course_id}/assignments/{course_id * 1000 + idx}",
+        'submissionTypes': ['online_upload'],
+    }
+
+
+def canvas(requests):
+    def handle(request):
+        requests.append(request.path)
+        if request.path == "/api/graphql":
+            return 200, {}, {'data': {f"c{idx}": {'_id': str(course_id), 'assignmentsConnection': {
+                'nodes': [graphql_assignment(course_id, n) for n in range(COURSES[course_id])],
+                'pageInfo': {'hasNextPage': False, 'endCursor': None}}}
+                for idx, course_id in enumerate(COURSES)}}
+
+        parts = request.path.split('/')
+        if parts[-1] == "assignments":
+            course_id = int(parts[-2])
+            page = int(request.query.get('page', ['1'])[0])
+            rows = [rest_assignment(course_id, idx) for idx in range(COURSES[course_id])][(page - 1) * 100:page * 100]
+            headers = {}
+            if page * 100 < COURSES[course_id]:
+                headers['Link'] = f'<http://{request.headers["Host"]}{request.path}?page={page + 1}&per_page=100>; rel="next"'
+            return 200, headers, rows
+        if parts[-1] in ("files", "folders") and parts[-3] == "courses":
+            return 200, {}, [{'id': 500 + folder_id, 'folder_id': folder_id, 'parent_folder_id': folder_id}
+                             for folder_id in range(1, 13)]
+        if parts[-1] in ("files", "folders"):
+            folder_id = int(parts[-2])
+            return 200, {}, [{'id': 500 + folder_id, 'folder_id': folder_id, 'parent_folder_id': folder_id}]
+        if parts[-2] == "courses":
+            return 200, {}, {'id': int(parts[-1]), 'name': f"course {parts[-1]}"}
+        return 404, {}, {'errors': [{'message': 'not found'}]}
+    return handle
+
+
+def test_batched_assignments_are_the_rest_assignments():
+    requests = []
+    with serve(canvas(requests)) as base_url, stub_client(base_url) as api:
+        courses = [Course(raw={'id': course_id}, client=api) for course_id in COURSES]
+        with api.loader(batch_threshold=100) as loader:
+            one_by_one = loader.load_many(courses, 'assignments')
+        with api.loader(batch_threshold=1) as loader:
+            batched = loader.load_many(courses + courses, 'assignments')
+            assert loader.cache_hits == 0 and len(batched) == 6
+
+    expected = [[rest_assignment(course_id, idx) for idx in range(count)] for course_id, count in COURSES.items()]
+    assert [[a._raw for a in assignments] for assignments in one_by_one] == expected
+    assert [[a._raw for a in assignments] for assignments in batched] == expected + expected
+    # the GraphQL layout never gets in
+    assert "/api/graphql" not in requests
+
+
+def folders(api, count: int) -> list:
+    return [Folder(raw={'id': folder_id, 'context_type': 'Course', 'context_id': 1}, client=api)
+            for folder_id in range(1, count + 1)]
+
+
+def test_context_listing_threshold():
+    requests = []
+    with serve(canvas(requests)) as base_url, stub_client(base_url) as api:
+        with api.loader() as loader:
+            few = loader.load_many(folders(api, 2), 'files')
+        # two folders are two small requests, not a listing of the whole course
+        assert sorted(requests) == ["/api/v1/folders/1/files", "/api/v1/folders/2/files"]
+
+        requests.clear()
+        with api.loader() as loader:
+            many = loader.load_many(folders(api, 12), 'files')
+        assert requests == ["/api/v1/courses/1/files"]
+
+    assert [[f.id for f in files] for files in few] == [[501], [502]]
+    assert [[f.id for f in files] for files in many] == [[500 + folder_id] for folder_id in range(1, 13)]
+
+
+def test_failed_batches_fail_their_loads():
+    with serve(canvas([])) as base_url, stub_client(base_url) as api:
+        loader = api.loader()
+
+        def broken(entities):
+            raise RuntimeError("batcher broke")
+        loader._batchers['files'] = broken
+        loader._batchers['folders'] = lambda entities: [(list(entities), lambda: ['not', 'a', 'dict'])]
+
+        files = [loader.load(folder, 'files') for folder in folders(api, 3)]
+        subfolders = [loader.load(folder, 'folders') for folder in folders(api, 3)]
+        courses = [loader.load(Course(raw={'id': 2}, client=api), 'course')]
+
+        def results(pending):
+            outcomes = []
+            for item in pending:
+                try:
+                    outcomes.append(item.result())
+                except Exception as e:
+                    outcomes.append(type(e).__name__)
+            return outcomes
+
+        # result() would block forever if a load were left unresolved
+        with ThreadPoolExecutor(1) as pool:
+            outcome = pool.submit(lambda: (results(files), results(subfolders), results(courses))).result(timeout=10)
+    assert outcome[0] == ["RuntimeError"] * 3
+    assert outcome[1] == ["TypeError"] * 3
+    # the other relations of the dispatch still load
+    assert outcome[2][0].id == 2
+
+
+if __name__ == '__main__':
+    for test in (test_batched_assignments_are_the_rest_assignments, test_context_listing_threshold,
+                 test_failed_batches_fail_their_loads):
+        started = time.perf_counter()
+        test()
+        print(f"{test.__name__}: ok ({time.perf_counter() - started:.2f}s)")
@@ -0,0 +1,120 @@
+""" SharedRateBudget: the SQLite token bucket, in one process and across several """
+# python -m pytest canvas/test_ratelimit.py, or python -m canvas.test_ratelimit
+import multiprocessing
+import os
+import tempfile
+import time
+
+from canvas.__stub__ import serve, stub_client
+from canvas.utils.ratelimit import SharedRateBudget
+
+
+KEY = SharedRateBudget.key('token', "https://canvas.test/api/v1/")
+
+
+def test_acquire_and_timeout():
+    with tempfile.TemporaryDirectory() as tmp:
+        budget = SharedRateBudget(os.path.join(tmp, "budget.sqlite"), rate=0.001, capacity=3, reserve=0)
+        assert budget.available(KEY) == 3
+        assert budget.acquire(KEY, cost=2) and budget.acquire(KEY)
+        started = time.monotonic()
+        assert not budget.acquire(KEY, timeout=0.2)
+        assert 0.15 < time.monotonic() - started < 2
+        # buckets are per token and host
+        assert budget.acquire(SharedRateBudget.key('other token', "https://canvas.test/api/v1/"), cost=3)
+        budget.close()
+
+
+def test_observe_lowers_and_learns_cost():
+    with tempfile.TemporaryDirectory() as tmp:
+        budget = SharedRateBudget(os.path.join(tmp, "budget.sqlite"), rate=0.001, capacity=600, reserve=50)
+        budget.observe(KEY, remaining=150.0, cost=11.0)
+        assert 99.9 < budget.available(KEY) <= 100.1
+        # the default cost is the average X-Request-Cost seen: 0.8 * 1 + 0.2 * 11
+        budget.acquire(KEY)
+        assert 96.9 < budget.available(KEY) <= 97.1
+        # a higher X-Rate-Limit-Remaining never raises the bucket
+        budget.observe(KEY, remaining=600.0)
+        assert budget.available(KEY) <= 97.1
+        budget.close()
+
+
+def test_remaining_below_reserve_empties_the_bucket():
+    with tempfile.TemporaryDirectory() as tmp:
+        budget = SharedRateBudget(os.path.join(tmp, "budget.sqlite"), rate=10, capacity=600, reserve=50)
+        budget.observe(KEY, remaining=0.0)
+        assert 0 <= budget.available(KEY) < 1
+        # one unit is a tenth of a second away, not the (50 + 1) / 10 it'd be from -50
+        started = time.monotonic()
+        assert budget.acquire(KEY, cost=1, timeout=2)
+        assert time.monotonic() - started < 1
+        budget.close()
+
+
+def test_client_spends_and_observes():
+    def canvas(request):
+        return 200, {'X-Rate-Limit-Remaining': '10.0', 'X-Request-Cost': '1.5'}, {'id': 1}
+
+    with tempfile.TemporaryDirectory() as tmp, serve(canvas) as base_url:
+        budget = SharedRateBudget(os.path.join(tmp, "budget.sqlite"), rate=20, capacity=600, reserve=50)
+        with stub_client(base_url, rate_budget=budget) as api:
+            started = time.monotonic()
+            for _ in range(3):
+                api.get("/courses/1")
+            # Canvas reports less than the reserve: the requests after the first are paced by
+            # the refill (about 1.1 units at 20/s each), they don't wait out a debt of 40 units
+            assert time.monotonic() - started < 1.5
+        assert budget.available(SharedRateBudget.key(api._access_token, base_url)) < 5
+        budget.close()
+
+
+def _spend(path: str, rate: float, capacity: float, count: int, ready, go):
+    budget = SharedRateBudget(path, rate=rate, capacity=capacity, reserve=0)
+    ready.release()
+    go.wait()
+    for _ in range(count):
+        budget.acquire(KEY, cost=1)
+    budget.close()
+
+
+def run_processes(path: str, rate: float, capacity: float, processes: int, count: int) -> float:
+    """ Seconds it took processes to take count units each from the same budget file """
+    ctx = multiprocessing.get_context('spawn')
+    ready, go = ctx.Semaphore(0), ctx.Event()
+    workers = [ctx.Process(target=_spend, args=(path, rate, capacity, count, ready, go))
+               for _ in range(processes)]
+    for worker in workers:
+        worker.start()
+    for _ in workers:
+        assert ready.acquire(timeout=60)
+    started = time.monotonic()
+    go.set()
+    for worker in workers:
+        worker.join(60)
+        assert worker.exitcode == 0
+    return time.monotonic() - started
+
+
+def test_processes_share_one_budget():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "budget.sqlite")
+        # no refill to speak of: 4 processes x 10 units use up exactly 40, no update is lost
+        run_processes(path, rate=0.001, capacity=40, processes=4, count=10)
+        budget = SharedRateBudget(path, rate=0.001, capacity=40, reserve=0)
+        assert budget.available(KEY) < 0.5
+        assert not budget.acquire(KEY, timeout=0.1)
+        budget.close()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # 40 units against a burst of 10 refilled at 60/s: the processes together wait at least 0.5s
+        elapsed = run_processes(os.path.join(tmp, "budget.sqlite"), rate=60, capacity=10, processes=4, count=10)
+        assert elapsed >= 0.45
+
+
+if __name__ == '__main__':
+    for test in (test_acquire_and_timeout, test_observe_lowers_and_learns_cost,
+                 test_remaining_below_reserve_empties_the_bucket, test_client_spends_and_observes,
+                 test_processes_share_one_budget):
+        started = time.perf_counter()
+        test()
+        print(f"{test.__name__}: ok ({time.perf_counter() - started:.2f}s)")
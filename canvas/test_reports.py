@@ -0,0 +1,104 @@
+""" Account reports against the local stub server: polling, failures and the streamed CSV """
+# python -m pytest canvas/test_reports.py, or python -m canvas.test_reports
+import os
+import tempfile
+import time
+
+from canvas.__stub__ import serve, stub_client
+from canvas.utils.reports import backoff_delays, iter_rows, read_columns
+from canvas.utils.rest import APIError
+
+
+CSV = "﻿canvas_user_id,user_id,name,status\r\n1,u1,\"Doe, Jane\",active\r\n2,u2,Zoë,deleted\r\n".encode('utf-8')
+
+
+class Reports:
+    """
+    /accounts/1/reports/<type>: 'provisioning_csv' finishes after two polls, 'grade_export_csv'
+    fails with null parameters (as Canvas sends them), 'slow_csv' never finishes
+    """
+
+    def __init__(self):
+        self.polls = {}
+        self.auth = []
+
+    def __call__(self, request):
+        if request.path == "/files/report.csv":
+            self.auth.append(request.headers.get('Authorization'))
+            return 200, {'Content-Type': 'text/csv'}, CSV
+        parts = request.path.split("/")
+        report = parts[6]
+        if request.method == "POST":
+            return 200, {}, {'id': 9, 'report': report, 'status': 'created', 'parameters': None}
+
+        polls = self.polls[report] = self.polls.get(report, 0) + 1
+        raw = {'id': int(parts[7]), 'report': report, 'status': 'running', 'progress': 30, 'parameters': None}
+        if report == "grade_export_csv":
+            raw['status'] = 'error'
+        elif report == "provisioning_csv" and polls >= 3:
+            host = request.headers['Host']
+            raw.update(status='complete', progress=100, parameters={'users': True},
+                       attachment={'id': 3, 'url': f"http://{host}/files/report.csv"})
+        return 200, {}, raw
+
+
+def test_backoff_delays():
+    delays = backoff_delays(1, max_delay=5)
+    assert [next(delays) for _ in range(5)] == [1, 2, 4, 5, 5]
+
+
+def test_run_report():
+    reports = Reports()
+    with serve(reports) as base_url, stub_client(base_url) as api, tempfile.TemporaryDirectory() as tmp:
+        started = api.start_report(1, "provisioning_csv", {'users': True})
+        finished = api.wait_for_report(1, "provisioning_csv", started.id, initial_delay=0.01)
+        assert reports.polls["provisioning_csv"] == 3 and finished._raw['status'] == 'complete'
+
+        file_path = api.download_report(finished, os.path.join(tmp, "reports", "users.csv"))
+        assert reports.auth == ["Bearer token"]
+        with open(file_path, 'rb') as f:
+            assert f.read() == CSV
+        assert not os.path.exists(f"{file_path}.tmp")
+
+        # the BOM is dropped, quoted commas and non-ascii stay in their column
+        assert list(iter_rows(file_path)) == [
+            {'canvas_user_id': '1', 'user_id': 'u1', 'name': "Doe, Jane", 'status': 'active'},
+            {'canvas_user_id': '2', 'user_id': 'u2', 'name': "Zoë", 'status': 'deleted'}]
+        assert read_columns(file_path, columns=['name', 'status']) == \
+            {'name': ["Doe, Jane", "Zoë"], 'status': ['active', 'deleted']}
+
+
+def test_failed_report_with_null_parameters():
+    with serve(Reports()) as base_url, stub_client(base_url) as api:
+        try:
+            api.wait_for_report(1, "grade_export_csv", 9, initial_delay=0.01)
+        except APIError as e:
+            assert e.code == 'report_failed' and "grade_export_csv 9 error" in str(e)
+            assert e._error['report']['parameters'] is None
+        else:
+            raise AssertionError("a failed report was returned")
+
+
+def test_timeout_and_parallel_reports():
+    with serve(Reports()) as base_url, stub_client(base_url) as api, tempfile.TemporaryDirectory() as tmp:
+        started = time.monotonic()
+        try:
+            api.wait_for_report(1, "slow_csv", 9, timeout=0.2, initial_delay=0.05)
+        except TimeoutError as e:
+            assert "still running" in str(e)
+        else:
+            raise AssertionError("a running report was returned")
+        assert time.monotonic() - started < 1
+
+        results = api.run_reports(1, {"provisioning_csv": None, "grade_export_csv": None}, tmp, timeout=10)
+        assert results["provisioning_csv"] == os.path.join(tmp, "provisioning_csv.csv")
+        assert isinstance(results["grade_export_csv"], APIError)
+        assert not os.path.exists(os.path.join(tmp, "grade_export_csv.csv"))
+
+
+if __name__ == '__main__':
+    for test in (test_backoff_delays, test_run_report, test_failed_report_with_null_parameters,
+                 test_timeout_and_parallel_reports):
+        started = time.perf_counter()
+        test()
+        print(f"{test.__name__}: ok ({time.perf_counter() - started:.2f}s)")
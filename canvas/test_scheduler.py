@@ -0,0 +1,135 @@
+""" PollScheduler with fake clients: callback failures, change detection, rescheduling """
+# python -m pytest canvas/test_scheduler.py, or python -m canvas.test_scheduler
+import datetime
+import queue
+import threading
+import time
+
+from canvas.utils.scheduler import PollScheduler
+
+
+class FakeClient:
+    """ Answers the polled sources from dicts, counts the calls """
+
+    def __init__(self, due_at: str=None):
+        self.due_at = due_at
+        self.calls = {"planner_items": 0, "todos": 0, "notifications": 0}
+        self.todos = [{'assignment': {'id': 1, 'due_at': due_at}}]
+        self.fail_notifications = False
+
+    def get_planner_items(self):
+        self.calls["planner_items"] += 1
+        return [{'plannable_id': 1, 'plannable_date': self.due_at}]
+
+    def get_todos(self):
+        self.calls["todos"] += 1
+        return list(self.todos)
+
+    def get_notifications(self):
+        self.calls["notifications"] += 1
+        if self.fail_notifications:
+            raise ConnectionError("notifications are down")
+        return iter([{'id': 5, 'subject': "Maintenance"}])
+
+
+def poll(scheduler: PollScheduler, key):
+    """ One poll of key on this thread, like a worker would run it """
+    scheduler._slots.acquire()
+    job = scheduler._jobs[key]
+    job.running = True
+    scheduler._poll(job)
+    return job
+
+
+def test_failing_callback_doesnt_stop_the_poll():
+    results = []
+
+    def callback(result):
+        results.append(result)
+        if result.source == "planner_items":
+            raise RuntimeError("callback broke")
+
+    scheduler = PollScheduler(interval=60, callback=callback)
+    client = FakeClient()
+    scheduler.add("user", client)
+    job = poll(scheduler, "user")
+
+    # the remaining sources were still polled and emitted, the job is scheduled again
+    assert [result.source for result in results] == ["planner_items", "todos", "notifications"]
+    assert client.calls == {"planner_items": 1, "todos": 1, "notifications": 1}
+    assert scheduler.callback_errors == 1 and str(scheduler.last_callback_error) == "callback broke"
+    assert not job.running and sum(1 for _, _, queued in scheduler._heap if queued is job) == 2
+
+
+def test_changes_errors_and_backoff():
+    out = queue.Queue()
+    scheduler = PollScheduler(interval=60, queue=out, jitter=0, idle_factor=2, max_interval=200)
+    client = FakeClient()
+    scheduler.add("user", client)
+
+    job = poll(scheduler, "user")
+    assert [out.get_nowait().changed for _ in range(3)] == [True, True, True] and out.empty()
+    assert job.interval == 60
+
+    # nothing changed: nothing emitted, the interval doubles up to max_interval
+    poll(scheduler, "user")
+    assert out.empty() and job.interval == 120
+    poll(scheduler, "user")
+    assert job.interval == 200
+
+    # a failing source is emitted with its error, a change resets the interval
+    client.fail_notifications = True
+    client.todos.append({'assignment': {'id': 2, 'due_at': None}})
+    poll(scheduler, "user")
+    todos, notifications = out.get_nowait(), out.get_nowait()
+    assert todos.source == "todos" and todos.changed and len(todos.items) == 2
+    assert notifications.items is None and isinstance(notifications.error, ConnectionError)
+    assert job.interval == 60
+
+
+def test_due_soon_is_urgent():
+    now = datetime.datetime.now(datetime.timezone.utc)
+    soon = (now + datetime.timedelta(hours=2)).strftime('%Y-%m-%dT%H:%M:%SZ')
+    later = (now + datetime.timedelta(days=10)).strftime('%Y-%m-%dT%H:%M:%SZ')
+    scheduler = PollScheduler(interval=60, callback=lambda result: None, jitter=0, urgent_factor=0.25)
+    scheduler.add("soon", FakeClient(soon), sources=["planner_items"])
+    scheduler.add("later", FakeClient(later), sources=["planner_items"], priority=5)
+    assert poll(scheduler, "soon").urgent and scheduler._jobs["soon"].interval == 15
+    assert not poll(scheduler, "later").urgent and scheduler._jobs["later"].interval == 60
+
+    # both due: the urgent one goes first, even against a higher priority
+    scheduler._heap.clear()
+    for job in scheduler._jobs.values():
+        scheduler._push(job, 0)
+    assert [job.key for job in scheduler._due_jobs()] == ["soon", "later"]
+
+
+def test_runs_until_stopped():
+    polled = threading.Event()
+    results = []
+
+    def callback(result):
+        results.append(result)
+        polled.set()
+        raise ValueError("every callback fails")
+
+    scheduler = PollScheduler(interval=0.05, callback=callback, max_workers=2)
+    clients = [FakeClient() for _ in range(4)]
+    for idx, client in enumerate(clients):
+        scheduler.add(idx, client)
+    scheduler.start()
+    assert polled.wait(5)
+    time.sleep(0.3)
+    scheduler.stop()
+
+    # every user was polled for every source, failing callbacks and all
+    assert all(calls >= 1 for client in clients for calls in client.calls.values())
+    assert scheduler.callback_errors == len(results) >= 12
+
+
+if __name__ == '__main__':
+    for test in (test_failing_callback_doesnt_stop_the_poll, test_changes_errors_and_backoff,
+                 test_due_soon_is_urgent, test_runs_until_stopped):
+        started = time.perf_counter()
+        test()
+        print(f"{test.__name__}: ok ({time.perf_counter() - started:.2f}s)")
@@ -0,0 +1,121 @@
+""" Coalescing of identical in-flight calls (canvas.utils.singleflight) """
+# python -m pytest canvas/test_singleflight.py, or python -m canvas.test_singleflight
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from canvas.__stub__ import serve, stub_client
+from canvas.utils.singleflight import SingleFlight
+from canvas.utils.timeouts import DeadlineExceeded
+
+
+def run_together(flight: SingleFlight, fn, callers: int=4, **kwargs) -> list:
+    """ One leader blocked in fn until every other caller waits on it, returns (result or error) per caller """
+    started = threading.Event()
+    release = threading.Event()
+
+    def leader_fn():
+        started.set()
+        release.wait(5)
+        return fn()
+
+    def call(idx: int):
+        if idx:
+            started.wait(5)
+        try:
+            return flight.do('key', leader_fn, **kwargs)
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(callers) as pool:
+        futures = [pool.submit(call, idx) for idx in range(callers)]
+        while flight.coalesced < callers - 1:
+            time.sleep(0.001)
+        release.set()
+        return [future.result() for future in futures]
+
+
+def test_one_call_each_caller_its_own_copy():
+    flight = SingleFlight()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        return {'items': [1, 2]}
+
+    results = run_together(flight, fn)
+    assert len(calls) == 1
+    assert all(result == {'items': [1, 2]} for result in results)
+    # changing one caller's result doesn't show up in another's
+    results[0]['items'].append(3)
+    assert all(result == {'items': [1, 2]} for result in results[1:])
+    assert len({id(result) for result in results}) == len(results)
+    assert flight.stats() == {"calls": 1, "coalesced": 3, "in_flight": 0}
+
+
+def test_failures_reach_every_caller():
+    flight = SingleFlight()
+
+    def fn():
+        raise KeyError('gone')
+
+    results = run_together(flight, fn)
+    assert all(isinstance(result, KeyError) for result in results)
+    assert flight.stats()["calls"] == 1
+
+
+def test_retrying_caller_counted_once():
+    flight = SingleFlight()
+    attempts = []
+
+    def fn():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise DeadlineExceeded("leader ran out of time")
+        return 'ok'
+
+    results = run_together(flight, fn, callers=2, retry_on=(DeadlineExceeded,))
+    assert isinstance(results[0], DeadlineExceeded) and results[1] == 'ok'
+    # the waiting caller ended up running the call itself: one more call, not a coalesced one
+    assert flight.stats() == {"calls": 2, "coalesced": 0, "in_flight": 0}
+
+
+def test_async_waiters_get_copies():
+    flight = SingleFlight()
+
+    async def main():
+        async def fn():
+            await asyncio.sleep(0.01)
+            return [{'id': 1}]
+
+        return await asyncio.gather(*(flight.do_async('key', fn) for _ in range(3)))
+
+    results = asyncio.run(main())
+    results[0][0]['id'] = 2
+    assert results[1:] == [[{'id': 1}], [{'id': 1}]]
+    assert flight.stats() == {"calls": 0, "coalesced": 2, "in_flight": 0}
+
+
+def test_client_coalesces_gets():
+    requests = []
+
+    def slow(request):
+        requests.append(request.path)
+        time.sleep(0.2)
+        return 200, {}, {'id': 1, 'tags': []}
+
+    with serve(slow) as base_url, stub_client(base_url) as api, ThreadPoolExecutor(4) as pool:
+        results = list(pool.map(lambda _: api.get("/courses/1"), range(4)))
+        stats = api.coalescing_stats
+    assert len(requests) == 1 and stats["calls"] == 1 and stats["coalesced"] == 3
+    results[0]['tags'].append('changed')
+    assert all(result == {'id': 1, 'tags': []} for result in results[1:])
+
+
+if __name__ == '__main__':
+    for test in (test_one_call_each_caller_its_own_copy, test_failures_reach_every_caller,
+                 test_retrying_caller_counted_once, test_async_waiters_get_copies, test_client_coalesces_gets):
+        started = time.perf_counter()
+        test()
+        print(f"{test.__name__}: ok ({time.perf_counter() - started:.2f}s)")
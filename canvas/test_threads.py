@@ -0,0 +1,128 @@
+""" One CANVAS_REST shared by many threads, against the local stub server """
+# python -m pytest canvas/test_threads.py, or python -m canvas.test_threads
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from canvas.__stub__ import serve, stub_client
+from canvas.bench_threads import throughput, user
+from canvas.utils.timeouts import DeadlineExceeded
+
+
+THREADS = 16
+CALLS = 800
+
+
+def echo(request):
+    # long enough that requests from different threads overlap
+    time.sleep(0.002)
+    return 200, {}, {'id': int(request.path.rsplit('/', 1)[-1]), 'path': request.path,
+                     'auth': request.headers.get('Authorization')}
+
+
+def stress(api, token: str, coalesce: bool):
+    stop = threading.Event()
+
+    def set_options():
+        count = 0
+        while not stop.is_set():
+            api.set_option('n', count)
+            count += 1
+            time.sleep(0.0001)
+
+    sessions = {}
+
+    def call(i: int):
+        # a few paths repeat so coalesced GETs are exercised too
+        course_id = i % 50 if coalesce else i
+        resp = api.get(f"/courses/{course_id}")
+        sessions.setdefault(threading.get_ident(), set()).add(api._session)
+        return course_id, resp
+
+    writer = threading.Thread(target=set_options)
+    writer.start()
+    try:
+        with ThreadPoolExecutor(THREADS) as pool:
+            results = list(pool.map(call, range(CALLS)))
+    finally:
+        stop.set()
+        writer.join()
+
+    for course_id, resp in results:
+        assert resp['path'] == f"/api/v1/courses/{course_id}", resp
+        assert resp['id'] == course_id
+        assert resp['auth'] == f"Bearer {token}"
+    assert isinstance(api.options['n'], int)
+    # every thread kept one Session, and no two threads shared one
+    assert all(len(thread_sessions) == 1 for thread_sessions in sessions.values())
+    assert len({session for thread_sessions in sessions.values() for session in thread_sessions}) == len(sessions)
+
+
+def test_shared_client():
+    with serve(echo) as base_url, stub_client(base_url, coalesce_gets=False) as api:
+        stress(api, 'token', coalesce=False)
+        api.get("/courses/1")
+        assert api._sessions
+    assert not api._sessions
+
+
+def test_shared_client_coalescing():
+    with serve(echo) as base_url, stub_client(base_url) as api:
+        stress(api, 'token', coalesce=True)
+
+
+def test_clients_keep_their_tokens():
+    with serve(echo) as base_url, \
+            stub_client(base_url, access_token='a') as api_a, \
+            stub_client(base_url, access_token='b') as api_b:
+        # identical GETs from two tokens must not be coalesced into one
+        with ThreadPoolExecutor(2) as pool:
+            futures = [pool.submit(stress, api_a, 'a', True), pool.submit(stress, api_b, 'b', True)]
+            for future in futures:
+                future.result()
+
+
+def test_coalesced_deadlines():
+    def slow(request):
+        time.sleep(0.5)
+        return 200, {}, {'id': 1}
+
+    def timed(api, deadline):
+        started = time.perf_counter()
+        try:
+            return api.get("/courses/1", deadline=deadline), time.perf_counter() - started
+        except DeadlineExceeded as e:
+            return e, time.perf_counter() - started
+
+    with serve(slow) as base_url, stub_client(base_url) as api, ThreadPoolExecutor(2) as pool:
+        # a follower with a shorter deadline than the leader gives up on time
+        leader = pool.submit(timed, api, None)
+        time.sleep(0.05)
+        follower = pool.submit(timed, api, 0.1)
+        result, elapsed = follower.result()
+        assert isinstance(result, DeadlineExceeded) and elapsed < 0.3
+        assert leader.result()[0] == {'id': 1}
+
+        # the leader running out of time doesn't fail a follower that has time left
+        leader = pool.submit(timed, api, 0.1)
+        time.sleep(0.05)
+        follower = pool.submit(timed, api, None)
+        assert isinstance(leader.result()[0], DeadlineExceeded)
+        assert follower.result()[0] == {'id': 1}
+
+
+def test_throughput_scales_with_threads():
+    # the short form of python -m canvas.bench_threads: with a session per thread, 8 threads
+    # get well beyond what one does (the bound is loose, shared CI machines are noisy)
+    with serve(user(0.005)) as base_url:
+        one = throughput(base_url, 1, 20)
+        eight = throughput(base_url, 8, 80)
+    assert eight > 4 * one, (one, eight)
+
+
+if __name__ == '__main__':
+    for test in (test_shared_client, test_shared_client_coalescing, test_clients_keep_their_tokens,
+                 test_coalesced_deadlines, test_throughput_scales_with_threads):
+        started = time.perf_counter()
+        test()
+        print(f"{test.__name__}: ok ({time.perf_counter() - started:.2f}s)")
@@ -0,0 +1,98 @@
+""" SessionTransport and HTTP2Transport against the local stub servers """
+# python -m pytest canvas/test_transport.py, or python -m canvas.test_transport
+import gzip
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from canvas.__stub__ import serve, serve_h2c, stub_client
+from canvas.utils.models import File
+from canvas.utils.store import BlobStore
+from canvas.utils.transport import HTTP2Transport, SessionTransport, StreamedBody
+
+
+PAGE = [{'id': idx, 'name': f"Assignment {idx}", 'description': "<p>Read chapter 4</p>" * 5,
+         'due_at': '2021-09-01T03:59:59Z', 'points_possible': 10} for idx in range(100)]
+BLOB = os.urandom(1 << 20)
+FEED = b"BEGIN:VCALENDAR\r\nBEGIN:VEVENT\r\nUID:event-calendar-event-7\r\nSUMMARY:Midterm\r\nDTSTART:20211020T140000Z\r\nEND:VEVENT\r\nEND:VCALENDAR\r\n"
+
+
+def canvas(request):
+    if request.path.endswith("/assignments"):
+        body = json.dumps(PAGE).encode()
+        if 'gzip' in (request.headers.get('Accept-Encoding') or ''):
+            return 200, {'Content-Type': 'application/json', 'Content-Encoding': 'gzip'}, gzip.compress(body)
+        return 200, {'Content-Type': 'application/json'}, body
+    if request.path == "/feeds/course_1.ics":
+        return 200, {'Content-Type': 'text/calendar'}, FEED
+    if request.path == "/files/5/download":
+        return 200, {'Content-Type': 'application/octet-stream'}, BLOB
+    return 404, {}, {'errors': [{'message': 'not found'}]}
+
+
+def test_session_transport_compresses():
+    transport = SessionTransport()
+    with serve(canvas) as base_url, stub_client(base_url, transport=transport) as api:
+        assert len(api.get_assignments(1)) == 100
+    stats = api.transport_stats
+    assert stats['requests'] == 1
+    assert stats['wire_bytes'] < stats['decoded_bytes'] / 5
+
+
+def needs_http2():
+    """ HTTP2Transport and the h2c stub need the optional packages, pip install -r requirements-http2.txt """
+    pytest.importorskip("httpx")
+    pytest.importorskip("h2")
+
+
+def test_http2_multiplexes():
+    needs_http2()
+    transport = HTTP2Transport(http1=False)
+    with serve_h2c(canvas) as base_url, stub_client(base_url, transport=transport, coalesce_gets=False) as api:
+        with ThreadPoolExecutor(8) as pool:
+            assert set(pool.map(lambda _: len(api.get_assignments(1)), range(32))) == {100}
+        resp = api._send('GET', base_url + "v1/courses/1/assignments")
+        assert resp.http_version == "HTTP/2"
+    transport.close()
+    stats = api.transport_stats
+    assert stats['requests'] == 33
+    assert stats['wire_bytes'] < stats['decoded_bytes'] / 5
+
+
+def test_http2_streams():
+    needs_http2()
+    transport = HTTP2Transport(http1=False)
+    with serve_h2c(canvas) as base_url, stub_client(base_url, transport=transport) as api, \
+            tempfile.TemporaryDirectory() as tmp:
+        resp = api._send('GET', base_url.replace("/api/", "/files/5/download"), stream=True)
+        with resp:
+            # nothing is buffered until it's read
+            assert isinstance(resp.raw, StreamedBody) and resp._content is False
+            first = next(resp.iter_content(chunk_size=1 << 14))
+            assert len(first) == 1 << 14
+        assert transport.stats.requests == 1
+
+        events = api.get_calendar_feed(base_url.replace("/api/", "/feeds/course_1.ics"))
+        assert [event.title for event in events] == ["Midterm"]
+
+        file = File(raw={'id': 5, 'uuid': 'u5', 'filename': 'blob.bin',
+                         'url': base_url.replace("/api/", "/files/5/download")}, client=api)
+        file.download(os.path.join(tmp, "files"), store=BlobStore(os.path.join(tmp, "store")))
+        with open(os.path.join(tmp, "files", "blob.bin"), 'rb') as f:
+            assert f.read() == BLOB
+    transport.close()
+
+
+if __name__ == '__main__':
+    for test in (test_session_transport_compresses, test_http2_multiplexes, test_http2_streams):
+        started = time.perf_counter()
+        try:
+            test()
+        except pytest.skip.Exception as e:
+            print(f"{test.__name__}: skipped ({e})")
+            continue
+        print(f"{test.__name__}: ok ({time.perf_counter() - started:.2f}s)")
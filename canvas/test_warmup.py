@@ -0,0 +1,121 @@
+""" User context warmup against the local stub server: the snapshot, its cache and background refreshes """
+# python -m pytest canvas/test_warmup.py, or python -m canvas.test_warmup
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from canvas.__stub__ import serve, stub_client
+from canvas.utils.warmup import UserContext
+
+
+LATENCY = 0.2
+
+
+class Canvas:
+    """ The six endpoints a warmup reads, each LATENCY seconds slow, broken while `broken` is set """
+
+    def __init__(self):
+        self.requests = []
+        self.lock = threading.Lock()
+        self.broken = False
+        self.version = 1
+
+    def __call__(self, request):
+        with self.lock:
+            self.requests.append(request.path)
+        time.sleep(LATENCY)
+        if self.broken:
+            return 500, {}, {'errors': [{'message': 'Internal Server Error'}]}
+        path = request.path[len("/api/v1"):]
+        if path == "/users/self":
+            return 200, {}, {'id': 1, 'name': f"Jane Doe v{self.version}"}
+        if path == "/users/self/profile":
+            return 200, {}, {'id': 1, 'primary_email': "jane@school.test"}
+        if path == "/users/self/settings":
+            return 200, {}, {'manual_mark_as_read': False, 'collapse_global_nav': True}
+        if path == "/users/self/colors":
+            return 200, {}, {'custom_colors': {'course_10': '#ff0000', 'user_1': '#00ff00'}}
+        if path == "/users/self/course_nicknames":
+            return 200, {}, [{'course_id': 11, 'name': "Data Structures", 'nickname': "DS"}]
+        if path == "/courses":
+            return 200, {}, [{'id': 10, 'name': "Algorithms"}, {'id': 11, 'name': "Data Structures"}]
+        return 404, {}, {'errors': [{'message': 'not found'}]}
+
+
+def test_snapshot_is_fetched_concurrently():
+    canvas = Canvas()
+    with serve(canvas) as base_url, stub_client(base_url, retries=0) as api:
+        started = time.monotonic()
+        snapshot = api.warmup()
+        # six requests of LATENCY each, at the same time
+        assert time.monotonic() - started < 3 * LATENCY
+        assert len(canvas.requests) == 6
+
+        assert snapshot.user.name == "Jane Doe v1" and snapshot.settings['collapse_global_nav'] is True
+        assert snapshot.colors == {'course_10': '#ff0000', 'user_1': '#00ff00'}
+        assert snapshot.nicknames == {11: "DS"}
+        assert [(course.id, course.nickname, course.color) for course in snapshot.courses] == \
+            [(10, None, '#ff0000'), (11, "DS", None)]
+        assert snapshot.course(11).name == "Data Structures" and snapshot.course(12) is None
+        try:
+            snapshot.colors['course_10'] = '#000000'
+        except TypeError:
+            pass
+        else:
+            raise AssertionError("the snapshot can be changed")
+
+        # cached: the same snapshot, no requests
+        assert api.warmup() is snapshot and len(canvas.requests) == 6
+
+
+def test_refresh_in_background_then_wait():
+    canvas = Canvas()
+    with serve(canvas) as base_url, stub_client(base_url, retries=0) as api:
+        context = UserContext(api, ttl=1.0, refresh_after=0.5)
+        first = context.get()
+
+        # getting old: the old snapshot comes back right away, the new one is fetched meanwhile
+        time.sleep(0.6)
+        canvas.version = 2
+        started = time.monotonic()
+        assert context.get() is first and time.monotonic() - started < LATENCY
+        context.refresh(wait=True)
+        second = context.get()
+        assert second.user.name == "Jane Doe v2" and context.refreshes == 2
+
+        # a failed background refresh keeps the snapshot it had, until it expires
+        time.sleep(0.6)
+        canvas.broken = True
+        assert context.get() is second
+        context.refresh(wait=True)
+        assert context.get() is second and context.last_error is not None
+
+        # expired: get() waits, and raises what the fetch failed with
+        time.sleep(0.5)
+        try:
+            context.get()
+        except Exception as e:
+            assert e is context.last_error
+        else:
+            raise AssertionError("an expired snapshot was returned")
+
+        canvas.broken = False
+        assert context.get().user.name == "Jane Doe v2" and context.last_error is None
+
+
+def test_callers_share_one_fetch():
+    canvas = Canvas()
+    with serve(canvas) as base_url, stub_client(base_url, retries=0) as api:
+        assert api.warmup(prefetch=True) is None
+        with ThreadPoolExecutor(8) as pool:
+            snapshots = list(pool.map(lambda _: api.warmup(), range(8)))
+    assert len({id(snapshot) for snapshot in snapshots}) == 1
+    assert len(canvas.requests) == 6
+
+
+if __name__ == '__main__':
+    for test in (test_snapshot_is_fetched_concurrently, test_refresh_in_background_then_wait,
+                 test_callers_share_one_fetch):
+        started = time.perf_counter()
+        test()
+        print(f"{test.__name__}: ok ({time.perf_counter() - started:.2f}s)")
@@ -1,5 +1,6 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from configparser import ConfigParser
-from typing import Any, Dict, List
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Tuple
 import dateutil.parser
 import datetime
 import json
@@ -23,6 +24,46 @@ def datetime_simple(value: datetime.datetime) -> str:
     return datetime.datetime.strftime(value, "%Y-%m-%d")
 
 
+def map_concurrently(fn: Callable, items: Iterable, max_workers: int=8) -> Iterator[Tuple[Any, Any, Exception or None]]:
+    """
+    Runs fn(item) for every item on a thread pool and yields
+    (item, result, error) tuples in completion order.
+    error is None when the call succeeded, result is None when it failed.
+    """
+    items = list(items)
+    if not items:
+        return
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(items)))) as pool:
+        futures = {pool.submit(fn, item): item for item in items}
+        for future in as_completed(futures):
+            item = futures[future]
+            try:
+                yield item, future.result(), None
+            except Exception as e:
+                yield item, None, e
+
+
+def to_columns(rows: Iterable[Dict], columns: List[str]=None) -> Dict[str, List]:
+    """
+    Builds {column: [values...]} from an iterable of dicts in one pass, the rows
+    themselves aren't kept. Keys missing from a row are None in that column.
+    columns: only these keys, in this order (default: every key in order of appearance)
+    """
+    fixed = columns is not None
+    table: Dict[str, List] = {column: [] for column in columns or []}
+    count = 0
+    for row in rows:
+        if not fixed:
+            for key in row:
+                if key not in table:
+                    table[key] = [None] * count
+        for column, values in table.items():
+            values.append(row.get(column))
+        count += 1
+    return table
+
+
 def get_from_hidden_folder(path: str, section: str or None=None, attr: str or None=None, default: Any=None):
     if not os.path.exists(path):
         return None
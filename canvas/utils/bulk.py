@@ -0,0 +1,147 @@
+""" Bulk Updates """
+# Shared pieces for the engines that apply many writes at once
+# (CANVAS_REST.update_assignments, CANVAS_REST.sync_calendar_events):
+# diffing against fetched data so no-op writes are skipped, sync keys to
+# find what an earlier run created, and a per item report.
+import datetime
+import hashlib
+import html
+import json
+import os
+import re
+import tempfile
+import threading
+from typing import Any, Dict, NamedTuple
+
+import dateutil.parser
+
+from canvas.utils import canvas_datetime
+
+
+CANVAS_DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+SYNC_KEY_PATTERN = re.compile(r'<!--\s*canvas-sync:(.*?)\s*-->')
+
+
+class BulkResult(NamedTuple):
+    """
+    context: what the item belongs to, e.g. the course id
+    id: the item id, None for creates
+    action: 'create', 'update', 'delete' or 'skip' (nothing to change)
+    changes: the fields that were (or would be, for dry runs) sent
+    error: the exception when the request failed
+    result: the api response
+    """
+    context: Any
+    id: Any
+    action: str
+    changes: Dict[str, Any]
+    error: Exception or None = None
+    result: Any = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def shift_datetime(value: str or None, delta: datetime.timedelta) -> str or None:
+    """ Shifts a canvas datetime string ('2021-09-01T03:59:59Z'), None stays None """
+    if value is None:
+        return None
+    shifted = canvas_datetime(value) + delta
+    return shifted.astimezone(datetime.timezone.utc).strftime(CANVAS_DATETIME_FORMAT)
+
+
+def same_value(current: Any, desired: Any) -> bool:
+    """ Equality that treats differently formatted but equal datetimes as the same """
+    if current == desired:
+        return True
+    if isinstance(current, str) and isinstance(desired, str):
+        try:
+            return canvas_datetime(current) == canvas_datetime(desired)
+        except ValueError:
+            return False
+    return False
+
+
+def diff(current: Dict[str, Any], desired: Dict[str, Any]) -> Dict[str, Any]:
+    """ The desired fields whose value differs from current """
+    return {key: val for key, val in desired.items() if not same_value(current.get(key), val)}
+
+
+def to_canvas_datetime(value: datetime.datetime or str or None) -> str or None:
+    """ datetimes to the canvas format (naive ones are taken as UTC), strings are kept """
+    if not isinstance(value, datetime.datetime):
+        return value
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return value.astimezone(datetime.timezone.utc).strftime(CANVAS_DATETIME_FORMAT)
+
+
+def parse_datetime(value: str) -> datetime.datetime:
+    """ Any ISO 8601 datetime or date ('2021-09-01T03:59:59.000Z', '2021-09-01'), naive ones are taken as UTC """
+    parsed = dateutil.parser.isoparse(value)
+    return parsed if parsed.tzinfo is not None else parsed.replace(tzinfo=datetime.timezone.utc)
+
+
+def fingerprint(fields: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(fields, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class SyncState:
+    """
+    Which object each sync key was written to, per context, in a json file:
+        {context: {sync_key: {"id": ..., "fingerprint": ..., "updated_at": ...}}}
+    It's what a sync finds its earlier writes by, since it doesn't depend on Canvas
+    keeping anything in the object. The fingerprint of what was written and the
+    updated_at Canvas answered with tell if the object needs another write.
+    path: None keeps it in memory only
+    """
+
+    def __init__(self, path: str=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._contexts: Dict[str, Dict[str, Dict]] = {}
+        if path and os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                self._contexts = json.load(f)
+
+    def entries(self, context: str) -> Dict[str, Dict]:
+        with self._lock:
+            return dict(self._contexts.get(str(context)) or {})
+
+    def set(self, context: str, sync_key: str, id: Any, fields_fingerprint: str, updated_at: str=None):
+        with self._lock:
+            self._contexts.setdefault(str(context), {})[sync_key] = {
+                "id": id, "fingerprint": fields_fingerprint, "updated_at": updated_at}
+
+    def remove(self, context: str, sync_key: str):
+        with self._lock:
+            (self._contexts.get(str(context)) or {}).pop(sync_key, None)
+
+    def save(self):
+        """ Written to a temporary file first, so an interrupted save doesn't lose the old state """
+        if not self.path:
+            return
+        with self._lock:
+            data = json.dumps(self._contexts, sort_keys=True)
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(tmp_path, self.path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+def with_sync_key(text: str or None, key: str) -> str:
+    """ Embeds key in an html comment at the end of text, replacing any key already there """
+    text = SYNC_KEY_PATTERN.sub('', text or '').rstrip()
+    return f"{text}<!-- canvas-sync:{html.escape(str(key))} -->"
+
+
+def find_sync_key(text: str or None) -> str or None:
+    match = SYNC_KEY_PATTERN.search(text or '')
+    return html.unescape(match.group(1)) if match else None
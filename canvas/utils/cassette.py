@@ -0,0 +1,141 @@
+""" Record / Replay """
+# A cassette holds requests and responses captured from a live Canvas
+# (status, the headers that matter, body, pagination links, timing) in a
+# gzipped json-lines file. ReplayTransport serves them back so a CANVAS_REST
+# workload can be benchmarked or profiled without the network.
+#
+#   cassette = Cassette("nightly.jsonl.gz")
+#   api = CANVAS_REST(recorder=cassette)
+#   ... run the workload ...
+#   cassette.save()
+#
+#   api = CANVAS_REST(transport=ReplayTransport(Cassette.load("nightly.jsonl.gz"), latency_scale=1.0))
+import base64
+import collections
+import gzip
+import http.client
+import io
+import json
+import threading
+import time
+from typing import Dict, List
+from urllib.parse import urlencode
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+
+RECORDED_HEADERS = [
+    'Content-Type',
+    'Link',
+    'ETag',
+    'Last-Modified',
+    'X-Rate-Limit-Remaining',
+    'X-Request-Cost',
+]
+
+
+def request_key(method: str, url: str, params=None, json_body=None) -> str:
+    """ Matches a replayed request to the recorded one """
+    if params:
+        items = params.items() if isinstance(params, dict) else params
+        url += ("&" if "?" in url else "?") + urlencode(sorted(items, key=lambda item: str(item[0])), doseq=True)
+    body = json.dumps(json_body, sort_keys=True, default=str) if json_body is not None else ""
+    return f"{method.upper()} {url} {body}"
+
+
+class Cassette:
+
+    def __init__(self, path: str=None, entries: List[Dict]=None):
+        self.path = path
+        self.entries: List[Dict] = entries or []
+        self._lock = threading.Lock()
+
+    def record(self, method: str, url: str, kwargs: Dict, resp: requests.Response, elapsed: float):
+        """ Adds one interaction, the Authorization header is never recorded """
+        content = resp.content or b''
+        entry = {
+            "key": request_key(method, url, kwargs.get('params'), kwargs.get('json')),
+            "status": resp.status_code,
+            "headers": {name: resp.headers[name] for name in RECORDED_HEADERS if name in resp.headers},
+            "elapsed": round(elapsed, 6),
+        }
+        try:
+            entry["body"] = content.decode('utf-8')
+        except UnicodeDecodeError:
+            entry["body_b64"] = base64.b64encode(content).decode('ascii')
+
+        with self._lock:
+            self.entries.append(entry)
+
+    def save(self, path: str=None):
+        path = path or self.path
+        with self._lock:
+            entries = list(self.entries)
+        with gzip.open(path, 'wt', encoding='utf-8') as f:
+            for entry in entries:
+                f.write(json.dumps(entry, separators=(',', ':')) + "\n")
+
+    @classmethod
+    def load(cls, path: str) -> 'Cassette':
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            return cls(path=path, entries=[json.loads(line) for line in f if line.strip()])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.save()
+
+
+class ReplayTransport:
+    """
+    Serves a cassette instead of the network, pass as CANVAS_REST(transport=...).
+    :Parameters
+        latency_scale: None replies immediately, 1.0 sleeps the recorded time, 0.5 half of it...
+        repeat: when a request was recorded fewer times than it is replayed, repeat the last
+            response instead of raising, so a short recording can drive a long load test
+    """
+
+    def __init__(self, cassette: Cassette, latency_scale: float=None, repeat: bool=True):
+        self.latency_scale = latency_scale
+        self.repeat = repeat
+        self._lock = threading.Lock()
+        self._responses: Dict[str, collections.deque] = collections.defaultdict(collections.deque)
+        for entry in cassette.entries:
+            self._responses[entry["key"]].append(entry)
+        self.served = 0
+        self.missing = 0
+
+    def request(self, method: str, url: str, params=None, json=None, **kwargs) -> requests.Response:
+        key = request_key(method, url, params, json)
+        with self._lock:
+            responses = self._responses.get(key)
+            if not responses:
+                self.missing += 1
+                raise LookupError(f"no recorded response for {key}")
+            entry = responses.popleft() if len(responses) > 1 or not self.repeat else responses[0]
+            self.served += 1
+
+        if self.latency_scale:
+            time.sleep(entry["elapsed"] * self.latency_scale)
+        return to_response(entry, method, url)
+
+
+def to_response(entry: Dict, method: str, url: str) -> requests.Response:
+    resp = requests.Response()
+    resp.status_code = entry["status"]
+    resp.reason = http.client.responses.get(entry["status"], "")
+    resp.headers = CaseInsensitiveDict(entry["headers"])
+    resp.url = url
+    resp.encoding = 'utf-8'
+    resp.request = requests.Request(method, url).prepare()
+    if "body_b64" in entry:
+        resp._content = base64.b64decode(entry["body_b64"])
+    else:
+        resp._content = entry.get("body", "").encode('utf-8')
+    # the body is already read, iter_content / iter_lines serve it from _content,
+    # raw is there for the stream=True callers that close the response
+    resp._content_consumed = True
+    resp.raw = io.BytesIO(resp._content)
+    return resp
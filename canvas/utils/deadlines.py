@@ -0,0 +1,253 @@
+""" Deadline Index """
+# "What's due next" across get_todos, get_planner_items and get_upcoming_events.
+# Items from the three sources that point at the same assignment are merged
+# into one Deadline, kept in due date order, and updated in place as more
+# results come in, so next(n) and range(start, end) are a bisect away.
+#
+#   index = DeadlineIndex()
+#   index.ingest(api.get_todos())
+#   index.ingest(api.get_planner_items(future_days=14))
+#   index.ingest(api.get_upcoming_events())
+#   index.next(5)
+import bisect
+import datetime
+import threading
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Tuple
+
+import dateutil.parser
+
+from canvas.utils import map_concurrently
+
+
+class Deadline(NamedTuple):
+    key: Tuple[str, int or str]     # ('assignment', id), ('calendar_event', id), ('planner_note', id)...
+    due_at: datetime.datetime
+    title: str or None
+    course_id: int or None
+    html_url: str or None
+    sources: FrozenSet[str]         # todo, planner, upcoming
+
+
+def as_utc(value: datetime.datetime) -> datetime.datetime:
+    """ Naive datetimes are taken as UTC, like the naive timestamps Canvas sends """
+    if not isinstance(value, datetime.datetime):
+        raise TypeError(f"expected a datetime, got {type(value).__name__}")
+    return value if value.tzinfo is not None else value.replace(tzinfo=datetime.timezone.utc)
+
+
+def parse_datetime(value: str or None) -> datetime.datetime or None:
+    if not isinstance(value, str) or not value:
+        return None
+    try:
+        parsed = dateutil.parser.isoparse(value)
+    except ValueError:
+        return None
+    return as_utc(parsed)
+
+
+def _course_id(raw: Dict) -> int or None:
+    if raw.get('course_id') is not None:
+        return raw['course_id']
+    context_code = raw.get('context_code') or ''
+    if context_code.startswith('course_'):
+        return int(context_code[len('course_'):])
+    return None
+
+
+def from_todo(raw: Dict) -> Tuple[Tuple, Dict] or None:
+    """ (key, fields) of a todo, None when it has nothing due """
+    assignment = raw.get('assignment') or {}
+    if 'id' not in assignment:
+        return None
+    return ('assignment', assignment['id']), {
+        'due_at': assignment.get('due_at'),
+        'title': assignment.get('name'),
+        'course_id': assignment.get('course_id') or _course_id(raw),
+        'html_url': raw.get('html_url') or assignment.get('html_url'),
+        'done': False,
+    }
+
+
+def from_planner_item(raw: Dict) -> Tuple[Tuple, Dict] or None:
+    plannable = raw.get('plannable') or {}
+    plannable_type = raw.get('plannable_type')
+    if plannable_type == 'assignment':
+        key = ('assignment', raw.get('plannable_id'))
+    elif plannable.get('assignment_id') is not None:
+        # graded quizzes and discussions
+        key = ('assignment', plannable['assignment_id'])
+    else:
+        key = (plannable_type, raw.get('plannable_id'))
+
+    override = raw.get('planner_override') or {}
+    submissions = raw.get('submissions') or {}
+    return key, {
+        'due_at': plannable.get('due_at') or raw.get('plannable_date'),
+        'title': plannable.get('title') or plannable.get('name'),
+        'course_id': _course_id(raw),
+        'html_url': raw.get('html_url'),
+        'done': bool(override.get('marked_complete') or override.get('dismissed')
+                     or (isinstance(submissions, dict) and submissions.get('submitted'))),
+    }
+
+
+def from_upcoming_event(raw: Dict) -> Tuple[Tuple, Dict] or None:
+    assignment = raw.get('assignment') or {}
+    if raw.get('type') == 'assignment' and 'id' in assignment:
+        return ('assignment', assignment['id']), {
+            'due_at': assignment.get('due_at') or raw.get('start_at'),
+            'title': assignment.get('name') or raw.get('title'),
+            'course_id': assignment.get('course_id') or _course_id(raw),
+            'html_url': raw.get('html_url') or assignment.get('html_url'),
+            'done': False,
+        }
+    return ('calendar_event', raw.get('id')), {
+        'due_at': raw.get('start_at'),
+        'title': raw.get('title'),
+        'course_id': _course_id(raw),
+        'html_url': raw.get('html_url'),
+        'done': False,
+    }
+
+
+# source name -> raw item -> (key, fields)
+EXTRACTORS = {
+    'todo': from_todo,
+    'planner': from_planner_item,
+    'upcoming': from_upcoming_event,
+}
+
+
+def source_of(item) -> str:
+    from canvas.utils.models import PlannerItem, Todo, UpcomingEvent
+
+    if isinstance(item, Todo):
+        return 'todo'
+    if isinstance(item, PlannerItem):
+        return 'planner'
+    if isinstance(item, UpcomingEvent):
+        return 'upcoming'
+    raw = getattr(item, '_raw', item)
+    if 'plannable_type' in raw:
+        return 'planner'
+    if 'needs_grading_count' in raw or ('assignment' in raw and 'type' in raw and raw['type'] in ('grading', 'submitting')):
+        return 'todo'
+    return 'upcoming'
+
+
+class DeadlineIndex:
+    """
+    Deadlines ordered by due date, one per assignment whichever sources it came from.
+    Items that are done (marked complete or submitted in the planner) are dropped,
+    items without a due date aren't indexed.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._items: Dict[Tuple, Deadline] = {}
+        # sorted (due_at, key) pairs
+        self._order: List[Tuple[datetime.datetime, Tuple]] = []
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __contains__(self, key: Tuple) -> bool:
+        return key in self._items
+
+    def get(self, key: Tuple) -> Deadline or None:
+        return self._items.get(key)
+
+    def _unlink(self, deadline: Deadline):
+        idx = bisect.bisect_left(self._order, (deadline.due_at, deadline.key))
+        if idx < len(self._order) and self._order[idx] == (deadline.due_at, deadline.key):
+            del self._order[idx]
+
+    def remove(self, key: Tuple) -> Deadline or None:
+        with self._lock:
+            deadline = self._items.pop(key, None)
+            if deadline is not None:
+                self._unlink(deadline)
+            return deadline
+
+    def add(self, key: Tuple, due_at: datetime.datetime, source: str, title: str=None,
+            course_id: int=None, html_url: str=None) -> Deadline:
+        """ Adds or updates one deadline, fields missing here are kept from what's already indexed """
+        due_at = as_utc(due_at)
+        with self._lock:
+            current = self._items.get(key)
+            if current is not None:
+                self._unlink(current)
+                title = title or current.title
+                course_id = course_id if course_id is not None else current.course_id
+                html_url = html_url or current.html_url
+                sources = current.sources | {source}
+            else:
+                sources = frozenset([source])
+
+            deadline = Deadline(key, due_at, title, course_id, html_url, sources)
+            self._items[key] = deadline
+            bisect.insort(self._order, (due_at, key))
+            return deadline
+
+    def ingest(self, items: Iterable, source: str=None) -> int:
+        """
+        Adds todos, planner items or upcoming events (entities or raw dicts).
+        source: 'todo', 'planner' or 'upcoming', detected from each item when None.
+        Returns how many deadlines were added or updated.
+        """
+        count = 0
+        for item in items:
+            item_source = source or source_of(item)
+            extracted = EXTRACTORS[item_source](getattr(item, '_raw', item))
+            if extracted is None or extracted[0][1] is None:
+                continue
+            key, fields = extracted
+
+            if fields['done']:
+                self.remove(key)
+                continue
+            due_at = parse_datetime(fields['due_at'])
+            if due_at is None:
+                continue
+            self.add(key, due_at, item_source, fields['title'], fields['course_id'], fields['html_url'])
+            count += 1
+        return count
+
+    def next(self, n: int=10, after: datetime.datetime=None, course_id: int=None) -> List[Deadline]:
+        """ The n deadlines due soonest after `after` (default: now, naive datetimes are UTC) """
+        after = as_utc(after) if after is not None else datetime.datetime.now(datetime.timezone.utc)
+        deadlines = []
+        with self._lock:
+            # keys compare after the datetime, an empty tuple sorts before all of them
+            for idx in range(bisect.bisect_right(self._order, (after, ())), len(self._order)):
+                deadline = self._items[self._order[idx][1]]
+                if course_id is None or deadline.course_id == course_id:
+                    deadlines.append(deadline)
+                    if len(deadlines) >= n:
+                        break
+        return deadlines
+
+    def range(self, start: datetime.datetime, end: datetime.datetime) -> List[Deadline]:
+        """ Deadlines due in [start, end), naive datetimes are UTC """
+        start, end = as_utc(start), as_utc(end)
+        with self._lock:
+            lo = bisect.bisect_right(self._order, (start, ()))
+            hi = bisect.bisect_right(self._order, (end, ()))
+            return [self._items[key] for _, key in self._order[lo:hi]]
+
+    def refresh(self, client, course_ids: List[int or str]=None, future_days: int=14, max_workers: int=8) -> int:
+        """
+        Fetches todos, planner items and upcoming events (per course when course_ids is given)
+        concurrently and ingests them, returns how many deadlines were added or updated.
+        """
+        calls = [('planner', lambda: client.get_planner_items(future_days=future_days, stream=True))]
+        for course_id in course_ids or [None]:
+            calls.append(('todo', lambda course_id=course_id: client.get_todos(course_id, stream=True)))
+            calls.append(('upcoming', lambda course_id=course_id: client.get_upcoming_events(course_id, stream=True)))
+
+        count = 0
+        for (source, _), items, error in map_concurrently(lambda call: list(call[1]()), calls, max_workers=max_workers):
+            if error is not None:
+                raise error
+            count += self.ingest(items, source=source)
+        return count
@@ -0,0 +1,337 @@
+""" Discussion Views """
+# https://canvas.instructure.com/doc/api/discussion_topics.html#method.discussion_topics_api.view
+# GET /courses/:id/discussion_topics/:id/view returns the whole thread in one
+# (for big discussions very large) json object. It's parsed while it is
+# downloaded, one top level thread at a time, entries stay raw dicts behind
+# a lazy DiscussionEntry tree, and with `since` the entries that aren't newer
+# than a stored marker are dropped as they're parsed instead of kept.
+#
+#   view = api.get_discussion_view(course_id, topic_id)
+#   for entry in view.walk():
+#       print("  " * entry.depth, view.participant(entry.user_id), entry.message)
+#   marker = view.marker
+#   ...
+#   new = api.get_discussion_view(course_id, topic_id, since=marker).entries_since(marker)
+import codecs
+import json
+import re
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+import dateutil.parser
+
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_NUMBER_GOES_ON = frozenset(".eE+-")
+
+
+def iter_members(chunks: Iterable[str], split: Iterable[str]=()) -> Iterator[Tuple[str, Any]]:
+    """
+    Yields (key, value) for every member of the top level json object in chunks,
+    each as soon as it has been read. Arrays under a key in split are yielded
+    one element at a time, as (key, element).
+    """
+    decoder = json.JSONDecoder()
+    split = set(split)
+    chunks = iter(chunks)
+    buf, pos, eof = "", 0, False
+    # chunks not yet in buf, joined only when they're needed so a big value isn't copied per chunk
+    pending, pending_size = [], 0
+    # retry a failed decode only once the undecoded part doubled, so a big value isn't re-scanned per chunk
+    retry_size = 0
+    state, key = "start", None
+
+    def more() -> bool:
+        nonlocal pending_size, eof
+        for chunk in chunks:
+            if chunk:
+                pending.append(chunk)
+                pending_size += len(chunk)
+                return True
+        eof = True
+        return False
+
+    def fill():
+        nonlocal buf, pos, pending_size
+        buf = buf[pos:] + "".join(pending)
+        pos, pending_size = 0, 0
+        pending.clear()
+
+    def skip_whitespace():
+        nonlocal pos
+        pos = _WHITESPACE.match(buf, pos).end()
+
+    def decode():
+        """ The value at pos, None when it isn't complete yet """
+        nonlocal pos, retry_size
+        if not eof and len(buf) - pos + pending_size < retry_size:
+            return None, False
+        if pending:
+            fill()
+        try:
+            value, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            retry_size = 2 * (len(buf) - pos)
+            return None, False
+        # a number might still go on in the next chunk: it ends the buffer, or raw_decode stopped
+        # at a fraction or exponent it couldn't complete yet ('1500.' decodes as 1500)
+        if not eof and isinstance(value, (int, float)) and not isinstance(value, bool) \
+                and (end == len(buf) or buf[end] in _NUMBER_GOES_ON):
+            return None, False
+        pos, retry_size = end, 0
+        return value, True
+
+    while True:
+        skip_whitespace()
+        if pos >= len(buf):
+            if pending:
+                fill()
+                continue
+            if eof:
+                if state != "done":
+                    raise json.JSONDecodeError("unexpected end of data", buf, pos)
+                return
+            more()
+            continue
+
+        char = buf[pos]
+        if state == "start":
+            if char != "{":
+                raise json.JSONDecodeError("expected an object", buf, pos)
+            pos += 1
+            state = "key"
+        elif state == "key":
+            if char == "}":
+                pos += 1
+                state = "done"
+                continue
+            key, ok = decode()
+            if not ok:
+                more()
+                continue
+            state = "colon"
+        elif state == "colon":
+            if char != ":":
+                raise json.JSONDecodeError("expected ':'", buf, pos)
+            pos += 1
+            state = "value"
+        elif state == "value":
+            if key in split and char == "[":
+                pos += 1
+                state = "element"
+                continue
+            value, ok = decode()
+            if not ok:
+                more()
+                continue
+            yield key, value
+            state = "next"
+        elif state == "element":
+            if char == "]":
+                pos += 1
+                state = "next"
+                continue
+            value, ok = decode()
+            if not ok:
+                more()
+                continue
+            yield key, value
+            state = "next_element"
+        elif state == "next_element":
+            pos += 1
+            if char == ",":
+                state = "element"
+            elif char == "]":
+                state = "next"
+            else:
+                raise json.JSONDecodeError("expected ',' or ']'", buf, pos - 1)
+        elif state == "next":
+            pos += 1
+            if char == ",":
+                state = "key"
+            elif char == "}":
+                state = "done"
+            else:
+                raise json.JSONDecodeError("expected ',' or '}'", buf, pos - 1)
+        else:
+            raise json.JSONDecodeError("extra data", buf, pos)
+
+
+def decode_chunks(chunks: Iterable[bytes], encoding: str='utf-8') -> Iterator[str]:
+    decoder = codecs.getincrementaldecoder(encoding)()
+    for chunk in chunks:
+        yield decoder.decode(chunk)
+    yield decoder.decode(b'', final=True)
+
+
+def entry_time(raw: Dict) -> str or None:
+    """ When an entry last changed """
+    return raw.get('updated_at') or raw.get('created_at')
+
+
+def _after(value: str or None, marker) -> bool:
+    if value is None:
+        return False
+    return dateutil.parser.isoparse(value) > marker
+
+
+class DiscussionEntry:
+    """
+    One entry of the thread over its raw dict, replies are wrapped only when they're accessed.
+    Fields of the raw entry are attributes: id, user_id, parent_id, message, created_at, updated_at...
+    """
+    __slots__ = ('_raw', '_view', 'parent', 'depth')
+
+    def __init__(self, raw: Dict, view: 'DiscussionView', parent: 'DiscussionEntry'=None, depth: int=0):
+        self._raw = raw
+        self._view = view
+        self.parent = parent
+        self.depth = depth
+
+    def __getattr__(self, key):
+        try:
+            return self._raw[key]
+        except KeyError:
+            raise AttributeError(key) from None
+
+    @property
+    def replies(self) -> List['DiscussionEntry']:
+        return [DiscussionEntry(raw, self._view, self, self.depth + 1) for raw in self._raw.get('replies') or []]
+
+    @property
+    def reply_count(self) -> int:
+        return len(self._raw.get('replies') or [])
+
+    @property
+    def unread(self) -> bool:
+        return self._raw.get('id') in self._view.unread_entries
+
+    @property
+    def rating(self) -> int or None:
+        return self._view.entry_ratings.get(str(self._raw.get('id')))
+
+    def walk(self) -> Iterator['DiscussionEntry']:
+        """ This entry and everything under it, depth first """
+        yield self
+        for reply in self.replies:
+            yield from reply.walk()
+
+    def entity(self):
+        from canvas.utils.models import Entity
+        return Entity(raw=self._raw, client=self._view.client)
+
+    def __repr__(self):
+        return f"DiscussionEntry(id={self._raw.get('id')}, user_id={self._raw.get('user_id')}, replies={self.reply_count})"
+
+
+class DiscussionView:
+    """
+    :Attributes
+        participants: {user id: participant}
+        unread_entries, forced_entries: sets of entry ids
+        entry_ratings: {entry id (str): rating}
+        since: the marker the view was loaded with, entries older than it aren't in it
+        skipped: how many entries were dropped because of since
+    """
+
+    def __init__(self, client=None, since: str=None):
+        self.client = client
+        self.since = since
+        self.participants: Dict[int, Dict] = {}
+        self.unread_entries = set()
+        self.forced_entries = set()
+        self.entry_ratings: Dict[str, int] = {}
+        self.skipped = 0
+        self._threads: List[Dict] = []
+        self._new_entries: List[Dict] = []
+
+    @classmethod
+    def parse(cls, chunks: Iterable[str], client=None, since: str=None) -> 'DiscussionView':
+        """ Builds the view from the text chunks of a /view response as they arrive """
+        view = cls(client, since)
+        marker = dateutil.parser.isoparse(since) if since else None
+        for key, value in iter_members(chunks, split=('view', 'new_entries', 'participants')):
+            if key == 'view':
+                thread = value if marker is None else view._prune(value, marker)
+                if thread is not None:
+                    view._threads.append(thread)
+            elif key == 'new_entries':
+                if marker is None or _after(entry_time(value), marker):
+                    view._new_entries.append(value)
+                else:
+                    view.skipped += 1
+            elif key == 'participants':
+                view.participants[value.get('id')] = value
+            elif key == 'unread_entries':
+                view.unread_entries = set(value or [])
+            elif key == 'forced_entries':
+                view.forced_entries = set(value or [])
+            elif key == 'entry_ratings':
+                view.entry_ratings = dict(value or {})
+        return view
+
+    def _prune(self, raw: Dict, marker) -> Dict or None:
+        """
+        Only the entries newer than marker, and the ones on the way to them
+        (with 'stale': True) so the newer ones keep their place in the tree
+        """
+        replies = []
+        for reply in raw.get('replies') or []:
+            pruned = self._prune(reply, marker)
+            if pruned is not None:
+                replies.append(pruned)
+        if _after(entry_time(raw), marker):
+            return {**raw, 'replies': replies}
+        self.skipped += 1
+        if replies:
+            return {**raw, 'replies': replies, 'stale': True}
+        return None
+
+    @property
+    def entries(self) -> List[DiscussionEntry]:
+        """ The top level entries, entries posted after the view was cached by Canvas are placed under their parent """
+        self._place_new_entries()
+        return [DiscussionEntry(raw, self) for raw in self._threads]
+
+    def _place_new_entries(self):
+        if not self._new_entries:
+            return
+        by_id = {}
+        stack = list(self._threads)
+        while stack:
+            raw = stack.pop()
+            by_id[raw.get('id')] = raw
+            stack.extend(raw.get('replies') or [])
+        for raw in self._new_entries:
+            if raw.get('id') in by_id:
+                continue
+            parent = by_id.get(raw.get('parent_id'))
+            if parent is not None:
+                parent.setdefault('replies', []).append(raw)
+            else:
+                self._threads.append(raw)
+            by_id[raw.get('id')] = raw
+        self._new_entries = []
+
+    def walk(self) -> Iterator[DiscussionEntry]:
+        for entry in self.entries:
+            yield from entry.walk()
+
+    def participant(self, user_id: int) -> Dict or None:
+        return self.participants.get(user_id)
+
+    @property
+    def marker(self) -> str or None:
+        """ The time of the newest entry, pass it back as since / entries_since """
+        times = [entry_time(entry._raw) for entry in self.walk() if entry_time(entry._raw)]
+        if self.since:
+            times.append(self.since)
+        return max(times, key=dateutil.parser.isoparse) if times else None
+
+    def entries_since(self, marker: str) -> List[DiscussionEntry]:
+        """ Entries created or edited after marker, oldest first """
+        when = dateutil.parser.isoparse(marker)
+        newer = [entry for entry in self.walk()
+                 if not entry._raw.get('stale') and _after(entry_time(entry._raw), when)]
+        return sorted(newer, key=lambda entry: dateutil.parser.isoparse(entry_time(entry._raw)))
@@ -0,0 +1,194 @@
+""" Sharded Export """
+# Institution wide exports (courses -> assignments, files, calendar, planner)
+# split by (token, course) into shards that run on a process pool, so json
+# decoding and entity construction use every core. Each shard streams to its
+# own file and leaves a checkpoint (with the sections it covers) when it's
+# done, a crashed run picks up from the missing shards, a run with other
+# sections redoes the shards checkpointed with different ones, and the
+# shards are merged at the end.
+#
+#   runner = ExportRunner("export/", tokens=[token_a, token_b], base_url="https://school.instructure.com/api/")
+#   runner.run()        # -> export/export.ndjson
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Dict, List
+
+from canvas.utils.models import CalendarEvent, File, PlannerItem
+
+
+SECTIONS: Dict[str, Callable] = {
+    "assignments": lambda client, course_id: client.get_assignments(course_id, stream=True),
+    "files": lambda client, course_id: client.list_entities_from_endpoint(
+        path=f"/courses/{course_id}/files", entity=File, stream=True, data={"per_page": 100}),
+    "calendar": lambda client, course_id: client.list_entities_from_endpoint(
+        path="/calendar_events", entity=CalendarEvent, stream=True,
+        data={"context_codes[]": f"course_{course_id}", "all_events": True, "per_page": 100}),
+    "planner": lambda client, course_id: client.list_entities_from_endpoint(
+        path="/planner/items", entity=PlannerItem, stream=True,
+        data={"context_codes[]": f"course_{course_id}", "per_page": 100}),
+}
+
+
+def write_json_atomic(path: str, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def export_shard(shard: Dict, out_dir: str, access_token: str, base_url: str, api_version: str, sections: List[str]) -> Dict:
+    """
+    Runs in a worker process: exports every section of one course to shards/<name>.ndjson,
+    one {"token", "course_id", "section", "data"} object per line, then writes the checkpoint.
+    """
+    from canvas.utils.rest import CANVAS_REST
+
+    path = os.path.join(out_dir, "shards", f"{shard['name']}.ndjson")
+    counts = {}
+    with CANVAS_REST(access_token=access_token, base_url=base_url, api_version=api_version) as client:
+        with open(f"{path}.tmp", "w") as out:
+            for section in sections:
+                counts[section] = 0
+                for entity in SECTIONS[section](client, shard["course_id"]):
+                    out.write(json.dumps({
+                        "token": shard["token"],
+                        "course_id": shard["course_id"],
+                        "section": section,
+                        "data": entity._raw,
+                    }, default=str) + "\n")
+                    counts[section] += 1
+    os.replace(f"{path}.tmp", path)
+
+    done = {"name": shard["name"], "sections": list(sections), "counts": counts}
+    write_json_atomic(os.path.join(out_dir, "shards", f"{shard['name']}.done"), done)
+    return done
+
+
+class ExportRunner:
+    """
+    :Parameters
+        out_dir: shards, checkpoints, the plan and the merged export go here
+        tokens: access tokens to export for, courses are listed per token (default: the configured token).
+            Tokens are never written to disk, the plan refers to them by position,
+            so resume with the same tokens in the same order.
+        course_ids: export these courses (with the first token) instead of listing them
+        sections: any of SECTIONS, a shard checkpointed with other sections is exported again
+        processes: size of the process pool (default: cpu count)
+    """
+
+    def __init__(self,
+        out_dir: str,
+        tokens: List[str]=None,
+        base_url: str=None,
+        api_version: str=None,
+        course_ids: List[str or int]=None,
+        sections: List[str]=None,
+        processes: int=None):
+
+        from canvas.utils import get_access_token, get_api_version, get_base_url
+
+        self.out_dir = out_dir
+        self.tokens = tokens or [get_access_token()]
+        if not all(self.tokens):
+            raise ValueError("no access token given and none configured, pass tokens or run canvas.utils.setup.run_setup()")
+        # checked here, the workers would only get str(None)
+        base_url = base_url or get_base_url(include_version=False)
+        if not base_url:
+            raise ValueError("no base_url given and none configured, pass base_url or run canvas.utils.setup.run_setup()")
+        self.base_url = str(base_url)
+        self.api_version = api_version or get_api_version()
+        self.course_ids = course_ids
+        self.sections = list(sections or SECTIONS)
+        self.processes = processes or os.cpu_count()
+        for section in self.sections:
+            if section not in SECTIONS:
+                raise ValueError(f"unknown section '{section}', expected one of {list(SECTIONS)}")
+
+        os.makedirs(os.path.join(out_dir, "shards"), exist_ok=True)
+
+    @property
+    def plan_path(self) -> str:
+        return os.path.join(self.out_dir, "plan.json")
+
+    def plan(self) -> List[Dict]:
+        """ The shards of this export, listed once and reused by resumed runs """
+        if os.path.exists(self.plan_path):
+            with open(self.plan_path) as f:
+                plan = json.load(f)
+            if plan["sections"] != self.sections:
+                write_json_atomic(self.plan_path, {**plan, "sections": self.sections})
+            return plan["shards"]
+
+        from canvas.utils.rest import CANVAS_REST
+
+        shards = []
+        for token_idx, token in enumerate(self.tokens):
+            if self.course_ids is not None:
+                if token_idx:
+                    break
+                course_ids = list(self.course_ids)
+            else:
+                with CANVAS_REST(access_token=token, base_url=self.base_url, api_version=self.api_version) as client:
+                    course_ids = [course.id for course in client.get_courses(fields=[], stream=True)]
+            shards += [{"name": f"t{token_idx}-c{course_id}", "token": token_idx, "course_id": course_id}
+                       for course_id in course_ids]
+
+        write_json_atomic(self.plan_path, {"sections": self.sections, "shards": shards})
+        return shards
+
+    def completed(self) -> set:
+        """ Shards checkpointed with exactly these sections """
+        shards_dir = os.path.join(self.out_dir, "shards")
+        completed = set()
+        for name in os.listdir(shards_dir):
+            if not name.endswith(".done"):
+                continue
+            with open(os.path.join(shards_dir, name)) as f:
+                if json.load(f).get("sections") == self.sections:
+                    completed.add(name[:-len(".done")])
+        return completed
+
+    def run(self, merge: bool=True) -> Dict:
+        """
+        Exports every shard that doesn't have a checkpoint yet.
+        Returns {"completed": [...], "failed": {name: error}, "skipped": [...], "export": path or None}
+        """
+        shards = self.plan()
+        completed = self.completed()
+        pending = [shard for shard in shards if shard["name"] not in completed]
+
+        report = {"completed": [], "failed": {}, "skipped": sorted(completed), "export": None}
+        if pending:
+            with ProcessPoolExecutor(max_workers=max(1, min(self.processes, len(pending)))) as pool:
+                futures = {
+                    pool.submit(
+                        export_shard, shard, self.out_dir, self.tokens[shard["token"]],
+                        self.base_url, self.api_version, self.sections): shard
+                    for shard in pending}
+                for future in as_completed(futures):
+                    shard = futures[future]
+                    try:
+                        future.result()
+                        report["completed"].append(shard["name"])
+                    except Exception as e:
+                        report["failed"][shard["name"]] = repr(e)
+
+        if merge and not report["failed"]:
+            report["export"] = self.merge(shards)
+        return report
+
+    def merge(self, shards: List[Dict]=None) -> str:
+        """ Concatenates the shard files, in plan order, into export.ndjson """
+        shards = shards or self.plan()
+        path = os.path.join(self.out_dir, "export.ndjson")
+        with open(f"{path}.tmp", "wb") as out:
+            for shard in shards:
+                with open(os.path.join(self.out_dir, "shards", f"{shard['name']}.ndjson"), "rb") as f:
+                    while True:
+                        chunk = f.read(1 << 20)
+                        if not chunk:
+                            break
+                        out.write(chunk)
+        os.replace(f"{path}.tmp", path)
+        return path
@@ -0,0 +1,132 @@
+""" Folder Tree Index """
+# Resolves folder paths ("course files/Assignments") to folders and lists
+# children without going back to /folders/by_path every time. Filled from
+# one walk of /courses/:id/folders or from by_path responses, a folder whose
+# updated_at changed drops what was cached under it.
+import threading
+import time
+from typing import Dict, Iterable, List
+
+
+def normalize_path(path: str or None) -> str:
+    return "/".join(part for part in (path or "").split("/") if part)
+
+
+class FolderIndex:
+    """
+    One context's folder tree (a course's, or the user's).
+    Paths are relative to the root folder, like the by_path endpoints take them:
+    '' is the root, 'Assignments' is 'course files/Assignments'.
+    max_age: seconds cached entries are trusted for, None to rely on updated_at only
+    """
+
+    def __init__(self, max_age: float=None):
+        self.max_age = max_age
+        self._lock = threading.RLock()
+        self._by_id: Dict[int, dict] = {}
+        self._by_path: Dict[str, int] = {}
+        self._children: Dict[int, List[int]] = {}
+        self._loaded_at: Dict[int, float] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _relative_path(self, raw: dict) -> str:
+        # full_name includes the root folder's name ('course files/...')
+        return normalize_path(raw.get('full_name', '')).partition('/')[2]
+
+    def _fresh(self, folder_id: int) -> bool:
+        if self.max_age is None:
+            return True
+        return time.monotonic() - self._loaded_at.get(folder_id, 0) <= self.max_age
+
+    def invalidate(self, folder_id: int=None):
+        """ Forgets folder_id and everything under it, or the whole tree when folder_id is None """
+        with self._lock:
+            if folder_id is None:
+                self._by_id.clear()
+                self._by_path.clear()
+                self._children.clear()
+                self._loaded_at.clear()
+                return
+
+            for child_id in self._children.pop(folder_id, []):
+                self.invalidate(child_id)
+            raw = self._by_id.pop(folder_id, None)
+            self._loaded_at.pop(folder_id, None)
+            if raw is not None:
+                self._by_path.pop(self._relative_path(raw), None)
+                # the parent's listing no longer matches
+                self._children.pop(raw.get('parent_folder_id'), None)
+
+    def invalidate_path(self, path: str):
+        """ Forgets the folder at path and everything under it, stale or not """
+        with self._lock:
+            folder_id = self._by_path.get(normalize_path(path))
+            if folder_id is not None:
+                self.invalidate(folder_id)
+
+    def ingest(self, folders: Iterable[dict]):
+        """ Adds folders from any folder response """
+        with self._lock:
+            for raw in folders:
+                cached = self._by_id.get(raw['id'])
+                if cached is not None and (
+                        cached.get('updated_at') != raw.get('updated_at')
+                        or cached.get('full_name') != raw.get('full_name')):
+                    self.invalidate(raw['id'])
+
+                self._by_id[raw['id']] = raw
+                self._by_path[self._relative_path(raw)] = raw['id']
+                self._loaded_at[raw['id']] = time.monotonic()
+
+    def set_children(self, folder_id: int, folders: List[dict]):
+        """ Records the complete list of sub-folders of folder_id """
+        with self._lock:
+            self.ingest(folders)
+            self._children[folder_id] = [raw['id'] for raw in folders]
+
+    def load(self, folders: Iterable[dict]):
+        """ Builds the whole tree from a complete folder listing (GET /courses/:id/folders) """
+        folders = list(folders)
+        with self._lock:
+            self.invalidate()
+            self.ingest(folders)
+            for raw in folders:
+                self._children.setdefault(raw['id'], [])
+            for raw in folders:
+                if raw.get('parent_folder_id') in self._children:
+                    self._children[raw['parent_folder_id']].append(raw['id'])
+
+    def resolve(self, path: str) -> dict or None:
+        """ The folder at path, None when it isn't cached """
+        with self._lock:
+            folder_id = self._by_path.get(normalize_path(path))
+            if folder_id is None or not self._fresh(folder_id):
+                self.misses += 1
+                return None
+            self.hits += 1
+            return self._by_id[folder_id]
+
+    def chain(self, path: str) -> List[dict] or None:
+        """ Every folder from the root down to path, what the by_path endpoints return """
+        parts = normalize_path(path).split("/") if normalize_path(path) else []
+        with self._lock:
+            chain = []
+            for idx in range(len(parts) + 1):
+                folder_id = self._by_path.get("/".join(parts[:idx]))
+                if folder_id is None or not self._fresh(folder_id):
+                    self.misses += 1
+                    return None
+                chain.append(self._by_id[folder_id])
+            self.hits += 1
+            return chain
+
+    def children(self, folder_id: int) -> List[dict] or None:
+        """ The sub-folders of folder_id, None when they aren't cached """
+        with self._lock:
+            child_ids = self._children.get(folder_id)
+            if child_ids is None or not self._fresh(folder_id):
+                self.misses += 1
+                return None
+            self.hits += 1
+            return [self._by_id[child_id] for child_id in child_ids if child_id in self._by_id]
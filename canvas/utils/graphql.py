@@ -0,0 +1,188 @@
+""" GraphQL """
+# https://canvas.instructure.com/doc/api/file.graphql.html
+# Queries here return nodes that get converted to the same raw dict layout
+# the REST endpoints use, so they can be wrapped with the usual Entity classes.
+import datetime
+import re
+from typing import Any, Dict, List
+
+import dateutil.parser
+
+
+ASSIGNMENT_FIELDS = """
+    _id
+    name
+    description
+    dueAt
+    lockAt
+    unlockAt
+    pointsPossible
+    htmlUrl
+    state
+    createdAt
+    updatedAt
+    submissionTypes
+"""
+
+SUBMISSION_FIELDS = """
+    _id
+    score
+    grade
+    state
+    submittedAt
+    gradedAt
+    late
+    missing
+    user { _id }
+"""
+
+PAGE_INFO = "pageInfo { hasNextPage endCursor }"
+
+
+def courses_with_assignments_query(include_submissions: bool=False) -> str:
+    return f"""
+    query CoursesWithAssignments($first: Int) {{
+        allCourses {{
+            _id
+            name
+            courseCode
+            state
+            assignmentsConnection(first: $first) {{
+                nodes {{
+                    {ASSIGNMENT_FIELDS}
+                    {submissions_connection() if include_submissions else ''}
+                }}
+                {PAGE_INFO}
+            }}
+        }}
+    }}
+    """
+
+
+def course_assignments_query(include_submissions: bool=False) -> str:
+    return f"""
+    query CourseAssignments($courseId: ID!, $first: Int, $after: String) {{
+        course(id: $courseId) {{
+            assignmentsConnection(first: $first, after: $after) {{
+                nodes {{
+                    {ASSIGNMENT_FIELDS}
+                    {submissions_connection() if include_submissions else ''}
+                }}
+                {PAGE_INFO}
+            }}
+        }}
+    }}
+    """
+
+
+def assignments_by_course_query(count: int) -> str:
+    """ The assignments of `count` courses in one query, their ids go in $c0, $c1... """
+    params = ", ".join(f"$c{idx}: ID!" for idx in range(count))
+    courses = "".join(f"""
+        c{idx}: course(id: $c{idx}) {{
+            _id
+            assignmentsConnection(first: $first) {{
+                nodes {{ {ASSIGNMENT_FIELDS} }}
+                {PAGE_INFO}
+            }}
+        }}""" for idx in range(count))
+    return f"""
+    query AssignmentsByCourse($first: Int, {params}) {{{courses}
+    }}
+    """
+
+
+ASSIGNMENT_SUBMISSIONS_QUERY = f"""
+    query AssignmentSubmissions($assignmentId: ID!, $first: Int, $after: String) {{
+        assignment(id: $assignmentId) {{
+            submissionsConnection(first: $first, after: $after) {{
+                nodes {{ {SUBMISSION_FIELDS} }}
+                {PAGE_INFO}
+            }}
+        }}
+    }}
+"""
+
+
+def submissions_connection() -> str:
+    return f"""
+    submissionsConnection(first: $first) {{
+        nodes {{ {SUBMISSION_FIELDS} }}
+        {PAGE_INFO}
+    }}
+    """
+
+
+CAMEL_CASE = re.compile(r'(?<!^)(?=[A-Z])')
+
+
+def to_snake_case(key: str) -> str:
+    return CAMEL_CASE.sub('_', key).lower()
+
+
+def to_rest_datetime(value: Any) -> Any:
+    """ '2021-09-01T23:59:59-04:00' -> '2021-09-02T03:59:59Z', the format Entity turns into a Timestamp """
+    if not isinstance(value, str):
+        return value
+    try:
+        parsed = dateutil.parser.isoparse(value)
+    except ValueError:
+        return value
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return parsed.astimezone(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def node_to_raw(node: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Converts a graphql node to the REST layout
+        _id         -> id (int when numeric)
+        id          -> graphql_id (the relay id)
+        camelCase   -> snake_case
+        state       -> workflow_state
+        *_at        -> '%Y-%m-%dT%H:%M:%SZ' in UTC, like REST returns them
+    Connections ({'nodes': [...], 'pageInfo': {...}}) are left for the caller.
+    """
+    raw = {}
+    for key, val in node.items():
+        if key == '_id':
+            raw['id'] = int(val) if isinstance(val, str) and val.isdigit() else val
+        elif key == 'id':
+            raw['graphql_id'] = val
+        elif key == 'state':
+            raw['workflow_state'] = val
+        elif isinstance(val, dict) and 'nodes' not in val:
+            raw[to_snake_case(key)] = node_to_raw(val)
+        elif key.endswith('At'):
+            raw[to_snake_case(key)] = to_rest_datetime(val)
+        else:
+            raw[to_snake_case(key)] = val
+    return raw
+
+
+def assignment_to_raw(node: Dict[str, Any], course_id: int) -> Dict[str, Any]:
+    """ node_to_raw plus the keys REST derives for an assignment (course_id, published) """
+    raw = node_to_raw(node)
+    raw['course_id'] = course_id
+    if 'workflow_state' in raw:
+        raw['published'] = raw['workflow_state'] == 'published'
+    return raw
+
+
+def submission_to_raw(node: Dict[str, Any]) -> Dict[str, Any]:
+    raw = node_to_raw(node)
+    user = raw.pop('user', None) or {}
+    raw['user_id'] = user.get('id')
+    return raw
+
+
+def connection_nodes(connection: Dict or None) -> List[Dict]:
+    return (connection or {}).get('nodes') or []
+
+
+def connection_cursor(connection: Dict or None) -> str or None:
+    """ The cursor for the next page, None when there are no more pages """
+    page_info = (connection or {}).get('pageInfo') or {}
+    if page_info.get('hasNextPage'):
+        return page_info.get('endCursor')
+    return None
@@ -0,0 +1,200 @@
+""" iCalendar (.ics) feeds """
+# Every course carries a `calendar.ics` feed url, the feed is tokenized so it
+# doesn't need the access token and doesn't count against the REST rate limit.
+# https://canvas.instructure.com/doc/api/calendar_events.html
+import datetime
+import threading
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+import dateutil.tz
+
+
+TEXT_ESCAPES = {'n': '\n', 'N': '\n', ',': ',', ';': ';', '\\': '\\'}
+
+
+def unfold_lines(lines: Iterable[str]) -> Iterator[str]:
+    """ RFC 5545 3.1: long lines are folded with CRLF followed by a space or tab """
+    current = None
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        line = line.rstrip('\r\n')
+        # iter_lines yields an extra '' when a chunk ends between \r and \n,
+        # content lines are never empty so it can't end the line being folded
+        if not line:
+            continue
+        if line[:1] in (' ', '\t'):
+            if current is not None:
+                current += line[1:]
+            continue
+        if current is not None:
+            yield current
+        current = line
+    if current:
+        yield current
+
+
+def parse_content_line(line: str) -> Tuple[str, Dict[str, str], str]:
+    """ 'DTSTART;TZID=America/New_York:20210901T120000' -> ('DTSTART', {'TZID': ...}, '20210901T120000') """
+    in_quotes = False
+    for idx, char in enumerate(line):
+        if char == '"':
+            in_quotes = not in_quotes
+        elif char == ':' and not in_quotes:
+            head, value = line[:idx], line[idx + 1:]
+            break
+    else:
+        return line.upper(), {}, ''
+
+    name, *raw_params = head.split(';')
+    params = {}
+    for param in raw_params:
+        key, _, val = param.partition('=')
+        params[key.upper()] = val.strip('"')
+    return name.upper(), params, value
+
+
+def unescape_text(value: str) -> str:
+    out = []
+    chars = iter(value)
+    for char in chars:
+        if char == '\\':
+            nxt = next(chars, '')
+            out.append(TEXT_ESCAPES.get(nxt, nxt))
+        else:
+            out.append(char)
+    return ''.join(out)
+
+
+def ics_datetime(value: str, params: Dict[str, str]) -> Tuple[str, bool]:
+    """ Converts an ics DATE or DATE-TIME to the canvas format ('%Y-%m-%dT%H:%M:%SZ'), returns (value, is_all_day) """
+    if params.get('VALUE') == 'DATE' or len(value) == 8:
+        date = datetime.datetime.strptime(value[:8], '%Y%m%d')
+        return date.strftime('%Y-%m-%dT00:00:00Z'), True
+
+    if value.endswith('Z'):
+        date = datetime.datetime.strptime(value, '%Y%m%dT%H%M%SZ')
+    else:
+        tz = dateutil.tz.gettz(params['TZID']) if 'TZID' in params else None
+        date = datetime.datetime.strptime(value, '%Y%m%dT%H%M%S')
+        if tz is not None:
+            date = date.replace(tzinfo=tz).astimezone(dateutil.tz.UTC)
+    return date.strftime('%Y-%m-%dT%H:%M:%SZ'), False
+
+
+def event_to_raw(props: Dict[str, Tuple[Dict[str, str], str]], context_code: str=None) -> Dict:
+    """ Maps VEVENT properties onto the keys used by the REST CalendarEvent payload """
+    raw = {
+        'title': None,
+        'description': None,
+        'start_at': None,
+        'end_at': None,
+        'all_day': False,
+        'location_name': None,
+        'html_url': None,
+        'context_code': context_code,
+    }
+
+    # canvas uids look like 'event-assignment-123' or 'event-calendar-event-456'
+    uid = props.get('UID', ({}, ''))[1]
+    raw['uid'] = uid
+    object_id = uid.rsplit('-', 1)[-1]
+    if uid.startswith('event-assignment-'):
+        raw['id'] = f"assignment_{object_id}"
+        raw['type'] = 'assignment'
+    else:
+        raw['id'] = int(object_id) if object_id.isdigit() else uid
+        raw['type'] = 'event'
+
+    for name, key in (('SUMMARY', 'title'), ('DESCRIPTION', 'description'), ('LOCATION', 'location_name')):
+        if name in props:
+            raw[key] = unescape_text(props[name][1])
+    if 'URL' in props:
+        raw['html_url'] = props['URL'][1]
+
+    if 'DTSTART' in props:
+        raw['start_at'], raw['all_day'] = ics_datetime(props['DTSTART'][1], props['DTSTART'][0])
+        if raw['all_day']:
+            raw['all_day_date'] = raw['start_at'][:10]
+    if 'DTEND' in props:
+        raw['end_at'], _ = ics_datetime(props['DTEND'][1], props['DTEND'][0])
+    elif raw['start_at']:
+        raw['end_at'] = raw['start_at']
+
+    return raw
+
+
+def iter_events(lines: Iterable[str], context_code: str=None) -> Iterator[Dict]:
+    """
+    Streams VEVENT blocks out of the feed one at a time, so only the
+    event being parsed is held in memory.
+    """
+    props = None
+    depth = 0
+    for line in unfold_lines(lines):
+        if not line:
+            continue
+        name, params, value = parse_content_line(line)
+        if name == 'BEGIN':
+            if value.upper() == 'VEVENT':
+                props, depth = {}, 0
+            elif props is not None:
+                # nested components (VALARM) are skipped
+                depth += 1
+            continue
+        if name == 'END':
+            if props is not None and depth:
+                depth -= 1
+            elif props is not None and value.upper() == 'VEVENT':
+                yield event_to_raw(props, context_code=context_code)
+                props = None
+            continue
+        if props is not None and not depth and name not in props:
+            props[name] = (params, value)
+
+
+class FeedCache:
+    """
+    Parsed feed results keyed by feed url, validated with the feed's
+    ETag / Last-Modified so an unchanged feed costs one 304.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._feeds: Dict[str, Dict] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def validators(self, url: str) -> Dict[str, str]:
+        with self._lock:
+            cached = self._feeds.get(url)
+        if not cached:
+            return {}
+
+        headers = {}
+        if cached['etag']:
+            headers['If-None-Match'] = cached['etag']
+        if cached['last_modified']:
+            headers['If-Modified-Since'] = cached['last_modified']
+        return headers
+
+    def get(self, url: str) -> List[Dict] or None:
+        with self._lock:
+            cached = self._feeds.get(url)
+            if cached is None:
+                return None
+            self.hits += 1
+            return cached['events']
+
+    def put(self, url: str, events: List[Dict], etag: str=None, last_modified: str=None):
+        with self._lock:
+            self.misses += 1
+            if etag or last_modified:
+                self._feeds[url] = {'etag': etag, 'last_modified': last_modified, 'events': events}
+
+    def clear(self, url: str=None):
+        with self._lock:
+            if url is None:
+                self._feeds.clear()
+            else:
+                self._feeds.pop(url, None)
@@ -0,0 +1,398 @@
+""" Live Events """
+# https://canvas.instructure.com/doc/api/file.data_service_introduction.html
+# Canvas pushes Live Events (canvas or caliper format) to an endpoint, the
+# receiver here takes them in batches over HTTP (or straight from ingest),
+# maps them onto the entity classes and hands them to subscribers, so
+# change detection doesn't need polling.
+import hmac
+import http.server
+import json
+import re
+import threading
+from typing import Callable, Dict, Iterator, List, NamedTuple, Tuple
+
+from canvas.utils.graphql import to_rest_datetime
+from canvas.utils.models import (
+    Entity,
+    Announcement,
+    Assignment,
+    CalendarEvent,
+    Conversation,
+    Course,
+    File,
+    Folder,
+    PlannerAnnouncement,
+    PlannerAssignment,
+    PlannerCalendarEvent,
+    PlannerItem,
+)
+
+
+class LiveEvent(NamedTuple):
+    name: str
+    entity: Entity or None
+    metadata: Dict
+    body: Dict
+    # the planner's view of it, for events about things that show up in the planner
+    planner_item: PlannerItem or None = None
+
+
+def _assignment(body: Dict) -> Dict:
+    return {
+        'id': int(body['assignment_id']),
+        'course_id': int(body['context_id']) if body.get('context_type') == 'Course' else None,
+        'name': body.get('title'),
+        **{key: body.get(key) for key in (
+            'description', 'due_at', 'unlock_at', 'lock_at', 'points_possible',
+            'workflow_state', 'created_at', 'updated_at') if key in body},
+    }
+
+
+def _conversation(body: Dict) -> Dict:
+    raw = {'id': int(body['conversation_id'])}
+    if 'message_id' in body:
+        raw['last_message_id'] = int(body['message_id'])
+        raw['last_message_at'] = body.get('created_at')
+        raw['last_author_id'] = body.get('author_id')
+    if 'updated_at' in body:
+        raw['updated_at'] = body['updated_at']
+    return raw
+
+
+def _discussion_topic(body: Dict) -> Dict:
+    return {
+        'id': int(body['discussion_topic_id']),
+        **{key: body.get(key) for key in (
+            'title', 'body', 'context_id', 'context_type', 'is_announcement',
+            'workflow_state', 'created_at', 'updated_at') if key in body},
+    }
+
+
+def _attachment(body: Dict) -> Dict:
+    return {
+        'id': int(body['attachment_id']),
+        'content-type': body.get('content_type'),
+        **{key: body.get(key) for key in (
+            'filename', 'display_name', 'folder_id', 'context_id', 'context_type',
+            'created_at', 'updated_at') if key in body},
+    }
+
+
+def _course(body: Dict) -> Dict:
+    return {
+        'id': int(body['course_id']),
+        **{key: body.get(key) for key in (
+            'name', 'uuid', 'account_id', 'workflow_state', 'created_at', 'updated_at') if key in body},
+    }
+
+
+def _folder(body: Dict) -> Dict:
+    return {
+        'id': int(body['folder_id']),
+        **{key: body.get(key) for key in (
+            'name', 'parent_folder_id', 'context_id', 'context_type', 'created_at', 'updated_at') if key in body},
+    }
+
+
+def _calendar_event(body: Dict) -> Dict:
+    return {
+        'id': int(body['calendar_event_id']),
+        **{key: body.get(key) for key in (
+            'title', 'description', 'start_at', 'end_at', 'location_name', 'context_id', 'context_type',
+            'workflow_state', 'created_at', 'updated_at') if key in body},
+    }
+
+
+# event name prefix -> (Entity class, body -> raw in the REST layout)
+EVENT_ENTITIES: Dict[str, Tuple[type, Callable[[Dict], Dict]]] = {
+    'assignment_': (Assignment, _assignment),
+    'conversation_': (Conversation, _conversation),
+    'discussion_topic_': (Entity, _discussion_topic),
+    'attachment_': (File, _attachment),
+    'course_': (Course, _course),
+    'folder_': (Folder, _folder),
+    'calendar_event_': (CalendarEvent, _calendar_event),
+}
+
+
+def to_entity(name: str, body: Dict, client=None) -> Entity or None:
+    for prefix, (entity, to_raw) in EVENT_ENTITIES.items():
+        if name.startswith(prefix):
+            try:
+                raw = to_raw(body)
+            except (KeyError, TypeError, ValueError):
+                return None
+            if entity is Entity and raw.get('is_announcement'):
+                entity = Announcement
+            return entity(raw=raw, client=client)
+    return None
+
+
+# event name prefix -> (PlannerItem class, plannable_type, raw keys for plannable_date in order of preference)
+PLANNABLES: Dict[str, Tuple[type, str, Tuple[str, ...]]] = {
+    'assignment_': (PlannerAssignment, 'assignment', ('due_at', 'created_at')),
+    'discussion_topic_': (PlannerItem, 'discussion_topic', ('todo_date', 'created_at')),
+    'calendar_event_': (PlannerCalendarEvent, 'calendar_event', ('start_at',)),
+}
+
+
+def to_planner_item(name: str, entity: Entity or None, client=None) -> PlannerItem or None:
+    """ The event's entity in the layout of get_planner_items, for the kinds the planner shows """
+    if entity is None:
+        return None
+    prefix = next((prefix for prefix in PLANNABLES if name.startswith(prefix)), None)
+    if prefix is None:
+        return None
+    planner_item, plannable_type, date_keys = PLANNABLES[prefix]
+    if isinstance(entity, Announcement):
+        planner_item, plannable_type, date_keys = PlannerAnnouncement, 'announcement', ('posted_at', 'created_at')
+
+    raw = entity._raw
+    course_id = raw.get('course_id')
+    if course_id is None and raw.get('context_type') == 'Course' and raw.get('context_id') is not None:
+        course_id = int(raw['context_id'])
+    item = {
+        'plannable_id': raw['id'],
+        'plannable_type': plannable_type,
+        'plannable_date': next((raw[key] for key in date_keys if raw.get(key)), None),
+        'plannable': {key: val for key, val in raw.items() if key != 'course_id'},
+    }
+    if course_id is not None:
+        item['course_id'] = course_id
+        item['context_type'] = 'Course'
+    if 'name' in raw:
+        item['plannable']['title'] = raw['name']
+    return planner_item(raw=item, client=client)
+
+
+# caliper object type -> the canvas event name prefix (without '_')
+CALIPER_TYPES = {
+    'Assessment': 'assignment',
+    'AssignableDigitalResource': 'assignment',
+    'Document': 'attachment',
+    'CourseOffering': 'course',
+    'Thread': 'discussion_topic',
+}
+# the kind in a caliper object id ('urn:instructure:canvas:assignment:123') -> prefix
+CALIPER_URN_KINDS = {
+    'assignment': 'assignment',
+    'attachment': 'attachment',
+    'course': 'course',
+    'conversation': 'conversation',
+    'discussion': 'discussion_topic',
+    'discussionTopic': 'discussion_topic',
+    'folder': 'folder',
+    'calendarEvent': 'calendar_event',
+}
+CALIPER_ACTIONS = {'Modified': 'updated'}
+# caliper object field -> canvas event body field
+CALIPER_FIELDS = {
+    'name': 'title',
+    'description': 'description',
+    'dateCreated': 'created_at',
+    'dateModified': 'updated_at',
+    'dateToSubmit': 'due_at',
+    'dateToStartOn': 'unlock_at',
+    'maxScore': 'points_possible',
+    'mediaType': 'content_type',
+}
+CANVAS_URN = re.compile(r'^urn:instructure:canvas:([A-Za-z]+):(\d+)$')
+
+
+def caliper_event(item: Dict) -> Tuple[str, Dict, Dict]:
+    """
+    (event_name, metadata, body) of one caliper event, with the name and the body
+    in the canvas format ('assignment_updated', {'assignment_id': ..., 'due_at': ...})
+    so subscriptions and the entity mapping work the same for both formats.
+    """
+    obj = item.get('object') or {}
+    metadata = (item.get('extensions') or {}).get('com.instructure.canvas') or {}
+    object_extension = (obj.get('extensions') or {}).get('com.instructure.canvas') or {}
+
+    match = CANVAS_URN.match(str(obj.get('id') or ''))
+    kind = CALIPER_URN_KINDS.get(match.group(1)) if match else None
+    kind = kind or CALIPER_TYPES.get(obj.get('type'))
+    entity_id = object_extension.get('entity_id') or (match.group(2) if match else None)
+
+    action = item.get('action') or ''
+    if kind is None:
+        return f"{item.get('type', '')}.{action}", metadata, dict(obj)
+    action = CALIPER_ACTIONS.get(action, re.sub(r'(?<!^)(?=[A-Z])', '_', action).lower())
+
+    body = {CALIPER_FIELDS.get(key, key): val
+            for key, val in obj.items() if key not in ('id', 'type', 'extensions', 'isPartOf')}
+    body.update(object_extension)
+    # caliper dates carry milliseconds ('...:10.000Z')
+    body = {key: to_rest_datetime(val) if key.endswith('_at') else val for key, val in body.items()}
+    if 'title' in body:
+        body.setdefault('name', body['title'])
+        body.setdefault('display_name', body['title'])
+    if entity_id is not None:
+        body[f"{kind}_id"] = entity_id
+
+    # the course it belongs to, 'isPartOf': {'id': 'urn:instructure:canvas:course:123', ...}
+    parent = CANVAS_URN.match(str((obj.get('isPartOf') or {}).get('id') or ''))
+    if parent and parent.group(1) == 'course':
+        body.setdefault('context_type', 'Course')
+        body.setdefault('context_id', parent.group(2))
+    return f"{kind}_{action}", metadata, body
+
+
+def iter_events(payload) -> Iterator[Tuple[str, Dict, Dict]]:
+    """
+    Yields (event_name, metadata, body) from any of the shapes events arrive in:
+    a canvas event ({'metadata', 'body'}), a caliper envelope ({'data': [...]}),
+    a list of either, or newline delimited json.
+    Raises ValueError for anything else.
+    """
+    if isinstance(payload, (bytes, str)):
+        text = payload.decode('utf-8') if isinstance(payload, bytes) else payload
+        try:
+            payload = json.loads(text)
+        except json.JSONDecodeError:
+            payload = [json.loads(line) for line in text.splitlines() if line.strip()]
+
+    if isinstance(payload, list):
+        for item in payload:
+            yield from iter_events(item)
+        return
+    if not isinstance(payload, dict):
+        raise ValueError(f"expected a live event object, got {type(payload).__name__}")
+
+    if 'data' in payload and isinstance(payload['data'], list):
+        for item in payload['data']:
+            if not isinstance(item, dict):
+                raise ValueError(f"expected a caliper event object, got {type(item).__name__}")
+            yield caliper_event(item)
+        return
+
+    metadata = payload.get('metadata')
+    body = payload.get('body')
+    metadata = {} if metadata is None else metadata
+    body = {} if body is None else body
+    if not isinstance(metadata, dict) or not isinstance(body, dict):
+        raise ValueError("a live event's metadata and body have to be objects")
+    yield metadata.get('event_name', ''), metadata, body
+
+
+class LiveEventsReceiver:
+    """
+    :Parameters
+        client: CANVAS_REST the entities are attached to, its caches are updated as events come in
+        host, port: where to listen, port 0 picks a free one (see address)
+        token: when set, requests need 'Authorization: Bearer <token>'
+
+    :Usage
+        receiver = LiveEventsReceiver(client=api, port=8080, token="...")
+        receiver.subscribe("assignment_updated", lambda event: print(event.entity.name, event.entity.due_at))
+        receiver.subscribe("*", log_event)
+        receiver.subscribe("assignment_*", lambda event: refresh(event.planner_item))
+        receiver.start()
+        # or without http: receiver.ingest(fixture_events)
+    """
+
+    def __init__(self, client=None, host: str='127.0.0.1', port: int=0, token: str=None):
+        self.client = client
+        self.host = host
+        self.port = port
+        self.token = token
+
+        self._lock = threading.Lock()
+        self._subscribers: Dict[str, List[Callable[[LiveEvent], None]]] = {}
+        self._server: http.server.ThreadingHTTPServer = None
+        self._thread: threading.Thread = None
+        self.received = 0
+        self.errors = 0
+
+    def subscribe(self, event_name: str, callback: Callable[[LiveEvent], None]) -> Callable[[], None]:
+        """ event_name: exact name ('assignment_updated'), a prefix ending in '*' ('assignment_*'), or '*' """
+        with self._lock:
+            self._subscribers.setdefault(event_name, []).append(callback)
+
+        def unsubscribe():
+            with self._lock:
+                callbacks = self._subscribers.get(event_name, [])
+                if callback in callbacks:
+                    callbacks.remove(callback)
+        return unsubscribe
+
+    def _callbacks(self, name: str) -> List[Callable]:
+        with self._lock:
+            return [callback
+                    for pattern, callbacks in self._subscribers.items()
+                    if pattern == name or (pattern.endswith('*') and name.startswith(pattern[:-1]))
+                    for callback in callbacks]
+
+    def _update_caches(self, event: LiveEvent):
+        if self.client is None or event.entity is None:
+            return
+        if isinstance(event.entity, Folder):
+            parent_id = event.entity._raw.get('parent_folder_id')
+            for index in list(self.client._folder_indexes.values()):
+                index.invalidate(event.entity.id)
+                if parent_id is not None:
+                    index.invalidate(parent_id)
+
+    def ingest(self, payload) -> int:
+        """
+        Dispatches every event in payload, returns how many there were.
+        The whole batch is read before anything is dispatched, so a malformed one
+        raises ValueError without delivering the events before it (the sender
+        retries the batch, they'd be delivered twice).
+        """
+        events = []
+        for name, metadata, body in iter_events(payload):
+            entity = to_entity(name, body, client=self.client)
+            events.append(LiveEvent(name, entity, metadata, body, to_planner_item(name, entity, client=self.client)))
+
+        for event in events:
+            self._update_caches(event)
+            for callback in self._callbacks(event.name):
+                try:
+                    callback(event)
+                except Exception:
+                    with self._lock:
+                        self.errors += 1
+        with self._lock:
+            self.received += len(events)
+        return len(events)
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        return self._server.server_address if self._server else (self.host, self.port)
+
+    def start(self) -> threading.Thread:
+        receiver = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_POST(self):
+                authorization = self.headers.get('Authorization') or ''
+                if receiver.token and not hmac.compare_digest(
+                        authorization.encode(), f"Bearer {receiver.token}".encode()):
+                    self.send_response(401)
+                    self.end_headers()
+                    return
+                try:
+                    body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                    receiver.ingest(body)
+                except (ValueError, TypeError, AttributeError):
+                    self.send_response(400)
+                    self.end_headers()
+                    return
+                self.send_response(204)
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self._server = http.server.ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name="canvas-live-events", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
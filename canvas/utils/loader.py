@@ -0,0 +1,323 @@
+""" Batched Relation Loading """
+# Following a relation on many entities one by one (folder.files() for
+# every folder, item.mark_complete() for every item...) is one request each.
+# A RelationLoader queues those loads instead, and on dispatch resolves the
+# whole queue with as few list calls as it can, concurrently: the files of
+# many folders of a course come from one listing of the course's files, the
+# courses of many planner items from one get_courses. A whole context listing
+# can be many pages, so it's only used from BATCH_THRESHOLDS entities of one
+# context. Results are cached for the loader's lifetime, so make one per unit
+# of work (a page render, a job).
+#
+#   with api.loader() as loader:
+#       files = loader.load_many(folders, 'files')          # [[File...], [File...], ...]
+#       courses = loader.load_many(planner_items, 'course')
+#
+#   # or queue from several places and resolve together
+#   pending = [loader.load(folder, 'folders') for folder in folders]
+#   loader.dispatch()
+#   subfolders = [p.result() for p in pending]
+import functools
+import threading
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Tuple
+
+from requests.exceptions import HTTPError
+
+from canvas.utils import map_concurrently
+from canvas.utils.models import Assignment, Course, Entity, File, Folder, PlannerItem
+
+
+CONTEXT_PATHS = {'Course': 'courses', 'User': 'users', 'Group': 'groups'}
+
+# from how many entities of one context its whole listing is used instead of one request each:
+# /courses is a page or two, a course's files or folders can be dozens of pages
+BATCH_THRESHOLDS = {'course': 3, 'files': 10, 'folders': 10}
+
+
+class Pending:
+    """ The result of a queued load, result() dispatches the queue if it hasn't been yet """
+    __slots__ = ('_loader', '_done', '_value', '_error')
+
+    def __init__(self, loader: 'RelationLoader'):
+        self._loader = loader
+        self._done = threading.Event()
+        self._value = None
+        self._error = None
+
+    def _resolve(self, value: Any=None, error: Exception=None):
+        self._value, self._error = value, error
+        self._done.set()
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def result(self) -> Any:
+        if not self._done.is_set():
+            self._loader.dispatch()
+            # another thread's dispatch may have taken it off the queue
+            self._done.wait()
+        if self._error is not None:
+            raise self._error
+        return self._value
+
+
+def _reraise(error: Exception):
+    raise error
+
+
+def course_id_of(entity: Entity) -> int or None:
+    raw = entity._raw
+    if isinstance(entity, Course):
+        return raw.get('id')
+    if raw.get('course_id') is not None:
+        return raw['course_id']
+    context_code = raw.get('context_code') or ''
+    if context_code.startswith('course_'):
+        return int(context_code[len('course_'):])
+    return None
+
+
+def folder_context(folder: Folder) -> str or None:
+    """ '/courses/123' for a course folder """
+    context_path = CONTEXT_PATHS.get(folder._raw.get('context_type'))
+    if context_path is None or folder._raw.get('context_id') is None:
+        return None
+    return f"/{context_path}/{folder._raw['context_id']}"
+
+
+class RelationLoader:
+    """
+    :Parameters
+        client: CANVAS_REST
+        max_workers: requests in flight at the same time during a dispatch
+        batch_threshold: from how many entities of one context a whole context listing
+            is used instead of one request per entity, one number for every relation or
+            {relation: number} over BATCH_THRESHOLDS (the default)
+
+    :Relations
+        'course':      the Course of anything with a course_id / context_code
+        'assignments': the Assignments of a Course, each course's listing once, concurrently
+        'files':       the Files in a Folder
+        'folders':     the sub-Folders of a Folder (also fills the client's folder index)
+    """
+
+    def __init__(self, client, max_workers: int=8, batch_threshold: int or Dict[str, int]=None):
+        self.client = client
+        self.max_workers = max_workers
+        if isinstance(batch_threshold, int):
+            batch_threshold = {relation: batch_threshold for relation in BATCH_THRESHOLDS}
+        self.batch_thresholds = {**BATCH_THRESHOLDS, **(batch_threshold or {})}
+
+        self._lock = threading.RLock()
+        # (relation, key) -> (entity, [Pending])
+        self._queue: Dict[Tuple[str, Hashable], Tuple[Entity, List[Pending]]] = {}
+        self._cache: Dict[Tuple[str, Hashable], Any] = {}
+        self._writes: Dict[Hashable, Tuple[PlannerItem, bool, List[Pending]]] = {}
+        self.loads = 0
+        self.cache_hits = 0
+        self.requests = 0
+
+        self._batchers: Dict[str, Callable] = {
+            'course': self._batch_courses,
+            'assignments': self._batch_assignments,
+            'files': self._batch_folder_listing('files'),
+            'folders': self._batch_folder_listing('folders'),
+        }
+        self._keys: Dict[str, Callable[[Entity], Hashable]] = {
+            'course': course_id_of,
+            'assignments': lambda course: course._raw.get('id'),
+            'files': lambda folder: folder._raw.get('id'),
+            'folders': lambda folder: folder._raw.get('id'),
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if exc[0] is None:
+            self.dispatch()
+
+    def load(self, entity: Entity, relation: str) -> Pending:
+        if relation not in self._batchers:
+            raise ValueError(f"unknown relation '{relation}', expected one of {list(self._batchers)}")
+        key = self._keys[relation](entity)
+        pending = Pending(self)
+        with self._lock:
+            self.loads += 1
+            if key is None:
+                pending._resolve(None)
+            elif (relation, key) in self._cache:
+                self.cache_hits += 1
+                pending._resolve(self._cache[(relation, key)])
+            else:
+                self._queue.setdefault((relation, key), (entity, []))[1].append(pending)
+        return pending
+
+    def load_many(self, entities: Iterable[Entity], relation: str) -> List[Any]:
+        pending = [self.load(entity, relation) for entity in entities]
+        self.dispatch()
+        return [item.result() for item in pending]
+
+    def mark_complete(self, item: PlannerItem, side: bool=True) -> Pending:
+        """ Queues PlannerItem.mark_complete, items without an override get one created """
+        key = (item._raw.get('plannable_type'), item._raw.get('plannable_id'))
+        pending = Pending(self)
+        with self._lock:
+            previous = self._writes.get(key)
+            waiting = previous[2] if previous else []
+            waiting.append(pending)
+            # the last call for an item wins
+            self._writes[key] = (item, side, waiting)
+        return pending
+
+    def dispatch(self):
+        """ Resolves everything queued so far, a failed load fails the loads it was for """
+        with self._lock:
+            queue, self._queue = self._queue, {}
+            writes, self._writes = self._writes, {}
+
+        error = None
+        try:
+            self._dispatch(queue, writes)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            # whatever went wrong, nobody is left waiting on a result that won't come
+            for _, waiting in list(queue.values()) + [(None, waiting) for _, _, waiting in writes.values()]:
+                for pending in waiting:
+                    if not pending.done:
+                        pending._resolve(None, error or RuntimeError("the load wasn't resolved"))
+
+    def _dispatch(self, queue: Dict, writes: Dict):
+        by_relation: Dict[str, Dict[Hashable, Entity]] = {}
+        for (relation, key), (entity, _) in queue.items():
+            by_relation.setdefault(relation, {})[key] = entity
+
+        # (relation, keys it resolves, fn returning {key: value})
+        jobs: List[Tuple[str, List[Hashable], Callable[[], Dict]]] = []
+        for relation, entities in by_relation.items():
+            try:
+                jobs.extend((relation, keys, fn) for keys, fn in self._batchers[relation](entities))
+            except Exception as e:
+                jobs.append((relation, list(entities), functools.partial(_reraise, e)))
+        for key, (item, side, _) in writes.items():
+            jobs.append(('mark_complete', [key], lambda item=item, side=side, key=key: {key: self._mark_complete(item, side)}))
+
+        for (relation, keys, _), values, error in map_concurrently(lambda job: job[2](), jobs, max_workers=self.max_workers):
+            if error is None and not isinstance(values, dict):
+                error = TypeError(f"the '{relation}' batch returned {type(values).__name__}, not a dict")
+            for key in keys:
+                if relation == 'mark_complete':
+                    waiting = writes[key][2]
+                else:
+                    waiting = queue[(relation, key)][1]
+                    if error is None:
+                        with self._lock:
+                            self._cache[(relation, key)] = values.get(key)
+                for pending in waiting:
+                    pending._resolve(values.get(key) if error is None else None, error)
+
+    def _count(self, requests: int=1):
+        with self._lock:
+            self.requests += requests
+
+    def _list(self, path: str, data: Dict=None) -> List[Dict]:
+        rows = []
+        for page in self.client.iter_pages(path=path, data={"per_page": 100, **(data or {})}):
+            self._count()
+            rows.extend(page)
+        return rows
+
+    def _batch_courses(self, entities: Dict[int, Entity]):
+        course_ids = list(entities)
+
+        def one(course_id: int) -> Dict:
+            self._count()
+            return {course_id: Course(raw=self.client.get(f"/courses/{course_id}"), client=self.client)}
+
+        if len(course_ids) < self.batch_thresholds['course']:
+            return [([course_id], lambda course_id=course_id: one(course_id)) for course_id in course_ids]
+
+        def listing() -> Dict:
+            courses = {raw['id']: Course(raw=raw, client=self.client) for raw in self._list("/courses")}
+            # concluded courses aren't in the listing
+            missing = [course_id for course_id in course_ids if course_id not in courses]
+            for course_id, found, error in map_concurrently(one, missing, max_workers=self.max_workers):
+                if error is not None:
+                    raise error
+                courses.update(found)
+            return courses
+        return [(course_ids, listing)]
+
+    def _batch_assignments(self, entities: Dict[int, Course]):
+        """
+        One listing per course. There's no REST listing across courses, and GraphQL
+        nodes don't carry everything the REST assignment has, so batching would change
+        the result: what the loader adds is running them concurrently and only once.
+        """
+        def one(course_id: int) -> Dict:
+            return {course_id: [Assignment(raw=raw, client=self.client)
+                                for raw in self._list(f"/courses/{course_id}/assignments")]}
+
+        return [([course_id], lambda course_id=course_id: one(course_id)) for course_id in entities]
+
+    def _batch_folder_listing(self, relation: str):
+        """ 'files' or 'folders' of many folders, one listing per context, grouped by folder """
+        entity, parent_key = (File, 'folder_id') if relation == 'files' else (Folder, 'parent_folder_id')
+
+        def one(folder_id: int) -> Dict:
+            return {folder_id: [entity(raw=raw, client=self.client)
+                                for raw in self._list(f"/folders/{folder_id}/{relation}")]}
+
+        def context_listing(context: str, folder_ids: List[int]) -> Dict:
+            from canvas.utils.rest import APIError
+            try:
+                rows = self._list(f"{context}/{relation}")
+            except (APIError, HTTPError):
+                # listing a whole course's files needs more rights than one folder's
+                found = {}
+                for folder_id, result, error in map_concurrently(one, folder_ids, max_workers=self.max_workers):
+                    if error is not None:
+                        raise error
+                    found.update(result)
+                return found
+
+            if relation == 'folders' and context.startswith("/courses/"):
+                self.client._folder_index(context).load(rows)
+            grouped = {folder_id: [] for folder_id in folder_ids}
+            for raw in rows:
+                if raw.get(parent_key) in grouped:
+                    grouped[raw[parent_key]].append(entity(raw=raw, client=self.client))
+            return grouped
+
+        def batcher(entities: Dict[int, Folder]):
+            by_context: Dict[str, List[int]] = {}
+            for folder_id, folder in entities.items():
+                by_context.setdefault(folder_context(folder), []).append(folder_id)
+
+            jobs = []
+            for context, folder_ids in by_context.items():
+                if context is None or len(folder_ids) < self.batch_thresholds[relation]:
+                    jobs.extend(([folder_id], lambda folder_id=folder_id: one(folder_id)) for folder_id in folder_ids)
+                else:
+                    jobs.append((folder_ids, lambda context=context, folder_ids=folder_ids: context_listing(context, folder_ids)))
+            return jobs
+        return batcher
+
+    def _mark_complete(self, item: PlannerItem, side: bool) -> Dict:
+        self._count()
+        override = item._raw.get('planner_override')
+        if override:
+            return self.client.update_planner_overrides(override['id'], {"marked_complete": side})
+        return self.client.create_planner_overrides({
+            "plannable_type": item._raw.get('plannable_type'),
+            "plannable_id": item._raw.get('plannable_id'),
+            "marked_complete": side,
+        })
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"loads": self.loads, "cache_hits": self.cache_hits, "requests": self.requests}
@@ -13,6 +13,14 @@ class IllegalArgumentError(ValueError):
 ISO8601YMD = re.compile(r'\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}Z')
 
 
+def project_raw(raw: dict, fields: List[str]=None, keep: List[str]=None) -> dict:
+    """ Copies only the given fields (plus 'id' and keep) out of raw, returns raw as is when fields is None """
+    if fields is None:
+        return raw
+    wanted = {'id', *fields, *(keep or [])}
+    return {key: val for key, val in raw.items() if key in wanted}
+
+
 class Entity:
     '''  This helper class provides property access (the "dot notation")
     to the json object, backed by the original object stored in the _raw
@@ -111,6 +119,19 @@ class Course(Entity):
         raise NotImplementedError
     def todo(self):
         raise NotImplementedError
+
+    def assignments(self) -> List['Assignment']:
+        """ Uses the assignments prefetched by get_courses_with_assignments when present """
+        if 'assignments' in self._raw:
+            return [Assignment(raw=raw, client=self.client) for raw in self._raw['assignments']]
+        return self.client.get_assignments(course_id=self.id)
+
+    def calendar_events(self) -> List['CalendarEvent']:
+        """ Events from the course's iCalendar feed, doesn't use the REST rate limit """
+        feed_url = (self._raw.get('calendar') or {}).get('ics')
+        if not feed_url:
+            return []
+        return self.client.get_calendar_feed(feed_url, context_code=f"course_{self.id}")
     
 
 
@@ -178,6 +199,12 @@ class PlannerItem(Entity):
 
         self.client.mark_complete(override_id=self.planner_override.id, side=side)
 
+    def discussion_view(self, since: str=None):
+        """ The full thread of an announcement or discussion planner item, see CANVAS_REST.get_discussion_view """
+        if self._raw.get('plannable_type') not in ('announcement', 'discussion_topic'):
+            raise IllegalArgumentError(f"{self._raw.get('plannable_type')} planner items don't have a discussion")
+        return self.client.get_discussion_view(self._raw['course_id'], self._raw['plannable_id'], since=since)
+
 class PlannerNote(PlannerItem):
     pass
 
@@ -198,6 +225,12 @@ class PlannerAssignment(PlannerItem):
 class Assignment(Entity):
     """Don't need to use"""
     pass
+class Submission(Entity):
+    pass
+class StudentSubmissions(Entity):
+    """ One student's submissions, from get_submissions(grouped=True) """
+    def submissions(self) -> List[Submission]:
+        return [Submission(raw=raw, client=self.client) for raw in self._raw.get('submissions') or []]
 class PlannerAnnouncement(PlannerItem):
     pass
 class Announcement(Entity):
@@ -224,6 +257,10 @@ class User(Entity):
 class Profile(Entity):
     pass
 
+class Report(Entity):
+    """ An account report, the CSV is at attachment['url'] once status is 'complete' """
+    pass
+
 
 """ File/Folder """
 class Folder(Entity):
@@ -258,7 +295,8 @@ class Folder(Entity):
     def files(self) -> List['File']:
         return self.client.get_files(folder_id=self.id)
 
-    def download(self, folder_name: str=None):
+    def download(self, folder_name: str=None, store=None):
+        """ store: BlobStore, defaults to the client's download_store """
         roots = ['my files', 'course files']
 
         folder_name = folder_name
@@ -270,7 +308,7 @@ class Folder(Entity):
             os.makedirs(folder_name)
 
         for file in self.files():
-            file.download(file_directory=folder_name)
+            file.download(file_directory=folder_name, store=store)
 
 class File(Entity):
     """
@@ -298,7 +336,12 @@ class File(Entity):
         'uuid': 'bHJljveHhfPSMWFpMHEeiQ8yTGVmRDvsbIjs42mT'
     }
     """
-    def download(self, file_directory: str=None, mode='wb'):
+    def download(self, file_directory: str=None, mode='wb', store=None):
+        """
+        store: BlobStore (canvas.utils.store), defaults to the client's download_store.
+            With a store the content is kept once and hardlinked into file_directory,
+            a file whose uuid is already in the store doesn't use the network.
+        """
         file_directory = file_directory
         if not file_directory:
             file_directory = 'tmp/'
@@ -308,6 +351,31 @@ class File(Entity):
             os.makedirs(file)
         file += self.filename
 
+        if store is None and self.client is not None:
+            store = getattr(self.client, '_download_store', None)
+
+        if store is not None:
+            def fetch() -> str:
+                with self.client._send('GET', self.url, stream=True) as r:
+                    r.raise_for_status()
+                    return store.add(r.iter_content(chunk_size=1 << 16), uuid=self._raw.get('uuid'), pin=True)
+
+            # pinned so it can't be evicted before it's linked
+            sha256 = store.lookup(self._raw.get('uuid'), pin=True) or fetch()
+            try:
+                store.link(sha256, file)
+            except FileNotFoundError:
+                # evicted by another process sharing the store
+                store.unpin(sha256)
+                sha256 = None
+                sha256 = fetch()
+                store.link(sha256, file)
+            finally:
+                if sha256 is not None:
+                    store.unpin(sha256)
+            print("Successfully linked file:", file)
+            return
+
         r = requests.get(self.url)
         with open(file=file, mode=mode) as f:
             f.write(r.content)
@@ -0,0 +1,179 @@
+""" Rate Limits """
+# https://canvas.instructure.com/doc/api/file.throttling.html
+# Canvas gives every access token a bucket of about 700 units that refills
+# at about 10 units a second, each request costs X-Request-Cost units and
+# X-Rate-Limit-Remaining reports what's left.
+#   TokenBucket:      within one process
+#   SharedRateBudget: across processes on one machine (SQLite), for a fleet
+#                     of workers using the same token
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from urllib.parse import urlparse
+
+
+class TokenBucket:
+    """
+    In-process token bucket shared by any number of threads/clients.
+        rate:     tokens added per second
+        capacity: most tokens that can be saved up (the burst size)
+    """
+
+    def __init__(self, rate: float, capacity: float=None):
+        if rate <= 0:
+            raise ValueError("rate must be greater than 0")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._cond = threading.Condition()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, cost: float=1, timeout: float=None) -> bool:
+        """ Blocks until cost tokens are available, returns False if timeout ran out first """
+        cost = min(cost, self.capacity)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                self._refill()
+                if self._tokens >= cost:
+                    self._tokens -= cost
+                    return True
+
+                wait = (cost - self._tokens) / self.rate
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    wait = min(wait, remaining)
+                self._cond.wait(wait)
+
+    @property
+    def available(self) -> float:
+        with self._cond:
+            self._refill()
+            return self._tokens
+
+
+class SharedRateBudget:
+    """
+    A token bucket per (access token, host) kept in a SQLite file, so every process
+    on the machine that uses it spends from the same budget. Pass it as
+    CANVAS_REST(rate_budget=...): requests wait for the estimated cost before they
+    are sent, and the bucket is lowered to what X-Rate-Limit-Remaining reports
+    (minus reserve) after each response, so the other processes see it too.
+
+    :Parameters
+        path: the SQLite file (default: canvas-rate-budget.sqlite3 in the temp directory)
+        rate: units added per second
+        capacity: most units that can be saved up
+        reserve: units left unspent below what Canvas reports, for requests in flight
+    Tokens are only stored hashed.
+    """
+
+    def __init__(self, path: str=None, rate: float=10.0, capacity: float=600.0, reserve: float=50.0):
+        if rate <= 0:
+            raise ValueError("rate must be greater than 0")
+        self.path = path or os.path.join(tempfile.gettempdir(), "canvas-rate-budget.sqlite3")
+        self.rate = rate
+        self.capacity = capacity
+        self.reserve = reserve
+
+        self._lock = threading.Lock()
+        # autocommit, transactions are opened with BEGIN IMMEDIATE to lock out other processes
+        self._db = sqlite3.connect(self.path, check_same_thread=False, timeout=30, isolation_level=None)
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS buckets (
+                    key TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    cost REAL NOT NULL,
+                    updated REAL NOT NULL)""")
+
+    @staticmethod
+    def key(access_token: str, url: str) -> str:
+        return hashlib.sha256(access_token.encode('utf-8')).hexdigest()[:32] + "@" + urlparse(url).netloc
+
+    def _transaction(self, fn):
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn()
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+            return result
+
+    def _load(self, key: str):
+        """ (tokens refilled up to now, average cost), the row is created full """
+        # wall clock, monotonic clocks aren't comparable between processes
+        now = time.time()
+        row = self._db.execute("SELECT tokens, cost, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return self.capacity, 1.0, now
+        tokens, cost, updated = row
+        return min(self.capacity, tokens + max(0.0, now - updated) * self.rate), cost, now
+
+    def _store(self, key: str, tokens: float, cost: float, now: float):
+        self._db.execute(
+            "INSERT OR REPLACE INTO buckets (key, tokens, cost, updated) VALUES (?, ?, ?, ?)",
+            (key, tokens, cost, now))
+
+    def acquire(self, key: str, cost: float=None, timeout: float=None) -> bool:
+        """
+        Blocks until cost units (default: the average X-Request-Cost seen for key) are available,
+        returns False if timeout ran out first
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            def take():
+                tokens, average, now = self._load(key)
+                needed = min(cost if cost is not None else average, self.capacity)
+                if tokens >= needed:
+                    self._store(key, tokens - needed, average, now)
+                    return 0.0
+                self._store(key, tokens, average, now)
+                return (needed - tokens) / self.rate
+
+            wait = self._transaction(take)
+            if wait <= 0:
+                return True
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(wait)
+
+    def observe(self, key: str, remaining: float=None, cost: float=None):
+        """ Updates the bucket from a response's X-Rate-Limit-Remaining and X-Request-Cost """
+        if remaining is None and cost is None:
+            return
+
+        def update():
+            tokens, average, now = self._load(key)
+            if remaining is not None:
+                # below the reserve the bucket is empty, not in debt: a negative balance
+                # would hold every process back for longer than the refill actually takes
+                tokens = max(0.0, min(tokens, remaining - self.reserve))
+            if cost is not None:
+                average = 0.8 * average + 0.2 * cost
+            self._store(key, tokens, average, now)
+        self._transaction(update)
+
+    def available(self, key: str) -> float:
+        with self._lock:
+            return self._load(key)[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,36 @@
+""" Account Reports """
+# https://canvas.instructure.com/doc/api/account_reports.html
+# A report is started, compiled by Canvas in the background, and the result
+# is a CSV attachment. These helpers cover the client side: how long to wait
+# between progress checks, and reading the (often very large) CSV lazily.
+import csv
+from typing import Dict, Iterator, List
+
+from canvas.utils import to_columns
+
+
+# report status values
+FINISHED = {'complete'}
+FAILED = {'error', 'aborted', 'deleted'}
+
+
+def backoff_delays(initial: float=1.0, factor: float=2.0, max_delay: float=30.0) -> Iterator[float]:
+    """ 1, 2, 4, ... seconds, capped at max_delay """
+    delay = initial
+    while True:
+        yield delay
+        delay = min(delay * factor, max_delay)
+
+
+def iter_rows(path: str, encoding: str='utf-8-sig') -> Iterator[Dict[str, str]]:
+    """ Reads the CSV one row at a time, as {header: value} """
+    with open(path, newline='', encoding=encoding) as f:
+        yield from csv.DictReader(f)
+
+
+def read_columns(path: str, columns: List[str]=None, encoding: str='utf-8-sig') -> Dict[str, List[str]]:
+    """
+    {header: [values...]} for the whole CSV, without keeping a dict per row.
+    columns: only these headers (default: all of them)
+    """
+    return to_columns(iter_rows(path, encoding), columns=columns)
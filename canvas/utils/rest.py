@@ -1,8 +1,19 @@
+import asyncio
+import contextlib
 import datetime
+import functools
+import json
+import os
 from os import path
+import pandas as pd
+import random
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from requests.exceptions import HTTPError
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Iterator
 import requests
+import threading
+import time
+import weakref
 from datetime import datetime as dt, timedelta
 
 
@@ -10,12 +21,16 @@ from canvas import DEBUG
 from canvas.utils.models import (
     User,
     Profile,
+    Report,
     
     Folder,
     File,
 
     Course,
     Entity,
+    Submission,
+    StudentSubmissions,
+    project_raw,
     Todo,
     Notification,
     Conversation,
@@ -33,8 +48,21 @@ from canvas.utils import (
     URL,
     get_access_token,
     get_api_version,
-    get_base_url
+    get_base_url,
+    map_concurrently,
+    to_columns
 )
+from canvas.utils.ics import FeedCache, iter_events
+from canvas.utils import graphql
+from canvas.utils.singleflight import SingleFlight
+from canvas.utils import bulk
+from canvas.utils import reports
+from canvas.utils.folders import FolderIndex
+from canvas.utils.timeouts import Budget, DeadlineExceeded, HedgeStats, LatencyTracker
+from canvas.utils.warmup import UserContext, UserSnapshot
+from canvas.utils import discussions
+from canvas.utils.discussions import DiscussionView
+from canvas.utils.loader import RelationLoader
 
 
 class IllegalArgumentError(ValueError):
@@ -75,6 +103,13 @@ class APIError(Exception):
             return self._http_error.response
 
 
+def _header_float(headers, name: str) -> float or None:
+    try:
+        return float(headers[name])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
 class _REST:
     def __init__(
         self,
@@ -82,21 +117,170 @@ class _REST:
         base_url: URL = None,
         api_version: str = None,
         use_raw_data: bool = False,
-        options=None
+        options=None,
+        coalesce_gets: bool = True,
+        download_store=None,
+        transport=None,
+        recorder=None,
+        timeout: float = 60,
+        deadline: float = None,
+        retries: int = 3,
+        hedge: float = None,
+        rate_budget=None,
+        folder_max_age: float = 300
     ):
         """
         :Parameters
             use_raw_data: DISABLED - return api response raw or wrap it with Entity objects.
+            coalesce_gets: identical GETs (url, params, token) that are in flight at the
+                same time share one request, each caller gets its own copy of the decoded
+                json. Counts are in coalescing_stats.
+            download_store: canvas.utils.store.BlobStore used by File.download and Folder.download,
+                files already in the store are linked instead of downloaded again.
+            transport: sends the requests instead of the thread's requests.Session,
+                anything with Session's request(method, url, **kwargs) signature,
+                e.g. canvas.utils.transport.SessionTransport / HTTP2Transport for compression
+                and HTTP/2, canvas.utils.cassette.ReplayTransport to replay a recording.
+            recorder: canvas.utils.cassette.Cassette, every request/response is added to it.
+            timeout: seconds one request may wait to connect or for data, None waits forever.
+            deadline: seconds one call may take in total, retries and pages included
+                (default none), raises DeadlineExceeded. Per call with get(..., deadline=2)
+                or for a block with `with api.deadline(2):`.
+            retries: how often rate limited (429/403 Rate Limit Exceeded) requests, and GET/PUT/DELETE
+                requests that failed with a 5xx or a connection error, are retried with backoff.
+            hedge: percentile, e.g. 0.95. A GET still running after that percentile of recent
+                GET latencies gets a second identical request and the first response wins.
+                Counts are in hedge_stats.
+            rate_budget: canvas.utils.ratelimit.SharedRateBudget, requests wait for it before they
+                are sent and it's updated from X-Rate-Limit-Remaining, so processes sharing a token
+                stay under the Canvas throttle together.
+            folder_max_age: seconds the folder indexes (folder_index, resolve_folder, get_subfolders,
+                the by_path lookups) trust a cached folder before asking Canvas again.
+
+        :Threads
+            One instance can be shared by many threads. Every thread gets its
+            own requests.Session (a Session's cookie jar and connection pool
+            aren't safe to share), options are replaced as a whole with
+            set_option so readers never see a half updated dict, and the
+            caches kept on the client take their own locks.
         """
 
         self._access_token  = access_token  or get_access_token()
         self._base_url: URL = URL(base_url) if base_url else get_base_url(include_version=False)
         self._api_version   = api_version   or get_api_version()
-        self._session       = requests.Session()
         self._use_raw_data  = use_raw_data
 
-        self._retry = 3
-        self.options = options or {}
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        # weak so a finished thread's Session goes away with its thread-local
+        self._sessions = weakref.WeakSet()
+
+        self._retry = retries
+        self._timeout = timeout
+        self._deadline = deadline
+        self._hedge = hedge
+        self._latencies = LatencyTracker()
+        self._hedge_stats = HedgeStats()
+        self._hedge_pool: ThreadPoolExecutor = None
+        self.options = dict(options or {})
+
+        self._feed_cache = FeedCache()
+        self._singleflight = SingleFlight() if coalesce_gets else None
+        self._download_store = download_store
+        self._folder_indexes: Dict[str, FolderIndex] = {}
+        self._folder_max_age = folder_max_age
+        self._transport = transport
+        self._recorder = recorder
+        self._user_context: UserContext = None
+        self._rate_budget = rate_budget
+
+    @property
+    def _session(self) -> requests.Session:
+        """ The calling thread's Session, created on first use """
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            self._local.session = session
+            with self._lock:
+                self._sessions.add(session)
+        return session
+
+    def _send(self, method: str, url: str, *args, metered: bool=True, **kwargs) -> requests.Response:
+        """
+        Every HTTP request goes through here, to the transport and the recorder
+        metered: False for urls outside the REST api (tokenized feeds...) that don't count
+            against its rate limit, they skip the rate_budget
+        """
+        kwargs.setdefault('timeout', self._timeout)
+        metered = metered and self._rate_budget is not None
+        if metered:
+            rate_key = self._rate_budget.key(self._access_token, url)
+            if not self._rate_budget.acquire(rate_key, timeout=kwargs['timeout']):
+                raise RetryException(f"{method} {url}: no rate budget left within {kwargs['timeout']}s")
+
+        started = time.perf_counter()
+        resp = (self._transport or self._session).request(method, url, *args, **kwargs)
+        if metered:
+            self._rate_budget.observe(
+                rate_key,
+                remaining=_header_float(resp.headers, 'X-Rate-Limit-Remaining'),
+                cost=_header_float(resp.headers, 'X-Request-Cost'))
+        if self._recorder is not None:
+            # reading the body here also covers stream=True responses
+            resp.content
+            self._recorder.record(method, url, kwargs, resp, time.perf_counter() - started)
+        return resp
+
+    def set_option(self, key: str, value: Any):
+        with self._lock:
+            self.options = {**self.options, key: value}
+
+    def close(self):
+        """ Closes the Sessions of every thread """
+        with self._lock:
+            sessions, self._sessions = list(self._sessions), weakref.WeakSet()
+        for session in sessions:
+            session.close()
+        self._local = threading.local()
+        with self._lock:
+            pool, self._hedge_pool = self._hedge_pool, None
+        if pool is not None:
+            pool.shutdown(wait=False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @contextlib.contextmanager
+    def deadline(self, seconds: float):
+        """
+        Every call the current thread makes in the block shares one budget of seconds.
+            with api.deadline(5):
+                items = list(api.get_planner_items(stream=True))
+        A nested block can only make the budget shorter.
+        """
+        previous = getattr(self._local, 'budget', None)
+        budget = Budget(seconds)
+        if previous is not None and previous.remaining() is not None and previous.remaining() < seconds:
+            budget = previous
+        self._local.budget = budget
+        try:
+            yield budget
+        finally:
+            self._local.budget = previous
+
+    def _budget(self, deadline: float or Budget=None) -> Budget:
+        """ The budget of a call: its own deadline, the enclosing deadline() block's, or the client's """
+        if isinstance(deadline, Budget):
+            return deadline
+        if deadline is not None:
+            return Budget(deadline)
+        current = getattr(self._local, 'budget', None)
+        if current is not None:
+            return current
+        return Budget(self._deadline)
 
     def _request(
         self,
@@ -106,7 +290,9 @@ class _REST:
         base_url: URL = None,
         api_version: str = None,
         url: str = None,
-        *args, **kwargs
+        *args,
+        deadline: float or Budget = None,
+        **kwargs
     ):
         base_url = base_url or self._base_url
         version = api_version if api_version else self._api_version
@@ -127,18 +313,97 @@ class _REST:
         else:
             opts['json'] = data
 
-        return self._one_request(method, url, opts, *args, **kwargs)
+        budget = self._budget(deadline)
+        if method.upper() == 'GET' and self._singleflight is not None:
+            return self._singleflight.do(
+                self._request_key(method, url, data, *args, **kwargs),
+                lambda: self._one_request(method, url, opts, *args, budget=budget, **kwargs),
+                # a follower waits no longer than its own deadline, and runs the request itself
+                # when the leader ran out of (possibly less) time
+                timeout=budget.remaining(), retry_on=(DeadlineExceeded,))
 
-    def _one_request(self, method: str, url: URL, opts: dict, *args, **kwargs):
+        return self._one_request(method, url, opts, *args, budget=budget, **kwargs)
+
+    def _request_key(self, method: str, url: URL, data=None, *args, **kwargs) -> tuple:
+        """ Identifies identical requests for coalescing """
+        return (
+            method.upper(),
+            url,
+            json.dumps(data, sort_keys=True, default=str),
+            json.dumps([args, kwargs], sort_keys=True, default=str),
+            self._access_token)
+
+    def _one_request(self, method: str, url: URL, opts: dict, *args, with_links: bool=False, budget: Budget=None, **kwargs):
         """
-        Perform one request, possibly raising RetryException in the case
-        the response is 429. Otherwise, if error text contain "code" string,
+        Perform one request, retrying rate limited responses, 5xx and connection errors
+        (see retries) and raising RetryException when the response is still 429 after that.
+        Otherwise, if error text contain "code" string,
         then it decodes to json object and returns APIError.
         Returns the body json in the 200 status.
+        with_links: returns (body json, parsed Link header) instead, used for pagination
+        budget: raises DeadlineExceeded when it runs out, before or between attempts
         """
+        resp = self._retrying_send(method, url, opts, *args, budget=budget, **kwargs)
+        self._check_status(resp)
 
-        resp = self._session.request(method, url, *args, **opts, **kwargs)
+        body = resp.json() if resp.text != '' else None
+        if with_links:
+            return body, resp.links
+        return body
 
+    def _stream_request(self, method: str, url: URL, opts: dict, *args, budget: Budget=None, **kwargs) -> requests.Response:
+        """
+        _one_request for bodies that are parsed while they download: the same retries, budget
+        and errors, but returns the open response (stream=True) instead of its json.
+        The caller closes it.
+        """
+        resp = self._retrying_send(method, url, opts, *args, budget=budget, stream=True, **kwargs)
+        try:
+            self._check_status(resp)
+        except BaseException:
+            resp.close()
+            raise
+        return resp
+
+    def _retrying_send(self, method: str, url: URL, opts: dict, *args, budget: Budget=None, **kwargs) -> requests.Response:
+        """ The retry loop of _one_request, returns the last response whatever its status """
+        budget = budget or Budget()
+        idempotent = method.upper() in ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+
+        attempt = 0
+        while True:
+            budget.check(f"{method} {url}")
+            try:
+                resp = self._attempt(method, url, budget, *args, **opts, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if budget.expired:
+                    raise DeadlineExceeded(f"{method} {url}: deadline of {budget.seconds}s exceeded") from e
+                # a request that never connected can't have done anything
+                if attempt >= self._retry or not (idempotent or isinstance(e, requests.ConnectTimeout)):
+                    raise
+                delay = self._backoff(attempt)
+            else:
+                rate_limited = resp.status_code == 429 or (
+                    resp.status_code == 403 and 'Rate Limit Exceeded' in resp.text)
+                if not rate_limited and not (idempotent and resp.status_code in (500, 502, 503, 504)):
+                    return resp
+                if attempt >= self._retry:
+                    if rate_limited:
+                        resp.close()
+                        raise RetryException(f"{method} {url}: still rate limited after {attempt} retries")
+                    return resp
+                # a streamed response holds its connection until it's closed
+                resp.close()
+                delay = self._backoff(attempt, resp.headers.get('Retry-After'))
+
+            remaining = budget.remaining()
+            if remaining is not None and delay >= remaining:
+                raise DeadlineExceeded(f"{method} {url}: deadline of {budget.seconds}s exceeded")
+            time.sleep(delay)
+            attempt += 1
+
+    def _check_status(self, resp: requests.Response):
+        """ Raises APIError for Canvas error bodies, HTTPError for other failures """
         try:
             resp.raise_for_status()
 
@@ -152,13 +417,98 @@ class _REST:
             else:
                 raise
 
-        if resp.text != '':
-            return resp.json()
+    def _backoff(self, attempt: int, retry_after: str=None) -> float:
+        """ Retry-After when the server sent one, otherwise exponential with full jitter """
+        try:
+            return max(0.0, float(retry_after))
+        except (TypeError, ValueError):
+            return random.uniform(0, min(30.0, 0.5 * 2 ** attempt))
 
-        return None
+    def _timed_send(self, method: str, url: str, *args, **kwargs) -> requests.Response:
+        started = time.perf_counter()
+        resp = self._send(method, url, *args, **kwargs)
+        if method.upper() == 'GET' and resp.status_code < 500:
+            self._latencies.add(time.perf_counter() - started)
+        return resp
+
+    def _hedge_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._hedge_pool is None:
+                self._hedge_pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix="canvas-hedge")
+            return self._hedge_pool
+
+    def _attempt(self, method: str, url: str, budget: Budget, *args, **kwargs) -> requests.Response:
+        """ One attempt of a request, hedged when it's a GET and hedging is on """
+        kwargs['timeout'] = budget.timeout(kwargs.get('timeout', self._timeout))
+        # the losing request of a hedged pair is dropped unread, a streamed one would keep its connection
+        if method.upper() != 'GET' or self._hedge is None or kwargs.get('stream'):
+            return self._timed_send(method, url, *args, **kwargs)
+
+        threshold = self._latencies.percentile(self._hedge)
+        if threshold is None:
+            self._hedge_stats.add()
+            return self._timed_send(method, url, *args, **kwargs)
+
+        pool = self._hedge_executor()
+        first = pool.submit(self._timed_send, method, url, *args, **kwargs)
+        done, _ = wait([first], timeout=threshold)
+        if done:
+            self._hedge_stats.add()
+            return first.result()
+
+        kwargs['timeout'] = budget.timeout(kwargs['timeout'])
+        second = pool.submit(self._timed_send, method, url, *args, **kwargs)
+        pending, error = {first, second}, None
+        while pending:
+            done, pending = wait(pending, timeout=budget.remaining(), return_when=FIRST_COMPLETED)
+            if not done:
+                self._hedge_stats.add(hedged=True)
+                raise DeadlineExceeded(f"{method} {url}: deadline of {budget.seconds}s exceeded")
+            for future in done:
+                if future.exception() is None:
+                    # the slower one finishes in the background, its response is dropped
+                    self._hedge_stats.add(hedged=True, hedge_won=future is second)
+                    return future.result()
+                error = future.exception()
+        self._hedge_stats.add(hedged=True)
+        raise error
+
+    @property
+    def hedge_stats(self) -> Dict[str, float]:
+        """ {'requests': GETs sent with hedging on, 'hedged': how many got a second request, 'hedge_wins': ..., 'threshold': seconds} """
+        return {**self._hedge_stats.as_dict(),
+                "threshold": self._latencies.percentile(self._hedge) if self._hedge is not None else None}
 
     def get(self, path=None, data=None, *args, **kwargs):
         return self._request('GET', path, data, *args, **kwargs)
+
+    async def get_async(self, path=None, data=None, base_url: URL = None, api_version: str = None, url: str = None):
+        """
+        get() for asyncio code, runs on the loop's default executor.
+        Identical GETs awaited at the same time share one executor slot and one request.
+        """
+        loop = asyncio.get_running_loop()
+        call = functools.partial(self.get, path, data, base_url=base_url, api_version=api_version, url=url)
+        if self._singleflight is None:
+            return await loop.run_in_executor(None, call)
+
+        full_url = url or (base_url or self._base_url) + (api_version or self._api_version) + path
+        return await self._singleflight.do_async(
+            self._request_key('GET', full_url, data),
+            lambda: loop.run_in_executor(None, call))
+
+    @property
+    def transport_stats(self) -> Dict[str, float] or None:
+        """ Bytes on the wire vs decoded bytes, for transports that count them (canvas.utils.transport) """
+        stats = getattr(self._transport, 'stats', None)
+        return stats.as_dict() if stats is not None else None
+
+    @property
+    def coalescing_stats(self) -> Dict[str, int]:
+        """ {'calls': requests actually sent, 'coalesced': callers that shared one, 'in_flight': ...} """
+        if self._singleflight is None:
+            return {"calls": 0, "coalesced": 0, "in_flight": 0}
+        return self._singleflight.stats()
     
     def post(self, path=None, data=None, *args, **kwargs):
         return self._request('POST', path, data, *args, **kwargs)
@@ -172,13 +522,70 @@ class _REST:
     def delete(self, path=None, data=None, *args, **kwargs):
         return self._request('DELETE', path, data, *args, **kwargs)
 
+    def graphql(self, query: str, variables: Dict=None) -> Dict:
+        """
+        POST /api/graphql, returns the 'data' of the response.
+        GraphQL reports errors with a 200, those are raised as APIError.
+        """
+        resp = self.post(
+            url=URL(self._base_url.rstrip('/') + "/graphql"),
+            data={"query": query, "variables": variables or {}})
+
+        errors = (resp or {}).get('errors')
+        if errors:
+            raise APIError({
+                'message': '; '.join(error.get('message', '') for error in errors),
+                'code': 'graphql',
+                'errors': errors})
+        return (resp or {}).get('data') or {}
+
+    def graphql_connection(self, query: str, path: List[str], variables: Dict=None, after: str=None) -> Iterator[Dict]:
+        """
+        Yields every node of a connection, following the cursor until there are no more pages.
+        :Parameters
+            query: must take an `$after: String` variable for the connection
+            path: keys from 'data' down to the connection, e.g. ['course', 'assignmentsConnection']
+            after: cursor to start from, None for the first page
+        """
+        variables = dict(variables or {})
+        while True:
+            connection = self.graphql(query, {**variables, "after": after})
+            for key in path:
+                connection = (connection or {}).get(key)
+
+            yield from graphql.connection_nodes(connection)
+
+            after = graphql.connection_cursor(connection)
+            if after is None:
+                return
+
+    def iter_pages(self, path: str=None, data=None, url: str=None, *args, deadline: float or Budget=None, **kwargs) -> Iterator[List[Dict]]:
+        """
+        Yields every page of a list endpoint, following the Link rel="next" header.
+        Pages are requested lazily, the next one only when the previous is consumed.
+        deadline: covers all of the pages (default: the enclosing deadline() block's or the client's)
+        """
+        kwargs['deadline'] = self._budget(deadline)
+        page, links = self.get(path=path, data=data, url=url, with_links=True, *args, **kwargs)
+        while True:
+            yield page or []
+
+            next_url = (links.get('next') or {}).get('url')
+            if not next_url:
+                return
+            # the next url already carries the query string
+            page, links = self.get(url=next_url, with_links=True, *args, **kwargs)
+
     def list_entities_from_endpoint(self,
         path: str=None,
         entity: Entity=None,
         entity_type_key: str=None,
         entity_map: Dict[str, Entity]={},
         url: str=None,
-        *args, **kwargs) -> List[Entity]:
+        include: List[str]=None,
+        fields: List[str]=None,
+        stream: bool=False,
+        *args, **kwargs) -> List[Entity] or Iterator[Entity]:
         """
         :Parameters
             path: API Endpoint to get list of data
@@ -186,6 +593,11 @@ class _REST:
             if entity is None:
                 entity_type_key: used as the key to get the type name from the element
                 entity_map: key is the type name in the element, value is the Class to use
+            include: sent as include[] so the expansions come back in the same response
+            fields: only these keys of each element are kept ('id' and entity_type_key always are),
+                the rest of the payload isn't retained by the Entity
+            stream: returns a generator over every page instead of a list of the first page,
+                pages are fetched as the generator is consumed
 
         :Usage
             self.list_entities_from_endpoint(
@@ -203,6 +615,12 @@ class _REST:
                     'default': PlannerItem,
                 }
             )
+            self.list_entities_from_endpoint(
+                path="/courses",
+                entity=Course,
+                include=['term', 'total_scores'],
+                fields=['name', 'course_code', 'term']
+            )
             
         """
 
@@ -210,25 +628,32 @@ class _REST:
         if entity is None and (entity_type_key is None or entity_map is None):
             raise IllegalArgumentError("If entity is None, entity_type_key and entity_map cannot")
 
+        if include:
+            kwargs['data'] = {**(kwargs.get('data') or {}), 'include[]': list(include)}
+
         # If entity is set and subclass of Entity, convert everything to that Class
         if entity is not None and issubclass(entity, Entity):
-            return [entity(raw=el, client=self) for el in self.get(path=path, url=url, *args, **kwargs)]
+            to_entity = lambda el: entity(raw=project_raw(el, fields), client=self)
 
-        if 'default' not in entity_map:
-            raise IllegalArgumentError("'default' has to be provided in entity_map")
+        else:
+            if 'default' not in entity_map:
+                raise IllegalArgumentError("'default' has to be provided in entity_map")
 
+            # Here 'entity_type_key' and 'entity_map' should be set.
+            #   :entity_type_key gets the corresponding value from the element
+            #   :entity_map pairs the elements 'entity_type_key' to the Class 
+            def to_entity(el: Dict) -> Entity:
+                entity_based_key_value = el.get(entity_type_key)
+                entity_class: Entity = entity_map.get(entity_based_key_value, entity_map['default'])
+                return entity_class(raw=project_raw(el, fields, keep=[entity_type_key]), client=self)
 
-        # Here 'entity_type_key' and 'entity_map' should be set.
-        #   :entity_type_key gets the corresponding value from the element
-        #   :entity_map pairs the elements 'entity_type_key' to the Class 
-        resp_list: List[Entity] = []
-        get_list: List[Dict] = self.get(path=path, url=url, *args, **kwargs)
-        for el in get_list:
-            entity_based_key_value = el.get(entity_type_key)
-            entity_class: Entity = entity_map.get(entity_based_key_value, entity_map['default'])
-            resp_list.append(entity_class(raw=el, client=self))
+        if stream:
+            return (to_entity(el)
+                    for page in self.iter_pages(path=path, url=url, *args, **kwargs)
+                    for el in page)
 
-        return resp_list
+        get_list: List[Dict] = self.get(path=path, url=url, *args, **kwargs)
+        return [to_entity(el) for el in get_list]
 
 
 class CANVAS_REST(_REST):
@@ -284,11 +709,87 @@ class CANVAS_REST(_REST):
     def update_profile(self, data: Dict[str, Any]):
         return self.put(path="/users/self/profile", data=data)
 
-    def get_courses(self) -> List[Course]:
-        return self.list_entities_from_endpoint(path="/courses", entity=Course)
+    def get_courses(self, include: List[str]=None, fields: List[str]=None, stream: bool=False) -> List[Course]:
+        """
+        include: [ needs_grading_count, syllabus_body, public_description, total_scores, current_grading_period_scores,
+                   term, account, course_progress, sections, storage_quota_used_mb, total_students, passback_status,
+                   favorites, teachers, observed_users, tabs, course_image, banner_image, concluded ]
+        fields: keys to keep from each course, e.g. ['name', 'course_code']
+        stream: generator over every page instead of a list of the first page
+        """
+        return self.list_entities_from_endpoint(
+            path="/courses", entity=Course, include=include, fields=fields, stream=stream)
 
     # grades
-    def get_planner_items(self, future_days=2, per_page=300) -> List[PlannerItem]:
+    def get_submissions(self,
+        course_id: str or int,
+        student_ids: List[str or int] or str='all',
+        assignment_ids: List[str or int]=None,
+        include: List[str]=None,
+        grouped: bool=False,
+        workflow_state: str=None,
+        fields: List[str]=None,
+        per_page: int=100,
+        stream: bool=False,
+        columnar: bool=False) -> List[Submission] or List[StudentSubmissions] or Iterator or pd.DataFrame:
+        """
+        The whole gradebook of a course from /courses/:id/students/submissions,
+        paged through once instead of one call per assignment.
+        :Parameters
+            student_ids: 'all' or a list of user ids
+            assignment_ids: only these assignments (default: all of them)
+            include: [ submission_history, submission_comments, rubric_assessment, assignment, visibility, course, user, group, read_status ]
+            grouped: one StudentSubmissions per student, with their submissions under .submissions()
+            workflow_state: submitted, unsubmitted, graded or pending_review
+            fields: keys to keep from each submission, e.g. ['assignment_id', 'user_id', 'score'],
+                with grouped the submissions under each student are projected
+            stream: a generator over every page instead of a list, pages are fetched as it's consumed.
+                Without stream the list has every page too (a gradebook is rarely one page).
+            columnar: a pandas DataFrame with one row per submission over every page,
+                built straight from the pages without creating a Submission for each one
+                (grouped responses are flattened, every submission carries its user_id)
+
+        :Usage
+            grades = self.get_submissions(course_id, fields=['assignment_id', 'user_id', 'score'], columnar=True)
+            grades.pivot(index='user_id', columns='assignment_id', values='score')
+        """
+        data = {
+            "student_ids[]": ['all'] if student_ids == 'all' else list(student_ids),
+            "per_page": per_page,
+        }
+        if assignment_ids:
+            data["assignment_ids[]"] = list(assignment_ids)
+        if grouped:
+            data["grouped"] = True
+        if workflow_state:
+            data["workflow_state"] = workflow_state
+        if include:
+            data["include[]"] = list(include)
+        path = f"/courses/{course_id}/students/submissions"
+
+        if columnar:
+            def rows():
+                for page in self.iter_pages(path=path, data=data):
+                    for el in page:
+                        for raw in ((el.get('submissions') or []) if grouped else [el]):
+                            yield raw
+
+            columns = None if fields is None else ['id', *[field for field in fields if field != 'id']]
+            return pd.DataFrame(to_columns(rows(), columns=columns))
+
+        if grouped:
+            submissions = (
+                StudentSubmissions(raw={
+                    **el, 'submissions': [project_raw(raw, fields) for raw in el.get('submissions') or []],
+                }, client=self)
+                for page in self.iter_pages(path=path, data=data)
+                for el in page)
+        else:
+            submissions = self.list_entities_from_endpoint(
+                path=path, entity=Submission, fields=fields, stream=True, data=data)
+        return submissions if stream else list(submissions)
+
+    def get_planner_items(self, future_days=2, per_page=300, stream: bool=False) -> List[PlannerItem]:
         
         # For Planner Only
         end = dt.strftime(dt.today() + timedelta(days=future_days), '%Y-%m-%dT00:00:00.000Z')
@@ -303,6 +804,7 @@ class CANVAS_REST(_REST):
                 'announcement': PlannerAnnouncement,
                 'default': PlannerItem,
             },
+            stream=stream,
             data={
                 "end_date": end,
                 "per_page": per_page
@@ -312,9 +814,9 @@ class CANVAS_REST(_REST):
     def delete_planner_items(self):
         raise NotImplementedError
 
-    def get_planner_notes(self) -> List[PlannerNote]:
+    def get_planner_notes(self, stream: bool=False) -> List[PlannerNote]:
         return self.list_entities_from_endpoint(
-            path="/planner_notes", entity=PlannerNote)
+            path="/planner_notes", entity=PlannerNote, stream=stream)
     def create_planner_notes(self, title, details, todo_date:datetime.datetime, course_id):
         """
         Parameter		Type	Description
@@ -338,9 +840,9 @@ class CANVAS_REST(_REST):
     def delete_planner_notes(self, note_id):
         return self.delete(path=f"/planner_notes/{note_id}")
 
-    def get_planner_overrides(self, override_id=None):
+    def get_planner_overrides(self, override_id=None, stream: bool=False):
         return self.list_entities_from_endpoint(
-            path="/planner/overrides", entity=PlannerOverride)
+            path="/planner/overrides", entity=PlannerOverride, stream=stream)
     def create_planner_overrides(self, data: Dict):
         return self.post(path="/planner/overrides", data=data)
     def update_planner_overrides(self, override_id: str, data: Dict):
@@ -356,14 +858,14 @@ class CANVAS_REST(_REST):
     def delete_planner_overrides(self, override_id: str):
         return self.delete(path=f"/planner/overrides/{override_id}")
 
-    def get_calendar_events(self) -> List[CalendarEvent]:
+    def get_calendar_events(self, stream: bool=False) -> List[CalendarEvent]:
         return self.list_entities_from_endpoint(
-            path="/users/self/calendar_events", entity=CalendarEvent)
+            path="/users/self/calendar_events", entity=CalendarEvent, stream=stream)
     def create_calendar_events(self, title, description, context_code:str=None, start_at:datetime.datetime=None, end_at: datetime.datetime=None, all_day: bool=False, *args, **kwargs):
-        return self.push_to_calendar_events("UPDATE", title, description, context_code, start_at, end_at, all_day, *args, **kwargs)
-    def update_calendar_events(self, title, description, context_code:str=None, start_at:datetime.datetime=None, end_at: datetime.datetime=None, all_day: bool=False, *args, **kwargs):
-        # TODO: I probably need to add an ID 
         return self.push_to_calendar_events("CREATE", title, description, context_code, start_at, end_at, all_day, *args, **kwargs)
+    def update_calendar_events(self, calendar_event_id, title=None, description=None, context_code:str=None, start_at:datetime.datetime=None, end_at: datetime.datetime=None, all_day: bool=None, *args, **kwargs):
+        """ Only the fields that aren't None are sent """
+        return self.push_to_calendar_events("UPDATE", title, description, context_code, start_at, end_at, all_day, *args, calendar_event_id=calendar_event_id, **kwargs)
     def push_to_calendar_events(self, method, title, description, context_code:str=None, start_at:datetime.datetime=None, end_at: datetime.datetime=None, all_day: bool=False, *args, **kwargs):
         """
         https://canvas.instructure.com/doc/api/calendar_events.html
@@ -375,59 +877,267 @@ class CANVAS_REST(_REST):
             calendar_event[start_at]: DateTime = Start date/time of the event.
             calendar_event[end_at]: DateTime = End date/time of the event.
             calendar_event[all_day]: boolean = When true event is considered to span the whole day and times are ignored.
+        method: CREATE (POST /calendar_events) or UPDATE (PUT /calendar_events/:id, needs calendar_event_id)
         """
+        calendar_event_id = kwargs.pop('calendar_event_id', None)
         if method == "UPDATE":
+            if calendar_event_id is None:
+                raise IllegalArgumentError("calendar_event_id is required to UPDATE")
             request_method = self.put
+            path = f"/calendar_events/{calendar_event_id}"
         elif method == "CREATE":
             request_method = self.post
+            path = "/calendar_events"
         else:
             raise IllegalArgumentError("only UPDATE or CREATE are allowed as the method")
 
+        calendar_event = {
+            "context_code": context_code,
+            "title": title,
+            "description": description,
+            "start_at": bulk.to_canvas_datetime(start_at),
+            "end_at": bulk.to_canvas_datetime(end_at),
+            "all_day": all_day,
+            **kwargs
+        }
         return request_method(
-            path="/calendar_events",
-            data={
-                "context_code": context_code,
-                "title": title, 
-                "description": description,
-                "start_at": start_at,
-                "end_at": end_at,
-                "all_day": all_day,
-                **kwargs
-            })
+            path=path,
+            data={"calendar_event": {key: val for key, val in calendar_event.items() if val is not None}})
     def delete_calendar_events(self, calendar_event_id):
         return self.delete(path=f"/calendar_events/{calendar_event_id}")
+
+    def sync_calendar_events(self,
+        context_code: str,
+        desired: List[Dict[str, Any]],
+        start: datetime.datetime or str,
+        end: datetime.datetime or str,
+        key: str='sync_key',
+        delete_missing: bool=True,
+        budget=None,
+        max_workers: int=8,
+        dry_run: bool=False,
+        state: bulk.SyncState or str=None) -> List[bulk.BulkResult]:
+        """
+        Makes the calendar of context_code between start and end match desired.
+        The existing events of the range are fetched once, then only the creates, updates
+        and deletes that are needed are sent, concurrently. Which event belongs to which
+        sync key is kept in state, so running it again with the same input changes nothing
+        and events that weren't created by a sync are never touched.
+        :Parameters
+            desired: events as calendar_event fields ('title', 'start_at', 'end_at', 'description',
+                'location_name', 'all_day'...), each with a unique desired[key] from the source system.
+                Every start_at has to be within [start, end)
+            state: bulk.SyncState, or the path of its json file. The key is also added to each
+                description as an html comment, events are found by it only when state doesn't
+                know them (e.g. a lost state file) and Canvas kept the comment.
+                None keeps the state in memory for this call, events are then matched by the comment only.
+            delete_missing: delete synced events of the range whose key isn't in desired anymore
+            budget: TokenBucket (canvas.utils.ratelimit) every write takes a token from
+            dry_run: report what would change without sending anything or saving state
+        :Usage
+            report = api.sync_calendar_events("course_123", events, start=term_start, end=term_end,
+                                              state="calendar_sync.json", budget=TokenBucket(5, 10))
+            failed = [r for r in report if not r.ok]
+        """
+        if not isinstance(state, bulk.SyncState):
+            state = bulk.SyncState(state)
+
+        def parse(value, what: str) -> datetime.datetime:
+            try:
+                return bulk.parse_datetime(value)
+            except (TypeError, ValueError) as e:
+                raise IllegalArgumentError(f"{what}: '{value}' isn't an ISO 8601 datetime") from e
+
+        start, end = bulk.to_canvas_datetime(start), bulk.to_canvas_datetime(end)
+        range_start, range_end = parse(start, "start"), parse(end, "end")
+
+        wanted: Dict[str, Dict[str, Any]] = {}
+        for event in desired:
+            if event.get(key) is None:
+                raise IllegalArgumentError(f"every desired event needs a '{key}'")
+            sync_key = str(event[key])
+            if sync_key in wanted:
+                raise IllegalArgumentError(f"duplicate {key} '{sync_key}'")
+            fields = {field: bulk.to_canvas_datetime(val) for field, val in event.items() if field != key}
+            if not fields.get('start_at'):
+                raise IllegalArgumentError(f"{key} '{sync_key}' has no start_at")
+            if not range_start <= parse(fields['start_at'], f"{key} '{sync_key}' start_at") < range_end:
+                raise IllegalArgumentError(f"{key} '{sync_key}' doesn't start within the synced range")
+            fields['description'] = bulk.with_sync_key(fields.get('description'), sync_key)
+            wanted[sync_key] = fields
+
+        known = state.entries(context_code)
+        by_id: Dict[Any, CalendarEvent] = {}
+        by_marker: Dict[str, List[CalendarEvent]] = {}
+        for event in self.list_entities_from_endpoint(
+                path="/calendar_events", entity=CalendarEvent, stream=True,
+                data={"context_codes[]": context_code, "start_date": start, "end_date": end, "per_page": 100}):
+            by_id[event.id] = event
+            marker = bulk.find_sync_key(event._raw.get('description'))
+            if marker is not None:
+                by_marker.setdefault(marker, []).append(event)
+
+        # events state knows belong to their key whatever their description says
+        claimed = {record['id'] for record in known.values() if record.get('id') in by_id}
+
+        # planned[i] is for keys[i]
+        planned: List[bulk.BulkResult] = []
+        keys: List[str] = []
+        # updated_at of the events that are skipped, for the state
+        skipped_at: Dict[str, str] = {}
+
+        def plan(sync_key: str, item: bulk.BulkResult):
+            planned.append(item)
+            keys.append(sync_key)
+
+        for sync_key, fields in wanted.items():
+            record = known.get(sync_key)
+            if record is not None and record.get('id') in by_id:
+                matches = [by_id[record['id']]]
+            else:
+                matches = [event for event in by_marker.get(sync_key, []) if event.id not in claimed]
+            if not matches:
+                plan(sync_key, bulk.BulkResult(context_code, None, "create", fields))
+                continue
+            current = matches[0]
+            claimed.add(current.id)
+            # duplicates left by an interrupted run
+            for duplicate in matches[1:]:
+                claimed.add(duplicate.id)
+                plan(sync_key, bulk.BulkResult(context_code, duplicate.id, "delete", {}))
+
+            unchanged_since_written = (
+                record is not None and record.get('id') == current.id
+                and record.get('fingerprint') == bulk.fingerprint(fields)
+                and record.get('updated_at') == current._raw.get('updated_at'))
+            # Canvas may rewrite the description html, it's compared by what was last written
+            changes = {} if unchanged_since_written else bulk.diff(current._raw, fields)
+            if not changes:
+                skipped_at[sync_key] = current._raw.get('updated_at')
+            plan(sync_key, bulk.BulkResult(context_code, current.id, "update" if changes else "skip", changes))
+
+        if delete_missing:
+            for sync_key, record in known.items():
+                if sync_key not in wanted and record.get('id') in by_id:
+                    plan(sync_key, bulk.BulkResult(context_code, record['id'], "delete", {}))
+            for sync_key, events in by_marker.items():
+                for event in events:
+                    if sync_key not in wanted and event.id not in claimed:
+                        claimed.add(event.id)
+                        plan(sync_key, bulk.BulkResult(context_code, event.id, "delete", {}))
+
+        if dry_run:
+            return planned
+
+        def apply(item: bulk.BulkResult):
+            if budget is not None:
+                budget.acquire()
+            if item.action == "create":
+                return self.post(path="/calendar_events",
+                                 data={"calendar_event": {"context_code": context_code, **item.changes}})
+            if item.action == "update":
+                return self.put(path=f"/calendar_events/{item.id}", data={"calendar_event": item.changes})
+            return self.delete_calendar_events(item.id)
+
+        writes = [idx for idx, item in enumerate(planned) if item.action != "skip"]
+        for idx, result, error in map_concurrently(lambda idx: apply(planned[idx]), writes, max_workers=max_workers):
+            item = planned[idx]
+            planned[idx] = item._replace(
+                id=item.id if item.id is not None else (result or {}).get('id'), result=result, error=error)
+
+        for sync_key, item in zip(keys, planned):
+            if not item.ok:
+                continue
+            if item.action == "delete":
+                if (known.get(sync_key) or {}).get('id') == item.id:
+                    state.remove(context_code, sync_key)
+            else:
+                updated_at = skipped_at.get(sync_key) if item.action == "skip" else (item.result or {}).get('updated_at')
+                state.set(context_code, sync_key, item.id, bulk.fingerprint(wanted[sync_key]), updated_at)
+        state.save()
+        return planned
+
+    def get_calendar_feed(self, feed_url: str, context_code: str=None, deadline: float or Budget=None) -> List[CalendarEvent]:
+        """
+        Reads an iCalendar feed (Course.calendar['ics']) into CalendarEvent objects.
+        The feed url is tokenized, so no Authorization header is sent and it
+        doesn't use the REST rate budget. It's retried and bounded by the deadline
+        like any other call. Conditional GETs are used, an unchanged feed is served
+        from the parsed cache after a 304.
+        """
+        budget = self._budget(deadline)
+        resp = self._stream_request('GET', feed_url, {'headers': self._feed_cache.validators(feed_url)},
+                                    budget=budget, metered=False)
+        if resp.status_code == 304:
+            resp.close()
+            events = self._feed_cache.get(feed_url)
+            if events is not None:
+                return [CalendarEvent(raw=event, client=self) for event in events]
+            # the parsed feed is gone (evicted, or the validators came from elsewhere), get all of it
+            resp = self._stream_request('GET', feed_url, {}, budget=budget, metered=False)
+
+        with resp:
+            resp.encoding = resp.encoding or 'utf-8'
+            events = list(iter_events(resp.iter_lines(decode_unicode=True), context_code=context_code))
+
+        self._feed_cache.put(
+            feed_url, events,
+            etag=resp.headers.get('ETag'),
+            last_modified=resp.headers.get('Last-Modified'))
+        return [CalendarEvent(raw=event, client=self) for event in events]
+    def get_calendar_feeds(self, courses: List[Course]=None, max_workers: int=8) -> Dict[int, List[CalendarEvent] or Exception]:
+        """
+        Fetches the feeds of many courses concurrently.
+        Returns {course_id: [CalendarEvent], or the exception that feed failed with}
+        """
+        if courses is None:
+            courses = self.get_courses()
+
+        feeds = {}
+        for course, events, error in map_concurrently(
+                lambda course: course.calendar_events(), courses, max_workers=max_workers):
+            feeds[course.id] = error if error is not None else events
+        return feeds
     
-    def get_upcoming_events(self, course_id: str or int=None) -> List[UpcomingEvent]:
+    def get_upcoming_events(self, course_id: str or int=None, stream: bool=False) -> List[UpcomingEvent]:
         path = "/users/self/upcoming_events"
         if course_id is not None:
             path = f"/courses/{course_id}/upcoming_events"
-        return self.list_entities_from_endpoint(path=path, entity=UpcomingEvent)
+        return self.list_entities_from_endpoint(path=path, entity=UpcomingEvent, stream=stream)
     def update_upcoming_events(self):
         raise NotImplementedError
     def delete_upcoming_events(self):
         raise NotImplementedError
 
-    def get_todos(self, course_id: str or int=None) -> List[Todo]:
+    def get_todos(self, course_id: str or int=None, stream: bool=False) -> List[Todo]:
         path = "/users/self/todo"
         if course_id is not None:
             path = f"/courses/{course_id}/todo"
 
-        return self.list_entities_from_endpoint(path=path, entity=Todo)
+        return self.list_entities_from_endpoint(path=path, entity=Todo, stream=stream)
 
-    def get_notifications(self, course_id: str or int=None) -> List[Notification]:
+    def get_notifications(self, course_id: str or int=None, stream: bool=False) -> List[Notification]:
         path = "/users/self/activity_stream"
         if course_id is not None:
             path = f"/courses/{course_id}/activity_stream"
+        if stream:
+            # newest first, as the api sends them
+            return self.list_entities_from_endpoint(path=path, entity=Notification, stream=True)
         return reversed(self.list_entities_from_endpoint(path=path, entity=Notification))
     def delete_notifications(self, notification_id=None, clear_all=False):
         notification_id_path = f"/users/self/activity_stream/{notification_id}"
         all_path = f"/users/self/activity_stream"
         self.delete(path=notification_id_path if not clear_all else all_path)
 
-    def get_inbox(self, conversation_id: str=None) -> List[Conversation]:
-        return self.list_entities_from_endpoint(
-            path=f"/conversations/{conversation_id if conversation_id else ''}", entity=Conversation)
-            # TODO, with id returns a Dict not a List
+    def get_inbox(self, conversation_id: str=None, stream: bool=False) -> List[Conversation]:
+        """
+        :Parameters
+            conversation_id: only that conversation, still as a list so callers (and stream) get the same shape
+        """
+        if conversation_id:
+            conversations = [Conversation(raw=self.get(f"/conversations/{conversation_id}"), client=self)]
+            return iter(conversations) if stream else conversations
+        return self.list_entities_from_endpoint(path="/conversations/", entity=Conversation, stream=stream)
     def create_conversation(self, recipients: List, subject: str, body: str, force_new: bool=False, context_code:str=None, **kwargs):
         """
         recipients[]	Required	string	= An array of recipient ids. These may be user ids or course/group ids prefixed with “course_” or “group_” respectively, e.g. recipients[]=1&recipients=2&recipients[]=course_3. If the course/group has over 100 enrollments, 'bulk_message' and 'group_conversation' must be set to true.
@@ -462,11 +1172,182 @@ class CANVAS_REST(_REST):
     def delete_inbox(self):
         raise NotImplementedError
 
-    def get_assignments(self, course_id: str or int) -> List[Assignment]:
+    # Discussions
+    def get_discussion_view(self, course_id: str or int, topic_id: str or int, since: str=None,
+                            chunk_size: int=1 << 16, deadline: float or Budget=None) -> DiscussionView:
+        """
+        The full thread of a discussion or announcement (/discussion_topics/:id/view),
+        parsed while it downloads, see canvas.utils.discussions.
+        since: a marker from an earlier view (DiscussionView.marker), entries that didn't
+            change after it are dropped while parsing, get them with view.entries_since(since)
+        Canvas answers 503 while it builds the cached view, that's retried like any other
+        request, within the deadline.
+        """
+        url = URL(self._base_url + self._api_version + f"/courses/{course_id}/discussion_topics/{topic_id}/view")
+        opts = {'headers': {'Authorization': 'Bearer ' + self._access_token}, 'allow_redirects': False}
+        with self._stream_request('GET', url, opts, budget=self._budget(deadline)) as resp:
+            chunks = discussions.decode_chunks(resp.iter_content(chunk_size=chunk_size), resp.encoding or 'utf-8')
+            return DiscussionView.parse(chunks, client=self, since=since)
+
+    def get_assignments(self, course_id: str or int, include: List[str]=None, fields: List[str]=None, stream: bool=False) -> List[Assignment]:
+        """
+        include: [ submission, assignment_visibility, all_dates, overrides, observed_users, can_edit, score_statistics ]
+        fields: keys to keep from each assignment, e.g. ['name', 'due_at']
+        stream: generator over every page instead of a list of the first page
+        """
         path = f"/courses/{course_id}/assignments"
-        return self.list_entities_from_endpoint(path=path, entity=Assignment)
-    def update_assignments(self):
-        raise NotImplementedError
+        return self.list_entities_from_endpoint(
+            path=path, entity=Assignment, include=include, fields=fields, stream=stream)
+    def get_courses_with_assignments(self, include_submissions: bool=False, per_page: int=50) -> List[Course]:
+        """
+        One GraphQL round trip for every course and its assignments, instead of
+        get_courses() plus a get_assignments(course_id) call per course.
+        Extra pages of assignments/submissions are followed with their cursors.
+        Use Course.assignments() to get the Assignment objects,
+        submissions are under Assignment.submissions as raw dicts.
+        """
+        data = self.graphql(
+            graphql.courses_with_assignments_query(include_submissions),
+            {"first": per_page})
+
+        courses = []
+        for course_node in data.get('allCourses') or []:
+            connection = course_node.pop('assignmentsConnection', None)
+            course_raw = graphql.node_to_raw(course_node)
+
+            assignment_nodes = graphql.connection_nodes(connection)
+            cursor = graphql.connection_cursor(connection)
+            if cursor is not None:
+                assignment_nodes = assignment_nodes + list(self.graphql_connection(
+                    graphql.course_assignments_query(include_submissions),
+                    path=['course', 'assignmentsConnection'],
+                    variables={"courseId": course_raw['id'], "first": per_page},
+                    after=cursor))
+
+            course_raw['assignments'] = [
+                self._assignment_from_graphql(node, course_raw['id'], include_submissions, per_page)
+                for node in assignment_nodes]
+            courses.append(Course(raw=course_raw, client=self))
+
+        return courses
+    def get_assignments_by_course(self, course_ids: Iterable[str or int], per_page: int=50,
+                                  courses_per_query: int=25) -> Dict[int, List[Assignment]]:
+        """
+        The assignments of only the given courses, with one GraphQL query per
+        courses_per_query courses instead of a get_assignments call each.
+        Raws use the REST names and formats (see graphql.assignment_to_raw), but only
+        have the fields in graphql.ASSIGNMENT_FIELDS, not everything get_assignments returns.
+        Courses GraphQL doesn't return (not found, no access) are left out.
+        """
+        course_ids = list(course_ids)
+        found = {}
+        for start in range(0, len(course_ids), courses_per_query):
+            chunk = course_ids[start:start + courses_per_query]
+            data = self.graphql(
+                graphql.assignments_by_course_query(len(chunk)),
+                {"first": per_page, **{f"c{idx}": str(course_id) for idx, course_id in enumerate(chunk)}})
+
+            for idx, course_id in enumerate(chunk):
+                course_node = data.get(f"c{idx}")
+                if not course_node:
+                    continue
+                connection = course_node.pop('assignmentsConnection', None)
+                course_raw = graphql.node_to_raw(course_node)
+                assignment_nodes = graphql.connection_nodes(connection)
+                cursor = graphql.connection_cursor(connection)
+                if cursor is not None:
+                    assignment_nodes = assignment_nodes + list(self.graphql_connection(
+                        graphql.course_assignments_query(),
+                        path=['course', 'assignmentsConnection'],
+                        variables={"courseId": str(course_id), "first": per_page},
+                        after=cursor))
+                found[course_id] = [Assignment(raw=graphql.assignment_to_raw(node, course_raw['id']), client=self)
+                                    for node in assignment_nodes]
+        return found
+
+    def _assignment_from_graphql(self, node: Dict, course_id: int, include_submissions: bool, per_page: int) -> Dict:
+        connection = node.pop('submissionsConnection', None)
+        raw = graphql.assignment_to_raw(node, course_id)
+
+        if include_submissions:
+            submission_nodes = graphql.connection_nodes(connection)
+            cursor = graphql.connection_cursor(connection)
+            if cursor is not None:
+                submission_nodes = submission_nodes + list(self.graphql_connection(
+                    graphql.ASSIGNMENT_SUBMISSIONS_QUERY,
+                    path=['assignment', 'submissionsConnection'],
+                    variables={"assignmentId": raw['id'], "first": per_page},
+                    after=cursor))
+            raw['submissions'] = [graphql.submission_to_raw(node) for node in submission_nodes]
+
+        return raw
+    def update_assignment(self, course_id: str or int, assignment_id: str or int, data: Dict[str, Any]) -> Assignment:
+        """
+        https://canvas.instructure.com/doc/api/assignments.html#method.assignments_api.update
+        data: assignment fields without the 'assignment[...]' wrapping, e.g.
+            name, description, due_at, lock_at, unlock_at, points_possible, published
+        """
+        return Assignment(
+            raw=self.put(path=f"/courses/{course_id}/assignments/{assignment_id}", data={"assignment": data}),
+            client=self)
+    def update_assignments(self,
+        course_ids: List[str or int],
+        patch: Dict[str, Any]=None,
+        shift: timedelta=None,
+        shift_fields: List[str]=("due_at", "lock_at", "unlock_at"),
+        where=None,
+        max_workers: int=8,
+        dry_run: bool=False) -> List[bulk.BulkResult]:
+        """
+        Applies a date shift and/or a field patch to the assignments of many courses.
+        Assignments are fetched once per course, only the fields that actually change
+        are sent and assignments with nothing to change are skipped.
+        :Parameters
+            patch: fields to set, a value can be a function of the Assignment
+            shift: added to every shift_fields date that is set (term rollovers)
+            where: only assignments where where(assignment) is true
+            dry_run: report what would change without sending anything
+        :Usage
+            report = api.update_assignments(course_ids, shift=timedelta(weeks=52))
+            failed = [r for r in report if not r.ok]
+        """
+        if patch is None and shift is None:
+            raise IllegalArgumentError("patch or shift is required")
+
+        planned: List[bulk.BulkResult] = []
+        for course_id, assignments, error in map_concurrently(
+                lambda course_id: list(self.get_assignments(course_id, stream=True)), course_ids, max_workers=max_workers):
+            if error is not None:
+                planned.append(bulk.BulkResult(course_id, None, "update", {}, error=error))
+                continue
+
+            for assignment in assignments:
+                if where is not None and not where(assignment):
+                    continue
+
+                desired = {}
+                if shift is not None:
+                    for field in shift_fields:
+                        if assignment._raw.get(field) is not None:
+                            desired[field] = bulk.shift_datetime(assignment._raw[field], shift)
+                for field, value in (patch or {}).items():
+                    desired[field] = value(assignment) if callable(value) else value
+
+                changes = bulk.diff(assignment._raw, desired)
+                planned.append(bulk.BulkResult(course_id, assignment.id, "update" if changes else "skip", changes))
+
+        if dry_run:
+            return planned
+
+        def apply(item: bulk.BulkResult) -> Assignment:
+            return self.update_assignment(item.context, item.id, item.changes)
+
+        updates = [item for item in planned if item.action == "update" and item.error is None]
+        done = {}
+        for item, result, error in map_concurrently(apply, updates, max_workers=max_workers):
+            done[(item.context, item.id)] = item._replace(result=result, error=error)
+
+        return [done.get((item.context, item.id), item) for item in planned]
 
 
     """ MISC """
@@ -483,6 +1364,108 @@ class CANVAS_REST(_REST):
     def update_course_nicknames(self):
         raise NotImplementedError
 
+    def loader(self, max_workers: int=8, batch_threshold: int or Dict[str, int]=None) -> RelationLoader:
+        """
+        A scope for batched relation loading, see canvas.utils.loader.
+            with api.loader() as loader:
+                files = loader.load_many(folders, 'files')
+        """
+        return RelationLoader(self, max_workers=max_workers, batch_threshold=batch_threshold)
+
+    def warmup(self, ttl: float=300, prefetch: bool=False) -> UserSnapshot or None:
+        """
+        get_self, get_profile, get_settings, get_colors, get_course_nicknames and get_courses
+        fetched concurrently into one read only UserSnapshot, courses carry 'nickname' and 'color'.
+        The snapshot is cached for ttl seconds and refreshed in the background before it expires,
+        so only the first call waits.
+        prefetch: start loading in the background and return None right away (e.g. at startup)
+        """
+        with self._lock:
+            if self._user_context is None:
+                self._user_context = UserContext(self, ttl=ttl)
+            context = self._user_context
+        context.ttl = ttl
+        if prefetch:
+            context.refresh()
+            return None
+        return context.get()
+
+    # Reports
+    # https://canvas.instructure.com/doc/api/account_reports.html
+    def get_report_types(self, account_id: str or int) -> List[Dict]:
+        return self.get(f"/accounts/{account_id}/reports")
+    def start_report(self, account_id: str or int, report: str, parameters: Dict[str, Any]=None) -> Report:
+        """
+        report: report type, e.g. 'provisioning_csv', 'grade_export_csv', 'last_user_access_csv'
+        parameters: e.g. {'enrollment_term_id': 1, 'users': True, 'courses': True}
+        """
+        return Report(
+            raw=self.post(f"/accounts/{account_id}/reports/{report}", data={"parameters": parameters or {}}),
+            client=self)
+    def get_report(self, account_id: str or int, report: str, report_id: str or int) -> Report:
+        return Report(raw=self.get(f"/accounts/{account_id}/reports/{report}/{report_id}"), client=self)
+    def wait_for_report(self, account_id: str or int, report: str, report_id: str or int,
+                        timeout: float=None, initial_delay: float=1.0, max_delay: float=30.0) -> Report:
+        """
+        Polls the report until it's complete, waiting initial_delay, then twice as long
+        each time, up to max_delay. Raises APIError when it failed, TimeoutError after timeout seconds.
+        """
+        started = time.monotonic()
+        for delay in reports.backoff_delays(initial_delay, max_delay=max_delay):
+            report_ = self.get_report(account_id, report, report_id)
+            status = report_._raw.get('status')
+            if status in reports.FINISHED:
+                return report_
+            if status in reports.FAILED:
+                raise APIError({
+                    'message': f"report {report} {report_id} {status}: {(report_._raw.get('parameters') or {}).get('extra_text') or ''}",
+                    'code': 'report_failed',
+                    'report': report_._raw})
+            if timeout is not None and time.monotonic() - started + delay > timeout:
+                raise TimeoutError(f"report {report} {report_id} still {status} after {timeout}s")
+            time.sleep(delay)
+    def download_report(self, report: Report, file_path: str, chunk_size: int=1 << 16) -> str:
+        """
+        Streams the report's CSV to file_path chunk by chunk, never holding it in memory.
+        Read it back with canvas.utils.reports.iter_rows(file_path) or read_columns(file_path).
+        """
+        url = (report._raw.get('attachment') or {}).get('url') or report._raw.get('file_url')
+        if not url:
+            raise IllegalArgumentError(f"report {report.id} has no file, status is {report._raw.get('status')}")
+
+        directory = path.dirname(file_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # the download redirects to file storage, requests drops the Authorization header when it does
+        with self._send('GET', url, stream=True, allow_redirects=True,
+                        headers={'Authorization': 'Bearer ' + self._access_token}) as resp:
+            resp.raise_for_status()
+            with open(f"{file_path}.tmp", 'wb') as f:
+                for chunk in resp.iter_content(chunk_size=chunk_size):
+                    f.write(chunk)
+        os.replace(f"{file_path}.tmp", file_path)
+        return file_path
+    def run_report(self, account_id: str or int, report: str, file_path: str,
+                   parameters: Dict[str, Any]=None, timeout: float=None) -> str:
+        """ start_report, wait_for_report and download_report in one call, returns file_path """
+        started = self.start_report(account_id, report, parameters)
+        finished = self.wait_for_report(account_id, report, started.id, timeout=timeout)
+        return self.download_report(finished, file_path)
+    def run_reports(self, account_id: str or int, reports_: Dict[str, Dict[str, Any] or None], directory: str,
+                    timeout: float=None, max_workers: int=4) -> Dict[str, str or Exception]:
+        """
+        Runs several reports at the same time, Canvas compiles them in parallel.
+        reports_: {report type: parameters}
+        Returns {report type: path of the CSV in directory, or the exception it failed with}
+        """
+        results = {}
+        for report, file_path, error in map_concurrently(
+                lambda report: self.run_report(
+                    account_id, report, path.join(directory, f"{report}.csv"), reports_[report], timeout=timeout),
+                reports_, max_workers=max_workers):
+            results[report] = error if error is not None else file_path
+        return results
+
     # def CUSTOM_DATA
     # https://canvas.instructure.com/doc/api/users.html
     # PUT /api/v1/users/:user_id/custom_data(/*scope)
@@ -492,26 +1475,28 @@ class CANVAS_REST(_REST):
     def get_folders(self,
         folder_root: str = None,
         root_id: str = None,
-        folder_id: str or int=None) -> List[Folder]:
+        folder_id: str or int=None,
+        stream: bool=False) -> List[Folder]:
         """
         :Parameters
             folder_root: [ users, courses, groups, folders ] = "folders"
             root_id:     [ self, :id ] = None
             folder_id:   [ :id ] = None
+            stream:      generator over every page instead of a list of the first page
         """
         folder_id = folder_id or ''
         if folder_id:
             return self.list_entities_from_endpoint(
                 path=f"{f'/{folder_root}' if folder_root else ''}{f'/{root_id}' if root_id else ''}/files/folder/{folder_id}",
-                entity=Folder)
+                entity=Folder, stream=stream)
         return self.list_entities_from_endpoint(
             path=f"{f'/{folder_root}' if folder_root else ''}{f'/{root_id}' if root_id else ''}/folders/{folder_id}{f'/folders' if not root_id and not folder_root else ''}",
-            entity=Folder)
+            entity=Folder, stream=stream)
 
-    def get_course_folders(self, course_id: str, folder_id: str or int=None) -> List[Folder]:
-        return self.get_folders(folder_root="courses", root_id=course_id, folder_id=folder_id)
-    def get_users_folders(self, folder_id: str or int=None) -> List[Folder]:
-        return self.get_folders(folder_root="users",   root_id="self",    folder_id=folder_id)
+    def get_course_folders(self, course_id: str, folder_id: str or int=None, stream: bool=False) -> List[Folder]:
+        return self.get_folders(folder_root="courses", root_id=course_id, folder_id=folder_id, stream=stream)
+    def get_users_folders(self, folder_id: str or int=None, stream: bool=False) -> List[Folder]:
+        return self.get_folders(folder_root="users",   root_id="self",    folder_id=folder_id, stream=stream)
 
     # basic ones use /folders/:id 
     def create_folder(self):
@@ -537,23 +1522,99 @@ class CANVAS_REST(_REST):
         raise NotImplementedError
         
 
-    def get_files(self, folder_id: str=None, file_id: str=None):
+    def get_files(self, folder_id: str=None, file_id: str=None, include: List[str]=None, fields: List[str]=None, stream: bool=False) -> List[File]:
+        """
+        include: [ user, usage_rights ]
+        fields: keys to keep from each file, e.g. ['filename', 'url', 'size']
+        stream: generator over every page instead of a list of the first page
+        """
         path = f"/folders"
         if folder_id:
             path += f"/{folder_id}"
         if file_id:
             path += f"/{file_id}"
         path += "/files"
-        return self.list_entities_from_endpoint(path, entity=File)
+        return self.list_entities_from_endpoint(path, entity=File, include=include, fields=fields, stream=stream)
 
     def get_my_folders(self) -> List[Folder]:
         return self.get(path="/users/self/folders")
-    def get_my_files_by_path(self, path: str=None) -> List[Folder]:
-        return self.get(path=f"/users/self/folders/by_path{path if path else ''}")
+    def get_my_files_by_path(self, path: str=None, use_cache: bool=True) -> List[Folder]:
+        """
+        Every folder from the root down to path
+        use_cache: served from folder_index() while its entries are younger than folder_max_age,
+            False always asks Canvas. invalidate_folders() drops what's cached.
+        """
+        return self._folders_by_path("/users/self", path, use_cache)
     # def get_course_folders(self, course_id: str) -> List[Folder]:
     #     return self.get(path=f"/courses/{course_id}/folders",)
-    def get_course_files_by_path(self, course_id: str, path: str=None) -> List[Folder]:
-        return self.get(path=f"/courses/{course_id}/folders/by_path{path if path else ''}")
+    def get_course_files_by_path(self, course_id: str, path: str=None, use_cache: bool=True) -> List[Folder]:
+        """
+        Every folder from the root down to path
+        use_cache: served from folder_index(course_id) while its entries are younger than
+            folder_max_age, False always asks Canvas. invalidate_folders(course_id) drops what's cached.
+        """
+        return self._folders_by_path(f"/courses/{course_id}", path, use_cache)
+    def _folders_by_path(self, context: str, path: str=None, use_cache: bool=True) -> List[Dict]:
+        index = self._folder_index(context)
+        cached = index.chain(path) if use_cache else None
+        if cached is not None:
+            return cached
+
+        folders = self.get(path=f"{context}/folders/by_path{path if path else ''}")
+        index.ingest(folders or [])
+        return folders
+
+    def _folder_index(self, context: str) -> FolderIndex:
+        with self._lock:
+            index = self._folder_indexes.get(context)
+            if index is None:
+                index = self._folder_indexes[context] = FolderIndex(max_age=self._folder_max_age)
+            return index
+    def folder_index(self, course_id: str or int=None, walk: bool=False) -> FolderIndex:
+        """
+        The cached folder tree of a course, or of the user's files when course_id is None.
+        walk: load the whole tree now with one paginated listing of the context's folders,
+            after that paths resolve and children list without requests.
+        """
+        context = f"/courses/{course_id}" if course_id is not None else "/users/self"
+        index = self._folder_index(context)
+        if walk:
+            index.load(folder
+                       for page in self.iter_pages(path=f"{context}/folders", data={"per_page": 100})
+                       for folder in page)
+        return index
+    def invalidate_folders(self, course_id: str or int=None, path: str=None):
+        """
+        Drops cached folders, e.g. after folders were changed outside this client.
+        course_id: the course's tree, None for the user's files
+        path: only the folder at path and everything under it, None for the whole tree
+        """
+        context = f"/courses/{course_id}" if course_id is not None else "/users/self"
+        index = self._folder_index(context)
+        if path is None:
+            index.invalidate()
+        else:
+            index.invalidate_path(path)
+    def resolve_folder(self, path: str, course_id: str or int=None) -> Folder:
+        """ path relative to the root folder, e.g. 'Assignments' for 'course files/Assignments' """
+        context = f"/courses/{course_id}" if course_id is not None else "/users/self"
+        raw = self._folder_index(context).resolve(path)
+        if raw is None:
+            raw = self._folders_by_path(context, f"/{path.strip('/')}" if path.strip('/') else None)[-1]
+        return Folder(raw=raw, client=self)
+    def get_subfolders(self, path: str, course_id: str or int=None) -> List[Folder]:
+        """ Sub-folders of the folder at path, listed from the folder index when it has them """
+        context = f"/courses/{course_id}" if course_id is not None else "/users/self"
+        index = self._folder_index(context)
+        parent = self.resolve_folder(path, course_id=course_id)
+
+        children = index.children(parent.id)
+        if children is None:
+            children = [folder
+                        for page in self.iter_pages(path=f"/folders/{parent.id}/folders", data={"per_page": 100})
+                        for folder in page]
+            index.set_children(parent.id, children)
+        return [Folder(raw=raw, client=self) for raw in children]
 
     def upload_file(self):
         raise NotImplementedError
@@ -0,0 +1,261 @@
+""" Polling Scheduler """
+# Polls planner items / todos / notifications for many users without the
+# thundering herd of a cron loop: first polls are spread over the interval,
+# every reschedule gets jitter, users with something due soon are polled more
+# often and first, users whose results don't change back off.
+import datetime
+import hashlib
+import heapq
+import itertools
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, List, NamedTuple
+
+from canvas.utils import canvas_datetime
+from canvas.utils.ratelimit import TokenBucket
+
+
+SOURCES: Dict[str, Callable] = {
+    "planner_items": lambda client: client.get_planner_items(),
+    "todos": lambda client: client.get_todos(),
+    "notifications": lambda client: list(client.get_notifications()),
+}
+
+
+class PollResult(NamedTuple):
+    key: Hashable
+    source: str
+    items: List or None
+    error: Exception or None
+    changed: bool
+    polled_at: float
+
+
+class _Job:
+    def __init__(self, key, client, sources, priority, interval):
+        self.key = key
+        self.client = client
+        self.sources = sources
+        self.priority = priority
+        self.interval = interval
+        self.fingerprints: Dict[str, str] = {}
+        self.urgent = False
+        self.running = False
+        self.removed = False
+
+
+def fingerprint(items) -> str:
+    raws = [getattr(item, '_raw', item) for item in items or []]
+    return hashlib.sha1(json.dumps(raws, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def next_due(items) -> datetime.datetime or None:
+    """ Earliest due date among planner items and todos """
+    dues = []
+    for item in items or []:
+        raw = getattr(item, '_raw', item)
+        value = raw.get('plannable_date') or (raw.get('assignment') or {}).get('due_at')
+        if isinstance(value, str):
+            try:
+                dues.append(canvas_datetime(value))
+            except ValueError:
+                pass
+    return min(dues) if dues else None
+
+
+class PollScheduler:
+    """
+    :Parameters
+        interval: seconds between polls of a user when nothing special is going on
+        callback: called with each PollResult, from a worker thread. Exceptions it raises
+            don't stop the poll, they're counted in callback_errors (the last one in last_callback_error)
+        queue: alternatively, PollResults are put on this queue (queue.Queue, multiprocessing.Queue...)
+        jitter: +/- fraction of the interval added to every reschedule
+        max_workers: polls running at the same time
+        budget: TokenBucket shared with the rest of the process, every source costs one token
+        urgent_within: users with something due within this are urgent
+        urgent_factor: interval multiplier for urgent users
+        idle_factor: interval multiplier every time nothing changed
+        max_interval: idle users don't back off further than this (default 8 * interval)
+        emit_unchanged: also emit results that didn't change
+
+    :Usage
+        scheduler = PollScheduler(interval=300, callback=handle, budget=TokenBucket(rate=10, capacity=50))
+        for token in tokens:
+            scheduler.add(token, CANVAS_REST(access_token=token))
+        scheduler.start()
+    """
+
+    def __init__(self,
+        interval: float=300,
+        callback: Callable[[PollResult], Any]=None,
+        queue=None,
+        jitter: float=0.2,
+        max_workers: int=8,
+        budget: TokenBucket=None,
+        urgent_within: datetime.timedelta=datetime.timedelta(hours=24),
+        urgent_factor: float=0.25,
+        idle_factor: float=2.0,
+        max_interval: float=None,
+        emit_unchanged: bool=False):
+
+        if callback is None and queue is None:
+            raise ValueError("callback or queue is required")
+
+        self.interval = interval
+        self.callback = callback
+        self.queue = queue
+        self.jitter = jitter
+        self.max_workers = max_workers
+        self.budget = budget
+        self.urgent_within = urgent_within
+        self.urgent_factor = urgent_factor
+        self.idle_factor = idle_factor
+        self.max_interval = max_interval or interval * 8
+        self.emit_unchanged = emit_unchanged
+
+        self._jobs: Dict[Hashable, _Job] = {}
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._slots = threading.Semaphore(max_workers)
+        self._pool: ThreadPoolExecutor = None
+        self._thread: threading.Thread = None
+        self._stopped = threading.Event()
+        self._errors_lock = threading.Lock()
+        self.callback_errors = 0
+        self.last_callback_error: Exception = None
+
+    def add(self, key: Hashable, client, sources: List[str]=None, priority: int=0):
+        """ Adds a user, the first poll lands at a random point of the first interval """
+        sources = list(sources or SOURCES)
+        for source in sources:
+            if source not in SOURCES:
+                raise ValueError(f"unknown source '{source}', expected one of {list(SOURCES)}")
+
+        with self._cond:
+            if key in self._jobs:
+                self._jobs[key].removed = True
+            job = self._jobs[key] = _Job(key, client, sources, priority, self.interval)
+            self._push(job, time.monotonic() + random.uniform(0, self.interval))
+            self._cond.notify()
+
+    def remove(self, key: Hashable):
+        with self._cond:
+            job = self._jobs.pop(key, None)
+            if job is not None:
+                job.removed = True
+
+    def _push(self, job: _Job, at: float):
+        heapq.heappush(self._heap, (at, next(self._seq), job))
+
+    def _reschedule(self, job: _Job, changed: bool, due: datetime.datetime or None):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        job.urgent = due is not None and now <= due <= now + self.urgent_within
+
+        if job.urgent:
+            job.interval = self.interval * self.urgent_factor
+        elif changed:
+            job.interval = self.interval
+        else:
+            job.interval = min(self.max_interval, job.interval * self.idle_factor)
+
+        delay = job.interval * (1 + random.uniform(-self.jitter, self.jitter))
+        with self._cond:
+            job.running = False
+            if not job.removed:
+                self._push(job, time.monotonic() + delay)
+                self._cond.notify()
+
+    def _emit(self, result: PollResult):
+        # a failing callback mustn't cost the job its remaining sources
+        try:
+            if self.callback is not None:
+                self.callback(result)
+            if self.queue is not None:
+                self.queue.put(result)
+        except Exception as e:
+            with self._errors_lock:
+                self.callback_errors += 1
+                self.last_callback_error = e
+
+    def _poll(self, job: _Job):
+        changed, dues = False, []
+        try:
+            for source in job.sources:
+                if self.budget is not None:
+                    self.budget.acquire(1)
+
+                items, error = None, None
+                try:
+                    items = SOURCES[source](job.client)
+                except Exception as e:
+                    error = e
+
+                source_changed = False
+                if error is None:
+                    current = fingerprint(items)
+                    source_changed = job.fingerprints.get(source) != current
+                    job.fingerprints[source] = current
+                    dues.append(next_due(items) if source != "notifications" else None)
+                changed = changed or source_changed
+
+                if error is not None or source_changed or self.emit_unchanged:
+                    self._emit(PollResult(job.key, source, items, error, source_changed, time.time()))
+        finally:
+            dues = [due for due in dues if due is not None]
+            self._reschedule(job, changed, min(dues) if dues else None)
+            self._slots.release()
+
+    def _due_jobs(self) -> List[_Job]:
+        """ Pops every job that is due, urgent and higher priority ones first """
+        now = time.monotonic()
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            _, _, job = heapq.heappop(self._heap)
+            if not job.removed and not job.running:
+                due.append(job)
+        due.sort(key=lambda job: (not job.urgent, -job.priority))
+        return due
+
+    def run_forever(self):
+        """ Blocks until stop() is called """
+        self._stopped.clear()
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            while not self._stopped.is_set():
+                with self._cond:
+                    jobs = self._due_jobs()
+                    if not jobs:
+                        timeout = self._heap[0][0] - time.monotonic() if self._heap else None
+                        self._cond.wait(timeout)
+                        continue
+
+                for idx, job in enumerate(jobs):
+                    # wait for a free worker, so a backlog keeps its urgent-first order
+                    while not self._slots.acquire(timeout=0.5):
+                        if self._stopped.is_set():
+                            with self._cond:
+                                for waiting in jobs[idx:]:
+                                    self._push(waiting, time.monotonic())
+                            return
+                    job.running = True
+                    self._pool.submit(self._poll, job)
+        finally:
+            self._pool.shutdown(wait=True)
+
+    def start(self) -> threading.Thread:
+        """ Runs the scheduler on a daemon thread """
+        self._thread = threading.Thread(target=self.run_forever, name="canvas-poll-scheduler", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self, wait: bool=True):
+        self._stopped.set()
+        with self._cond:
+            self._cond.notify_all()
+        if wait and self._thread is not None:
+            self._thread.join()
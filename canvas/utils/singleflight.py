@@ -0,0 +1,136 @@
+""" Request coalescing """
+# Identical calls that are in flight at the same time share one execution,
+# every caller gets the same result (or the same exception). Results are
+# copied for each caller that shared them, so one caller changing what it
+# got doesn't change another's. A waiting caller can bound its wait by its
+# own deadline.
+import asyncio
+import copy
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+from canvas.utils.timeouts import DeadlineExceeded
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    copy: makes each caller's own copy of a shared result, None hands every caller the same object.
+        The first caller gets the result itself when nobody shared it.
+    """
+
+    def __init__(self, copy: Callable[[Any], Any]=copy.deepcopy):
+        self.copy = copy
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._async_calls: Dict[Hashable, asyncio.Future] = {}
+        self._async_waiters: Dict[Hashable, int] = {}
+        self.calls = 0
+        self.async_calls = 0
+        self.coalesced = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any], timeout: float=None, retry_on: Tuple[type, ...]=()) -> Any:
+        """
+        Runs fn() unless a call with the same key is already running, in that case waits for its result
+        :Parameters
+            timeout: seconds a waiting caller gives the running call before raising DeadlineExceeded,
+                None waits as long as it takes. Only bounds the wait, fn() has its own deadline.
+            retry_on: exception types of the running call a waiting caller doesn't inherit, it runs
+                the call again instead (e.g. the leader's own DeadlineExceeded, which says nothing
+                about a caller with more time left)
+        """
+        expires = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = self._calls[key] = _Call()
+                    self.calls += 1
+                else:
+                    call.waiters += 1
+                    self.coalesced += 1
+
+            if leader:
+                break
+            remaining = None if expires is None else max(0.0, expires - time.monotonic())
+            if not call.event.wait(remaining):
+                raise DeadlineExceeded(f"waited {timeout}s for the identical request in flight")
+            if call.error is None:
+                return self._copy(call.result)
+            if not isinstance(call.error, retry_on):
+                raise call.error
+            with self._lock:
+                # it runs the call itself after all, that's counted in calls
+                self.coalesced -= 1
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+                shared = call.waiters > 0
+            call.event.set()
+        # call.result stays as it was for the waiters to copy
+        return self._copy(call.result) if shared else call.result
+
+    def _copy(self, result: Any) -> Any:
+        return result if self.copy is None else self.copy(result)
+
+    async def do_async(self, key: Hashable, fn: Callable[[], Awaitable]) -> Any:
+        """
+        Same as do, for coroutines running on one event loop.
+        Leaders are counted in async_calls, not calls, since fn usually ends up in do().
+        """
+        loop = asyncio.get_running_loop()
+        loop_key = (id(loop), key)
+
+        with self._lock:
+            future = self._async_calls.get(loop_key)
+            leader = future is None
+            if leader:
+                future = self._async_calls[loop_key] = loop.create_future()
+                self.async_calls += 1
+            else:
+                self._async_waiters[loop_key] = self._async_waiters.get(loop_key, 0) + 1
+                self.coalesced += 1
+
+        if not leader:
+            # shield so one cancelled waiter doesn't cancel the shared call
+            return self._copy(await asyncio.shield(future))
+
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # mark retrieved, waiters (if any) get it re-raised
+            future.exception()
+            raise
+        else:
+            # nothing else runs on the loop until this returns, no waiter can join after this
+            with self._lock:
+                shared = self._async_waiters.get(loop_key, 0) > 0
+            future.set_result(result)
+            return self._copy(result) if shared else result
+        finally:
+            with self._lock:
+                self._async_calls.pop(loop_key, None)
+                self._async_waiters.pop(loop_key, None)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"calls": self.calls, "coalesced": self.coalesced, "in_flight": len(self._calls) + len(self._async_calls)}
@@ -0,0 +1,174 @@
+""" Content Addressed Download Store """
+# Downloads are kept once under blobs/<sha256[:2]>/<sha256> and hardlinked
+# into the folder layouts, an index maps the canvas file uuid to the blob so
+# a file that is already present doesn't touch the network at all.
+import hashlib
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Dict, Iterable
+
+
+class BlobStore:
+    """
+    :Parameters
+        root: directory for the blobs and the index, can be shared by processes
+        max_bytes: blobs are evicted least recently used first above this size, None for no limit
+
+    Blobs (and the hardlinks made from them) are read only, since a hardlink
+    shares its content with the blob, editing a linked copy would change it
+    for every course. Evicting a blob doesn't break existing links.
+
+    Eviction skips pinned blobs (lookup(..., pin=True) / add(..., pin=True) until unpin)
+    so a blob can't disappear between finding or storing it and linking it.
+    Pins are per process, another process evicting from a shared root can
+    still remove a blob, link raises FileNotFoundError then.
+    """
+
+    def __init__(self, root: str, max_bytes: int=None):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.join(root, "blobs"), exist_ok=True)
+        os.makedirs(os.path.join(root, "tmp"), exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(root, "index.sqlite3"), check_same_thread=False, timeout=30)
+        with self._lock, self._db:
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS blobs (
+                    sha256 TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    last_access REAL NOT NULL)""")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS files (
+                    uuid TEXT PRIMARY KEY,
+                    sha256 TEXT NOT NULL)""")
+            self._db.execute("CREATE INDEX IF NOT EXISTS files_sha256 ON files (sha256)")
+        self._pins: Dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def blob_path(self, sha256: str) -> str:
+        return os.path.join(self.root, "blobs", sha256[:2], sha256)
+
+    def _pin(self, sha256: str):
+        self._pins[sha256] = self._pins.get(sha256, 0) + 1
+
+    def unpin(self, sha256: str):
+        with self._lock:
+            count = self._pins.pop(sha256, 0) - 1
+            if count > 0:
+                self._pins[sha256] = count
+        # what was held back by the pin can go now
+        self.evict()
+
+    def lookup(self, uuid: str, pin: bool=False) -> str or None:
+        """
+        sha256 of the content stored for the canvas file uuid, None when it isn't present
+        pin: keep the blob from being evicted until unpin(sha256)
+        """
+        if not uuid:
+            return None
+        with self._lock:
+            row = self._db.execute("SELECT sha256 FROM files WHERE uuid = ?", (uuid,)).fetchone()
+            if row is None or not os.path.exists(self.blob_path(row[0])):
+                self.misses += 1
+                return None
+            self.hits += 1
+            if pin:
+                self._pin(row[0])
+            with self._db:
+                self._db.execute("UPDATE blobs SET last_access = ? WHERE sha256 = ?", (time.time(), row[0]))
+            return row[0]
+
+    def add(self, chunks: Iterable[bytes], uuid: str=None, pin: bool=False) -> str:
+        """
+        Stores the content (deduplicated by hash), returns its sha256.
+        The blob just added is never evicted by this call, even when it's bigger than max_bytes.
+        pin: keep it from being evicted until unpin(sha256)
+        """
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.join(self.root, "tmp"))
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                for chunk in chunks:
+                    if chunk:
+                        digest.update(chunk)
+                        size += len(chunk)
+                        tmp.write(chunk)
+
+            sha256 = digest.hexdigest()
+            path = self.blob_path(sha256)
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.chmod(tmp_path, 0o444)
+                os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO blobs (sha256, size, last_access) VALUES (?, ?, ?)",
+                (sha256, size, time.time()))
+            if uuid:
+                self._db.execute("INSERT OR REPLACE INTO files (uuid, sha256) VALUES (?, ?)", (uuid, sha256))
+            if pin:
+                self._pin(sha256)
+
+        self.evict(keep=sha256)
+        return sha256
+
+    def link(self, sha256: str, destination: str):
+        """ Hardlinks the blob to destination (replacing it), copies when hardlinks aren't possible (other device) """
+        source = self.blob_path(sha256)
+        directory = os.path.dirname(destination) or "."
+        os.makedirs(directory, exist_ok=True)
+
+        tmp_path = os.path.join(directory, f".{os.path.basename(destination)}.{os.getpid()}.{threading.get_ident()}")
+        try:
+            os.link(source, tmp_path)
+        except OSError:
+            shutil.copyfile(source, tmp_path)
+        os.replace(tmp_path, destination)
+
+    def evict(self, keep: str=None):
+        """ Removes least recently used blobs, except pinned ones and keep, until the store fits in max_bytes """
+        if self.max_bytes is None:
+            return
+
+        with self._lock:
+            total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+
+            rows = self._db.execute("SELECT sha256, size FROM blobs ORDER BY last_access").fetchall()
+            with self._db:
+                for sha256, size in rows:
+                    if total <= self.max_bytes:
+                        break
+                    if sha256 == keep or sha256 in self._pins:
+                        continue
+                    try:
+                        # windows won't remove read only files
+                        os.chmod(self.blob_path(sha256), 0o644)
+                        os.remove(self.blob_path(sha256))
+                    except FileNotFoundError:
+                        pass
+                    self._db.execute("DELETE FROM blobs WHERE sha256 = ?", (sha256,))
+                    self._db.execute("DELETE FROM files WHERE sha256 = ?", (sha256,))
+                    total -= size
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            blobs, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM blobs").fetchone()
+            files = self._db.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+        return {"blobs": blobs, "bytes": size, "files": files, "hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
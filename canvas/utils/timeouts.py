@@ -0,0 +1,84 @@
+""" Timeouts, Deadlines and Hedging """
+# A Budget is the time left for one logical call, shared by its retries and
+# every page it follows, so "get me all the planner items within 5s" means 5s
+# in total, not 5s per request. LatencyTracker keeps recent GET latencies
+# for hedging: a GET slower than the chosen percentile gets a second request
+# and whichever answers first wins.
+import collections
+import threading
+import time
+from typing import Dict
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+class Budget:
+    """ seconds: time allowed from now, None for no limit """
+
+    def __init__(self, seconds: float=None):
+        self.seconds = seconds
+        self.expires = None if seconds is None else time.monotonic() + seconds
+
+    def remaining(self) -> float or None:
+        if self.expires is None:
+            return None
+        return max(0.0, self.expires - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.expires is not None and time.monotonic() >= self.expires
+
+    def check(self, what: str='request'):
+        if self.expired:
+            raise DeadlineExceeded(f"{what}: deadline of {self.seconds}s exceeded")
+
+    def timeout(self, timeout: float or None) -> float or None:
+        """ The per request timeout, cut down to what's left of the budget """
+        remaining = self.remaining()
+        if remaining is None:
+            return timeout
+        return remaining if timeout is None else min(timeout, remaining)
+
+
+class LatencyTracker:
+    """
+    The last `size` latencies, percentile() is None until min_samples were seen
+    so hedging doesn't start from a guess.
+    """
+
+    def __init__(self, size: int=500, min_samples: int=20):
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self._recent = collections.deque(maxlen=size)
+
+    def add(self, seconds: float):
+        with self._lock:
+            self._recent.append(seconds)
+
+    def percentile(self, q: float) -> float or None:
+        with self._lock:
+            if len(self._recent) < self.min_samples:
+                return None
+            ordered = sorted(self._recent)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class HedgeStats:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def add(self, hedged: bool=False, hedge_won: bool=False):
+        with self._lock:
+            self.requests += 1
+            self.hedged += hedged
+            self.hedge_wins += hedge_won
+
+    def as_dict(self) -> Dict[str, int]:
+        with self._lock:
+            return {"requests": self.requests, "hedged": self.hedged, "hedge_wins": self.hedge_wins}
@@ -0,0 +1,189 @@
+""" Transports """
+# Pass as CANVAS_REST(transport=...). Both negotiate compression and count
+# bytes on the wire against decoded bytes:
+#   SessionTransport: requests, one Session per thread, tuned connection pool
+#   HTTP2Transport:   httpx (pip install -r requirements-http2.txt), one shared client that
+#                     multiplexes concurrent requests over one connection per host
+# python -m canvas.bench_transport compares them against the default Session.
+import io
+import threading
+from typing import Dict
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+
+def accept_encoding() -> str:
+    """ br is only offered when a brotli decoder is installed """
+    encodings = ["gzip", "deflate"]
+    try:
+        import brotli  # noqa: F401
+        encodings.append("br")
+    except ImportError:
+        try:
+            import brotlicffi  # noqa: F401
+            encodings.append("br")
+        except ImportError:
+            pass
+    return ", ".join(encodings)
+
+
+class TransportStats:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.wire_bytes = 0
+        self.decoded_bytes = 0
+
+    def add(self, wire_bytes: int, decoded_bytes: int):
+        with self._lock:
+            self.requests += 1
+            self.wire_bytes += wire_bytes
+            self.decoded_bytes += decoded_bytes
+
+    def as_dict(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "wire_bytes": self.wire_bytes,
+                "decoded_bytes": self.decoded_bytes,
+                "ratio": round(self.wire_bytes / self.decoded_bytes, 4) if self.decoded_bytes else None,
+            }
+
+
+class SessionTransport:
+    """
+    :Parameters
+        compress: send Accept-Encoding (gzip, deflate and br when available), False asks for identity
+        pool_maxsize: connections kept per host by each thread's Session
+
+    Bytes are counted for responses whose body is read by the time request returns,
+    stream=True responses (feeds, downloads) aren't counted.
+    """
+
+    def __init__(self, compress: bool=True, pool_maxsize: int=10):
+        self.compress = compress
+        self.pool_maxsize = pool_maxsize
+        self.stats = TransportStats()
+        self._local = threading.local()
+
+    @property
+    def session(self) -> requests.Session:
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=self.pool_maxsize, pool_maxsize=self.pool_maxsize)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers["Accept-Encoding"] = accept_encoding() if self.compress else "identity"
+            self._local.session = session
+        return session
+
+    def request(self, method: str, url: str, *args, **kwargs) -> requests.Response:
+        resp = self.session.request(method, url, *args, **kwargs)
+        if not kwargs.get('stream'):
+            decoded = len(resp.content or b'')
+            # urllib3 counts the (still compressed) bytes it read off the socket
+            wire = resp.raw.tell() if hasattr(resp.raw, 'tell') else decoded
+            self.stats.add(wire, decoded)
+        return resp
+
+
+class StreamedBody:
+    """
+    requests.Response.raw over a streamed httpx response, read() hands out the
+    decoded body as it arrives. The bytes are counted when it's closed, which
+    happens once it's read to the end or when the Response is closed.
+    """
+
+    def __init__(self, resp, stats: TransportStats):
+        self._resp = resp
+        self._stats = stats
+        self._chunks = resp.iter_bytes()
+        self._buffer = bytearray()
+        self._decoded = 0
+        self._closed = False
+
+    def read(self, size: int=-1, **kwargs) -> bytes:
+        while not self._closed and (size is None or size < 0 or len(self._buffer) < size):
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        if size is None or size < 0:
+            size = len(self._buffer)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        self._decoded += len(data)
+        if not data:
+            self.close()
+        return data
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._resp.close()
+        self._stats.add(self._resp.num_bytes_downloaded, self._decoded)
+
+
+class HTTP2Transport:
+    """
+    :Parameters
+        http2: negotiate HTTP/2 (ALPN, https only), concurrent requests from any
+            thread share one connection per host
+        http1: False to speak HTTP/2 without negotiating it (prior knowledge),
+            which also works over plain http, e.g. to an h2c proxy
+        max_connections: upper bound of connections in the pool
+    Responses are returned as requests.Response objects, so the rest of the client
+    doesn't know the difference. stream=True responses are read from the connection
+    as they're consumed (iter_content / iter_lines), not buffered.
+    """
+
+    def __init__(self, http2: bool=True, max_connections: int=10, http1: bool=True):
+        try:
+            import httpx
+        except ImportError as e:
+            raise ImportError("HTTP2Transport needs httpx, pip install -r requirements-http2.txt") from e
+
+        self._httpx = httpx
+        self.stats = TransportStats()
+        self._client = httpx.Client(
+            http1=http1,
+            http2=http2,
+            headers={"Accept-Encoding": accept_encoding()},
+            limits=httpx.Limits(max_connections=max_connections))
+
+    def request(self, method: str, url: str, params=None, data=None, json=None, headers=None,
+                allow_redirects: bool=True, timeout=None, stream: bool=False, **kwargs) -> requests.Response:
+        request = self._client.build_request(
+            method, url,
+            params=params, data=data, json=json, headers=headers,
+            timeout=timeout if timeout is not None else self._httpx.USE_CLIENT_DEFAULT)
+        resp = self._client.send(request, stream=stream, follow_redirects=allow_redirects)
+
+        converted = self._to_requests(resp, method)
+        if stream:
+            converted.raw = StreamedBody(resp, self.stats)
+        else:
+            self.stats.add(resp.num_bytes_downloaded, len(resp.content))
+            converted._content = resp.content
+            converted._content_consumed = True
+            converted.raw = io.BytesIO(resp.content)
+        return converted
+
+    def _to_requests(self, resp, method: str) -> requests.Response:
+        converted = requests.Response()
+        converted.status_code = resp.status_code
+        converted.reason = resp.reason_phrase
+        converted.headers = CaseInsensitiveDict(resp.headers.items())
+        converted.url = str(resp.url)
+        converted.encoding = resp.encoding
+        converted.request = requests.Request(method, str(resp.url)).prepare()
+        converted.http_version = resp.http_version
+        return converted
+
+    def close(self):
+        self._client.close()
@@ -0,0 +1,142 @@
+""" User Context Warmup """
+# Everything a first render needs about the user (self, profile, settings,
+# colors, nicknames, courses) fetched concurrently into one read only
+# snapshot. UserContext caches it for ttl seconds and refreshes it in the
+# background once it's getting old, so reads after the first don't wait.
+#
+#   snapshot = api.warmup()
+#   for course in snapshot.courses:
+#       print(course.nickname or course.name, course.color)
+import threading
+import time
+from types import MappingProxyType
+from typing import Callable, Dict, Mapping, NamedTuple, Tuple
+
+from canvas.utils import map_concurrently
+from canvas.utils.models import Course, Profile, User
+
+
+class UserSnapshot(NamedTuple):
+    user: User
+    profile: Profile
+    settings: Mapping
+    colors: Mapping[str, str]           # context code -> hex color, e.g. {'course_123': '#ff0000'}
+    nicknames: Mapping[int, str]        # course id -> nickname
+    courses: Tuple[Course, ...]         # with 'nickname' and 'color' added
+    fetched_at: float
+
+    def course(self, course_id: int) -> Course or None:
+        for course in self.courses:
+            if course.id == course_id:
+                return course
+        return None
+
+
+SOURCES: Dict[str, Callable] = {
+    "user": lambda client: client.get_self(),
+    "profile": lambda client: client.get_profile(),
+    "settings": lambda client: client.get_settings(),
+    "colors": lambda client: client.get_colors(),
+    "nicknames": lambda client: client.get_course_nicknames(),
+    "courses": lambda client: list(client.get_courses(stream=True)),
+}
+
+
+def fetch_snapshot(client) -> UserSnapshot:
+    """ All the SOURCES at once, raises the first error """
+    results = {}
+    for name, result, error in map_concurrently(lambda name: SOURCES[name](client), SOURCES, max_workers=len(SOURCES)):
+        if error is not None:
+            raise error
+        results[name] = result
+
+    colors = dict((results["colors"] or {}).get('custom_colors') or {})
+    nicknames = {item['course_id']: item['nickname'] for item in results["nicknames"] or []}
+    courses = tuple(
+        Course(raw={
+            **course._raw,
+            'nickname': nicknames.get(course.id),
+            'color': colors.get(f"course_{course.id}"),
+        }, client=client)
+        for course in results["courses"])
+
+    return UserSnapshot(
+        user=results["user"],
+        profile=results["profile"],
+        settings=MappingProxyType(dict(results["settings"] or {})),
+        colors=MappingProxyType(colors),
+        nicknames=MappingProxyType(nicknames),
+        courses=courses,
+        fetched_at=time.time())
+
+
+class UserContext:
+    """
+    :Parameters
+        ttl: seconds a snapshot is served for. Past refresh_after * ttl the snapshot
+            is still returned, and a new one is fetched in the background.
+            Past ttl, get() waits for a new one.
+    """
+
+    def __init__(self, client, ttl: float=300, refresh_after: float=0.8):
+        self.client = client
+        self.ttl = ttl
+        self.refresh_after = refresh_after
+
+        self._lock = threading.Lock()
+        self._snapshot: UserSnapshot = None
+        self._fetched = 0.0
+        self._refreshing: threading.Thread = None
+        self.last_error: Exception = None
+        self.refreshes = 0
+
+    def _fetch(self) -> UserSnapshot:
+        snapshot = fetch_snapshot(self.client)
+        with self._lock:
+            self._snapshot, self._fetched = snapshot, time.monotonic()
+            self.refreshes += 1
+            self.last_error = None
+        return snapshot
+
+    def _background_fetch(self):
+        try:
+            self._fetch()
+        except Exception as e:
+            # the previous snapshot keeps being served until it expires
+            with self._lock:
+                self.last_error = e
+        finally:
+            with self._lock:
+                self._refreshing = None
+
+    def refresh(self, wait: bool=False) -> threading.Thread or None:
+        """ Starts a background refresh unless one is already running """
+        with self._lock:
+            thread = self._refreshing
+            if thread is None:
+                thread = self._refreshing = threading.Thread(
+                    target=self._background_fetch, name="canvas-warmup", daemon=True)
+                thread.start()
+        if wait:
+            thread.join()
+        return thread
+
+    def get(self) -> UserSnapshot:
+        with self._lock:
+            snapshot, age = self._snapshot, time.monotonic() - self._fetched
+
+        if snapshot is not None and age < self.ttl:
+            if age >= self.ttl * self.refresh_after:
+                self.refresh()
+            return snapshot
+
+        # nothing usable yet, wait for the refresh (shared with any other caller)
+        self.refresh(wait=True)
+        with self._lock:
+            if self._snapshot is None or time.monotonic() - self._fetched >= self.ttl:
+                raise self.last_error or RuntimeError("warmup didn't produce a snapshot")
+            return self._snapshot
+
+    def invalidate(self):
+        with self._lock:
+            self._snapshot = None